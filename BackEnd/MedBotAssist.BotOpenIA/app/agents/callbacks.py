@@ -0,0 +1,118 @@
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from app.core.metrics import LLM_CALL_LATENCY, LLM_TOKENS, TOOL_LATENCY
+from app.core.tracing import Span, tracer
+import time
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Records LLM call latency, token usage and tool latency for the agent run it is
+    passed to. Calls the run abandons (client disconnect, timeout) never reach an
+    end callback, so `close` drops their start times when the run finishes.
+    """
+
+    # Cheap bookkeeping; no need to hop to a thread from the async agent
+    run_inline = True
+
+    def __init__(self):
+        self._llm_starts: Dict[UUID, float] = {}
+        self._tool_starts: Dict[UUID, Tuple[str, float]] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any):
+        self._llm_starts[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any):
+        self._llm_starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        llm_output = response.llm_output or {}
+        model = llm_output.get("model_name") or "unknown"
+
+        start = self._llm_starts.pop(run_id, None)
+        if start is not None:
+            LLM_CALL_LATENCY.labels(model).observe(time.perf_counter() - start)
+
+        input_tokens, output_tokens = self._token_usage(response)
+        LLM_TOKENS.labels(model, "input").inc(input_tokens)
+        LLM_TOKENS.labels(model, "output").inc(output_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._llm_starts.pop(run_id, None)
+
+    @staticmethod
+    def _token_usage(response: LLMResult) -> Tuple[int, int]:
+        usage = (response.llm_output or {}).get("token_usage")
+        if usage:
+            return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+        # Streamed calls report usage on the message instead
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                input_tokens += metadata.get("input_tokens", 0)
+                output_tokens += metadata.get("output_tokens", 0)
+        return input_tokens, output_tokens
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any):
+        self._tool_starts[run_id] = ((serialized or {}).get("name", "unknown"), time.perf_counter())
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        self._observe_tool(run_id, "success")
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._observe_tool(run_id, "error")
+
+    def _observe_tool(self, run_id: UUID, status: str):
+        started: Optional[Tuple[str, float]] = self._tool_starts.pop(run_id, None)
+        if started is not None:
+            name, start = started
+            TOOL_LATENCY.labels(name, status).observe(time.perf_counter() - start)
+
+    def close(self):
+        self._llm_starts.clear()
+        self._tool_starts.clear()
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Records each chat model call of one agent run as a span of the request that triggered it."""
+
+    run_inline = True
+
+    def __init__(self):
+        self._spans: Dict[UUID, Span] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any):
+        if tracer.enabled:
+            self._spans[run_id] = tracer.start_span("llm", "llm", messages=sum(len(batch) for batch in messages))
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            input_tokens, output_tokens = MetricsCallbackHandler._token_usage(response)
+            tracer.finish_span(
+                span,
+                model=(response.llm_output or {}).get("model_name"),
+                input_tokens=input_tokens,
+                output_tokens=output_tokens
+            )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            tracer.finish_span(span, error=type(error).__name__)
+
+    def close(self):
+        # Spans still open belong to calls the run abandoned
+        while self._spans:
+            _, span = self._spans.popitem()
+            tracer.finish_span(span, error="cancelled")
+
+def agent_run_callbacks() -> List[BaseCallbackHandler]:
+    """Fresh handlers for one agent run; pass them to `close_callbacks` when the run ends, however it ends."""
+    return [MetricsCallbackHandler(), TracingCallbackHandler()]
+
+def close_callbacks(callbacks: List[BaseCallbackHandler]):
+    for callback in callbacks:
+        callback.close()
@@ -0,0 +1,111 @@
+from typing import Any, Dict, List, Optional, Set
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from app.core.admission import AdmissionRejected, background_admission_controller
+from app.core.tokens import count_tokens, truncate_tokens
+from app.services.session_store import ConversationSessionStore
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between healthcare staff and a "
+    "patient-information assistant. Merge the previous summary with the new messages into "
+    "one concise summary. Keep patient names, identifiers, filters and numbers that later "
+    "questions may refer to; drop pleasantries and repeated listings."
+)
+
+class HistoryCompactor:
+    """
+    Builds the chat_history for the agent prompt within a token budget.
+    The newest messages that fit are sent verbatim (the newest alone is cut to the
+    budget if it does not fit); older ones are folded into a rolling summary by a
+    background LLM call, so the prompt stays roughly the same size however long
+    the conversation gets.
+    """
+
+    def __init__(
+        self,
+        sessions: ConversationSessionStore,
+        llm: BaseChatModel,
+        token_budget: int = 1500,
+        summary_max_tokens: int = 300
+    ):
+        self.sessions = sessions
+        self.llm = llm
+        self.token_budget = token_budget
+        self.summary_max_tokens = summary_max_tokens
+        self._summarizing: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def build(self, conversation_id: Optional[str]) -> List[BaseMessage]:
+        if not conversation_id:
+            return []
+
+        context = self.sessions.get_context(conversation_id)
+        messages = context["messages"]
+        summary = context["summary"]
+
+        budget = self.token_budget - (count_tokens(summary) if summary else 0)
+        recent: List[Dict[str, Any]] = []
+        for message in reversed(messages):
+            tokens = message.get("tokens") or count_tokens(message["content"])
+            if tokens > budget:
+                if recent or budget <= 0:
+                    break
+                # The newest message alone is over budget: send its beginning rather than exceed the budget
+                message = {**message, "content": truncate_tokens(message["content"], budget)}
+                tokens = budget
+            recent.insert(0, message)
+            budget -= tokens
+
+        # Start on a user turn so an answer is never sent without its question
+        while len(recent) > 1 and recent[0]["role"] != "user":
+            recent.pop(0)
+
+        overflow = messages[:len(messages) - len(recent)]
+        if overflow:
+            self._schedule_summary(conversation_id, summary, overflow)
+
+        chat_history: List[BaseMessage] = []
+        if summary:
+            chat_history.append(SystemMessage(content=f"Summary of the earlier conversation: {summary}"))
+        for message in recent:
+            if message["role"] == "user":
+                chat_history.append(HumanMessage(content=message["content"]))
+            elif message["role"] == "assistant":
+                chat_history.append(AIMessage(content=message["content"]))
+        return chat_history
+
+    def _schedule_summary(self, conversation_id: str, summary: Optional[str], overflow: List[Dict[str, Any]]):
+        if conversation_id in self._summarizing:
+            return
+        self._summarizing.add(conversation_id)
+        task = asyncio.get_running_loop().create_task(self._summarize(conversation_id, summary, overflow))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(self, conversation_id: str, summary: Optional[str], overflow: List[Dict[str, Any]]):
+        try:
+            transcript = "\n".join(f"{message['role']}: {message['content']}" for message in overflow)
+            prompt = f"Previous summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"
+
+            # Summaries are background LLM calls: they take the background budget, never a chat slot
+            async with background_admission_controller.slot():
+                response = await self.llm.bind(max_tokens=self.summary_max_tokens).ainvoke([
+                    SystemMessage(content=SUMMARY_PROMPT),
+                    HumanMessage(content=prompt)
+                ])
+
+            self.sessions.compact(conversation_id, response.content, overflow[-1]["seq"])
+            logger.info(f"Compacted {len(overflow)} messages of conversation {conversation_id} into its summary")
+
+        except AdmissionRejected as e:
+            # The overflow stays in the session and is retried on the next turn
+            logger.warning(f"Summary of conversation {conversation_id} postponed: {e.reason}")
+        except Exception as e:
+            # The overflow stays in the session and is retried on the next turn
+            logger.error(f"Error summarizing conversation {conversation_id}: {e}")
+        finally:
+            self._summarizing.discard(conversation_id)
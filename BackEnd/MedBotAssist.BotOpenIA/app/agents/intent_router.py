@@ -0,0 +1,141 @@
+from typing import Dict, Any, List, Optional
+from app.services.database_service import DatabaseService
+import asyncio
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Optional leading/trailing filler around the recognized phrases
+_LEAD = r"^\s*[¿¡]?\s*"
+_TAIL = r"\s*[?.!]*\s*$"
+
+# Words that start a criterion rather than a name ("busca al paciente con diabetes")
+_NOT_A_NAME = r"(?!(con|sin|que|de|del|mayor|menor|with|without|who|that|aged|of)\b)"
+
+# A name is one to four words; longer tails are criteria or context for the agent
+_NAME = r"(?P<name>[a-záéíóúüñ][a-záéíóúüñ']*(?: [a-záéíóúüñ']+){0,3})"
+
+# Words that never appear in a name, anywhere in it ("Juan con diabetes", "más joven", "Ana that lives")
+_CRITERIA_WORDS = {
+    "con", "sin", "que", "y", "o", "en", "mayor", "menor", "mayores", "menores", "más", "mas", "menos",
+    "joven", "jóvenes", "viejo", "vieja", "edad", "años", "nacido", "nacida", "vive", "tiene", "cuyo", "cuya",
+    "entre", "todos", "todas", "los", "las",
+    "with", "without", "who", "that", "which", "aged", "of", "the", "in", "at", "and", "or", "lives", "living",
+    "born", "older", "younger", "oldest", "youngest", "than", "over", "under", "years", "age", "whose", "from",
+    "has", "all"
+}
+
+def _rule(pattern: str) -> "re.Pattern":
+    return re.compile(_LEAD + pattern + _TAIL, re.IGNORECASE)
+
+class IntentRouter:
+    """
+    Deterministic router for simple patient queries.
+    Patterns must match the whole message, so anything with extra criteria or
+    conversational context falls through to the full LLM agent.
+    """
+
+    def __init__(self, db_service: DatabaseService):
+        self.db_service = db_service
+        self.rules: List[tuple] = [
+            ("count_patients", "es", _rule(
+                r"cu[aá]nt[oa]s pacientes( hay| tenemos| existen| est[aá]n registrados)?"
+                r"( en total| en la base de datos| registrados| en el sistema)*"
+            ), self._count_patients),
+            ("count_patients", "en", _rule(
+                r"how many patients( are there| do we have| are registered| are in the database)?"
+                r"( in total| in the database| in the system)*"
+            ), self._count_patients),
+            ("count_patients_with_email", "es", _rule(
+                r"cu[aá]nt[oa]s pacientes (tienen|con) (email|e-mail|correo( electr[oó]nico)?)( registrado)?"
+            ), self._count_patients_with_email),
+            ("count_patients_with_email", "en", _rule(
+                r"how many patients (have|with) (an )?(email|e-mail)( address)?"
+            ), self._count_patients_with_email),
+            ("count_patients_with_phone", "es", _rule(
+                r"cu[aá]nt[oa]s pacientes (tienen|con) (tel[eé]fono|celular)( registrado)?"
+            ), self._count_patients_with_phone),
+            ("count_patients_with_phone", "en", _rule(
+                r"how many patients (have|with) (a )?(phone|phone number)"
+            ), self._count_patients_with_phone),
+            ("patient_by_id", "es", _rule(
+                r"((mu[eé]strame|muestra|busca|buscar|dame|ver) )?(el |al )?paciente (con )?(id|identificador) ?#?(?P<patient_id>\d+)"
+            ), self._patient_by_id),
+            ("patient_by_id", "en", _rule(
+                r"((show( me)?|find|get) )?(the )?patient (with )?id ?#?(?P<patient_id>\d+)"
+            ), self._patient_by_id),
+            ("search_by_name", "es", _rule(
+                rf"(busca|buscar|encuentra) (al |a la )?paciente (llamad[oa] )?{_NOT_A_NAME}{_NAME}"
+            ), self._search_by_name),
+            ("search_by_name", "en", _rule(
+                rf"(find|search for) (the )?patient (named )?{_NOT_A_NAME}{_NAME}"
+            ), self._search_by_name),
+        ]
+
+    async def route(self, message: str) -> Optional[Dict[str, Any]]:
+        """Answer `message` directly when it matches a known intent; None means use the agent."""
+        for intent, language, pattern, handler in self.rules:
+            match = pattern.match(message)
+            if not match:
+                continue
+            try:
+                response = await handler(language, **match.groupdict())
+            except Exception as e:
+                # Let the agent handle it rather than failing a query the LLM could answer
+                logger.error(f"Intent '{intent}' failed, falling back to agent: {e}")
+                return None
+            if response is None:
+                # The handler could not answer with certainty; the agent will
+                logger.info(f"Intent '{intent}' declined, falling back to agent")
+                return None
+            logger.info(f"Message routed to intent '{intent}' without LLM")
+            return {"intent": intent, "response": response}
+        return None
+
+    async def _count_patients(self, language: str) -> str:
+        counts = await asyncio.to_thread(self.db_service.get_patient_counts)
+        if language == "es":
+            return f"Hay {counts['total_patients']} pacientes registrados en la base de datos."
+        return f"There are {counts['total_patients']} patients in the database."
+
+    async def _count_patients_with_email(self, language: str) -> str:
+        counts = await asyncio.to_thread(self.db_service.get_patient_counts)
+        if language == "es":
+            return f"{counts['patients_with_email']} de {counts['total_patients']} pacientes tienen correo electrónico registrado."
+        return f"{counts['patients_with_email']} of {counts['total_patients']} patients have an email address."
+
+    async def _count_patients_with_phone(self, language: str) -> str:
+        counts = await asyncio.to_thread(self.db_service.get_patient_counts)
+        if language == "es":
+            return f"{counts['patients_with_phone']} de {counts['total_patients']} pacientes tienen teléfono registrado."
+        return f"{counts['patients_with_phone']} of {counts['total_patients']} patients have a phone number."
+
+    async def _patient_by_id(self, language: str, patient_id: str) -> str:
+        patient = await asyncio.to_thread(self.db_service.get_patient_by_id, int(patient_id))
+        if patient is None:
+            if language == "es":
+                return f"No se encontró ningún paciente con ID {patient_id}."
+            return f"No patient found with ID {patient_id}."
+        return self._describe_patients([patient], language)
+
+    async def _search_by_name(self, language: str, name: str) -> Optional[str]:
+        name = name.strip()
+        if any(word in _CRITERIA_WORDS for word in name.lower().split()):
+            return None
+        patients = await asyncio.to_thread(self.db_service.search_patients_by_name, name)
+        if not patients:
+            # Maybe not a name after all ("busca al paciente diabético"); let the agent interpret it
+            return None
+        return self._describe_patients(patients, language)
+
+    def _describe_patients(self, patients: List[Dict[str, Any]], language: str, limit: int = 10) -> str:
+        descriptions = self.db_service.convert_patients_to_natural_language(patients[:limit])
+        if language == "es":
+            header = f"Se encontraron {len(patients)} pacientes:" if len(patients) > 1 else "Paciente encontrado:"
+        else:
+            header = f"Found {len(patients)} patients:" if len(patients) > 1 else "Patient found:"
+        lines = [header] + [f"{i}. {description}" for i, description in enumerate(descriptions, 1)]
+        if len(patients) > limit:
+            lines.append(f"... (+{len(patients) - limit})")
+        return "\n".join(lines)
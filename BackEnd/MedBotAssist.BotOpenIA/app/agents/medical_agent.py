@@ -1,11 +1,25 @@
-from typing import Dict, Any, List, Optional
-from langchain.agents import create_openai_functions_agent, AgentExecutor
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple
+from langchain.agents import create_tool_calling_agent, AgentExecutor
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage, AIMessage
-from app.agents.tools import ALL_TOOLS
+from langchain_core.language_models import BaseChatModel
+from app.agents.tools import ALL_TOOLS, current_clinic
+from app.agents.intent_router import IntentRouter
+from app.agents.history import HistoryCompactor
 from app.core.config import settings
+from app.services.session_store import ConversationSessionStore
+from app.services.semantic_cache import SemanticResponseCache
+from app.services.vectorization_service import get_shared_vectorization_service
+from app.core.cache import TTLCache
+from app.core.admission import AdmissionRejected, admission_controller, background_admission_controller
+from app.core.identity import CallerIdentity, clinic_scope
+from app.core.metrics import cache_stats_collector
+from app.core.tracing import span, traced, tracer
+from app.agents.callbacks import agent_run_callbacks, close_callbacks
+import asyncio
+import json
 import logging
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
@@ -15,22 +29,56 @@ class MedicalQueryAgent:
     This agent can search for patient information, get summaries, and filter by demographics.
     """
     
-    def __init__(self):
-        """Initialize the Medical Query Agent."""
-        self.llm = None
+    def __init__(self, llm: Optional[BaseChatModel] = None):
+        """
+        Initialize the Medical Query Agent.
+        
+        Args:
+            llm: Optional chat model to use instead of OpenAI (e.g. a fake model for benchmarks)
+        """
+        self.llm = llm
         self.agent_executor = None
-        self.conversation_history = []
+        self.vectorization_service = get_shared_vectorization_service()
+        self.sessions = ConversationSessionStore.from_settings()
+        self.history = None
+        self.intent_router = IntentRouter(self.vectorization_service.db_service) if settings.INTENT_ROUTER_ENABLED else None
+        self.response_cache = None
+        if settings.SEMANTIC_CACHE_ENABLED:
+            self.response_cache = SemanticResponseCache(
+                max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+                similarity_threshold=settings.SEMANTIC_CACHE_SIMILARITY_THRESHOLD,
+                ttl_seconds=settings.SEMANTIC_CACHE_TTL_SECONDS
+            )
+        # Exact repeats of a message reuse its embedding instead of calling OpenAI again
+        self._message_embeddings = TTLCache(
+            max_size=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.SEMANTIC_CACHE_TTL_SECONDS
+        )
+        if self.response_cache is not None:
+            cache_stats_collector.register("semantic_response", self.response_cache.stats)
+        cache_stats_collector.register("message_embedding", self._message_embeddings.stats)
         self._initialize_agent()
     
     def _initialize_agent(self):
         """Initialize the LangChain agent with tools and OpenAI."""
         try:
-            # Initialize OpenAI LLM
-            self.llm = ChatOpenAI(
-                api_key=settings.OPENAI_API_KEY,
-                model=settings.OPENAI_MODEL,
-                temperature=0.1,  # Low temperature for consistent medical responses
-                max_tokens=1000
+            # Initialize OpenAI LLM (async calls go through the AsyncOpenAI client)
+            if self.llm is None:
+                self.llm = ChatOpenAI(
+                    api_key=settings.OPENAI_API_KEY,
+                    base_url=settings.OPENAI_BASE_URL,
+                    model=settings.OPENAI_MODEL,
+                    temperature=0.1,  # Low temperature for consistent medical responses
+                    max_tokens=1000,
+                    stream_usage=True  # Token usage is reported for streamed answers too
+                )
+            
+            # Prompt history is assembled within a token budget; older turns become a rolling summary
+            self.history = HistoryCompactor(
+                sessions=self.sessions,
+                llm=self.llm,
+                token_budget=settings.HISTORY_TOKEN_BUDGET,
+                summary_max_tokens=settings.HISTORY_SUMMARY_MAX_TOKENS
             )
             
             # Initialize tools (only query tools, no creation)
@@ -50,6 +98,7 @@ class MedicalQueryAgent:
             - Always be professional and respectful when discussing patient information
             - Provide clear, concise responses
             - If you can't find specific information, suggest alternative search terms
+            - When a question needs several independent lookups, request all of those tool calls at once
             - Protect patient privacy by not sharing unnecessary details
             - Focus on helping healthcare professionals make informed decisions
             
@@ -67,8 +116,8 @@ class MedicalQueryAgent:
                 MessagesPlaceholder(variable_name="agent_scratchpad")
             ])
             
-            # Create the agent
-            agent = create_openai_functions_agent(
+            # Create the agent (tool calls requested in the same turn run concurrently)
+            agent = create_tool_calling_agent(
                 llm=self.llm,
                 tools=tools,
                 prompt=prompt
@@ -89,47 +138,144 @@ class MedicalQueryAgent:
             logger.error(f"Error initializing Medical Query Agent: {e}")
             raise
     
-    async def query(self, message: str, conversation_id: Optional[str] = None) -> Dict[str, Any]:
+    @staticmethod
+    def _session_key(conversation_id: Optional[str], identity: Optional[CallerIdentity]) -> Optional[str]:
+        """
+        Session store key of a conversation. Conversations belong to the verified tenant
+        that started them, so another tenant sending the same ID reaches a different session.
+        """
+        if not conversation_id:
+            return None
+        # JSON keeps the key unambiguous whatever characters the tenant and the ID contain
+        return json.dumps([identity.tenant_id if identity else None, conversation_id])
+    
+    def _build_chat_history(self, session_key: Optional[str]) -> List[Any]:
+        """This conversation's history in LangChain format, compacted to the token budget."""
+        return self.history.build(session_key)
+    
+    def _store_turn(self, session_key: Optional[str], message: str, output: str):
+        """Store a user message and the agent answer in the conversation history."""
+        if session_key:
+            timestamp = datetime.now().isoformat()
+            self.sessions.append_messages(session_key, [
+                {"role": "user", "content": message, "timestamp": timestamp},
+                {"role": "assistant", "content": output, "timestamp": timestamp}
+            ])
+    
+    async def _route_intent(self, message: str) -> Optional[Dict[str, Any]]:
+        """Direct answer for a simple intent; None means run the agent."""
+        # The router reads SQL Server across clinics, so clinic-scoped queries always go through the tools
+        if self.intent_router is None or (settings.INDEX_SHARD_COLUMN and current_clinic.get() is not None):
+            return None
+        return await self.intent_router.route(message)
+    
+    async def _check_response_cache(
+        self,
+        message: str,
+        chat_history: List[Any],
+        identity: Optional[CallerIdentity]
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[tuple]]:
+        """
+        Look up a semantically equivalent cached answer.
+        
+        Returns (hit, cache_key); cache_key stores the answer after a miss. Follow-up
+        messages are never cached because their answer depends on the conversation,
+        and neither are queries without a verified identity to scope the answer to.
+        """
+        if self.response_cache is None or chat_history or identity is None:
+            return None, None
+        
+        try:
+            message_key = " ".join(message.lower().split())
+            embedding = self._message_embeddings.get(message_key)
+            if embedding is None:
+                embedding = await self.vectorization_service.generate_embedding(message)
+                self._message_embeddings.set(message_key, embedding)
+            
+            data_version = await asyncio.to_thread(self.vectorization_service.get_index_version)
+            scope = (identity.tenant_id, identity.role, data_version)
+            
+        except Exception as e:
+            logger.warning(f"Semantic cache unavailable, running agent: {e}")
+            return None, None
+        
+        return self.response_cache.lookup(embedding, scope), (embedding, scope)
+    
+    @traced("agent.query", "agent")
+    async def query(
+        self,
+        message: str,
+        conversation_id: Optional[str] = None,
+        identity: Optional[CallerIdentity] = None
+    ) -> Dict[str, Any]:
         """
         Process a natural language query about patients.
         
         Args:
             message: Natural language query about patients
-            conversation_id: Optional conversation ID for context
+            conversation_id: Optional conversation ID for context, within the caller's tenant;
+                without it the query is stateless
+            identity: Verified tenant and role of the caller; the tools read only its clinic,
+                and answers are cached per identity, not at all without one
             
         Returns:
             Dictionary with agent response and metadata
+            
+        Raises:
+            ClinicScopeRequired: patient data is sharded by clinic and there is no identity
         """
+        # The tools read only the caller's verified clinic
+        clinic_token = current_clinic.set(clinic_scope(identity))
+        session_key = self._session_key(conversation_id, identity)
         try:
             if not self.agent_executor:
                 raise ValueError("Agent not properly initialized")
             
-            # Convert conversation history to LangChain format
-            chat_history = []
-            for msg in self.conversation_history[-10:]:  # Keep last 10 messages for context
-                if msg["role"] == "user":
-                    chat_history.append(HumanMessage(content=msg["content"]))
-                elif msg["role"] == "assistant":
-                    chat_history.append(AIMessage(content=msg["content"]))
-            
-            # Execute the agent
-            response = self.agent_executor.invoke({
-                "input": message,
-                "chat_history": chat_history
-            })
+            # Simple intents are answered from the database without calling the LLM
+            with span("agent.intent_router", "agent"):
+                routed = await self._route_intent(message)
+            if routed:
+                self._store_turn(session_key, message, routed["response"])
+                return {
+                    "response": routed["response"],
+                    "success": True,
+                    "conversation_id": conversation_id,
+                    "tools_used": [],
+                    "intent": routed["intent"]
+                }
             
-            # Store conversation history
-            self.conversation_history.append({
-                "role": "user",
-                "content": message,
-                "timestamp": "now"  # You might want to use actual timestamp
-            })
+            chat_history = self._build_chat_history(session_key)
             
-            self.conversation_history.append({
-                "role": "assistant", 
-                "content": response["output"],
-                "timestamp": "now"
-            })
+            with span("agent.response_cache", "cache"):
+                cached, cache_key = await self._check_response_cache(message, chat_history, identity)
+            if cached:
+                self._store_turn(session_key, message, cached["response"])
+                return {
+                    "response": cached["response"],
+                    "success": True,
+                    "conversation_id": conversation_id,
+                    "tools_used": [],
+                    "cached": True
+                }
+            
+            # Execute the agent without blocking the event loop; only LLM-bound work waits for a slot
+            with span("agent.admission_wait", "agent"):
+                await admission_controller.acquire()
+            callbacks = agent_run_callbacks()
+            try:
+                with span("agent.executor", "agent"):
+                    response = await self.agent_executor.ainvoke(
+                        {"input": message, "chat_history": chat_history},
+                        config={"callbacks": callbacks}
+                    )
+            finally:
+                # Also reached on cancellation, which skips the end callbacks of the calls in progress
+                close_callbacks(callbacks)
+                admission_controller.release()
+            
+            self._store_turn(session_key, message, response["output"])
+            if cache_key:
+                self.response_cache.store(*cache_key, response["output"])
             
             return {
                 "response": response["output"],
@@ -138,6 +284,9 @@ class MedicalQueryAgent:
                 "tools_used": response.get("intermediate_steps", [])
             }
             
+        except AdmissionRejected:
+            # Surfaced to the route as 429 rather than as a failed answer
+            raise
         except Exception as e:
             logger.error(f"Error processing query: {e}")
             return {
@@ -145,15 +294,135 @@ class MedicalQueryAgent:
                 "success": False,
                 "error": str(e)
             }
+        finally:
+            current_clinic.reset(clinic_token)
     
-    def get_conversation_history(self, conversation_id: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Get conversation history for a specific conversation."""
-        return self.conversation_history.copy()
+    async def stream_query(
+        self,
+        message: str,
+        conversation_id: Optional[str] = None,
+        identity: Optional[CallerIdentity] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process a query like `query`, yielding events as the agent produces them.
+        
+        Yields dictionaries with an "event" name and its "data":
+        - tool_start / tool_end: a tool call started or finished
+        - token: a chunk of the final answer
+        - done: the complete answer, once the agent finishes
+        - error: the query failed
+        """
+        try:
+            # Each stream is consumed by its own response task, so the clinic does not leak into other requests
+            current_clinic.set(clinic_scope(identity))
+            session_key = self._session_key(conversation_id, identity)
+            
+            if not self.agent_executor:
+                raise ValueError("Agent not properly initialized")
+            
+            routed = await self._route_intent(message)
+            if routed:
+                self._store_turn(session_key, message, routed["response"])
+                yield {"event": "token", "data": {"content": routed["response"]}}
+                yield {
+                    "event": "done",
+                    "data": {"response": routed["response"], "conversation_id": conversation_id, "intent": routed["intent"]}
+                }
+                return
+            
+            chat_history = self._build_chat_history(session_key)
+            
+            cached, cache_key = await self._check_response_cache(message, chat_history, identity)
+            if cached:
+                self._store_turn(session_key, message, cached["response"])
+                yield {"event": "token", "data": {"content": cached["response"]}}
+                yield {
+                    "event": "done",
+                    "data": {"response": cached["response"], "conversation_id": conversation_id, "cached": True}
+                }
+                return
+            
+            output = ""
+            
+            # Spans opened here are finished explicitly: a generator cannot hold the span context across yields.
+            # The finally block also closes it when the query fails or the client disconnects (GeneratorExit).
+            executor_span = tracer.start_span("agent.stream_executor", "agent") if tracer.enabled else None
+            callbacks = agent_run_callbacks()
+            error = None
+            try:
+                async with admission_controller.slot():
+                    async for event in self.agent_executor.astream_events(
+                        {"input": message, "chat_history": chat_history},
+                        config={"callbacks": callbacks},
+                        version="v2"
+                    ):
+                        kind = event["event"]
+                        
+                        if kind == "on_tool_start":
+                            yield {"event": "tool_start", "data": {"tool": event["name"], "input": event["data"].get("input")}}
+                        elif kind == "on_tool_end":
+                            yield {"event": "tool_end", "data": {"tool": event["name"]}}
+                        elif kind == "on_chat_model_stream":
+                            # Tool-call turns stream empty content; only answer text is forwarded
+                            content = event["data"]["chunk"].content
+                            if content:
+                                yield {"event": "token", "data": {"content": content}}
+                        elif kind == "on_chain_end" and not event.get("parent_ids"):
+                            output = event["data"]["output"]["output"]
+            except BaseException as e:
+                error = type(e).__name__
+                raise
+            finally:
+                close_callbacks(callbacks)
+                if executor_span is not None:
+                    tracer.finish_span(executor_span, **({"error": error} if error else {}))
+            
+            self._store_turn(session_key, message, output)
+            if cache_key and output:
+                self.response_cache.store(*cache_key, output)
+            
+            yield {"event": "done", "data": {"response": output, "conversation_id": conversation_id}}
+            
+        except AdmissionRejected as e:
+            yield {
+                "event": "error",
+                "data": {
+                    "response": "El servicio está ocupado, intenta de nuevo en unos segundos.",
+                    "error": e.reason,
+                    "retry_after": e.retry_after
+                }
+            }
+        except Exception as e:
+            logger.error(f"Error streaming query: {e}")
+            yield {
+                "event": "error",
+                "data": {
+                    "response": f"Lo siento, hubo un error procesando tu consulta: {str(e)}",
+                    "error": str(e)
+                }
+            }
+    
+    def get_conversation_history(
+        self,
+        conversation_id: Optional[str] = None,
+        identity: Optional[CallerIdentity] = None
+    ) -> List[Dict[str, Any]]:
+        """Get conversation history for a specific conversation of the caller's tenant."""
+        session_key = self._session_key(conversation_id, identity)
+        if not session_key:
+            return []
+        return self.sessions.get_messages(session_key)
     
-    def clear_conversation_history(self, conversation_id: Optional[str] = None):
-        """Clear conversation history for a specific conversation."""
-        self.conversation_history.clear()
-        logger.info("Conversation history cleared")
+    def clear_conversation_history(
+        self,
+        conversation_id: Optional[str] = None,
+        identity: Optional[CallerIdentity] = None
+    ):
+        """Clear conversation history for a specific conversation of the caller's tenant."""
+        session_key = self._session_key(conversation_id, identity)
+        if session_key:
+            self.sessions.clear(session_key)
+        logger.info(f"Conversation history cleared for {conversation_id}")
     
     def get_available_tools(self) -> List[Dict[str, str]]:
         """Get list of available tools and their descriptions."""
@@ -177,7 +446,10 @@ class MedicalQueryAgent:
                 "agent_initialized": self.agent_executor is not None,
                 "llm_initialized": self.llm is not None,
                 "tools_count": len(ALL_TOOLS),
-                "conversation_history_length": len(self.conversation_history)
+                "sessions": self.sessions.stats(),
+                "response_cache": self.response_cache.stats() if self.response_cache else None,
+                "admission": admission_controller.stats(),
+                "background_admission": background_admission_controller.stats()
             }
         except Exception as e:
             return {
@@ -1,15 +1,64 @@
 from typing import List, Dict, Any, Optional
+from contextvars import ContextVar
 from langchain.tools import tool
-from app.services.vectorization_service import VectorizationService
+from app.services.vectorization_service import get_shared_vectorization_service
+from app.core.config import settings
+from app.core.tokens import count_tokens
+from app.core.tracing import traced
+import asyncio
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Initialize the vectorization service globally
-vectorization_service = VectorizationService()
+# Fields a tool can return per patient in compact mode
+PATIENT_FIELDS = ["id", "score", "description", "age", "gender", "blood_type"]
+DEFAULT_PATIENT_FIELDS = ["id", "description"]
+
+# Verified clinic (tenant) of the query being answered; set by the agent, every tool reads only its data
+current_clinic: ContextVar[Optional[str]] = ContextVar("current_clinic", default=None)
+
+# Output tokens fed back to the LLM, per tool: {"calls": n, "tokens": total, "last_tokens": n}
+tool_output_stats: Dict[str, Dict[str, int]] = {}
+
+def _report_output(tool_name: str, output: str) -> str:
+    """Record how many tokens a tool call adds to the agent scratchpad."""
+    tokens = count_tokens(output)
+    stats = tool_output_stats.setdefault(tool_name, {"calls": 0, "tokens": 0, "last_tokens": 0})
+    stats["calls"] += 1
+    stats["tokens"] += tokens
+    stats["last_tokens"] = tokens
+    logger.info(f"Tool {tool_name} returned {tokens} tokens ({settings.TOOL_OUTPUT_MODE} mode)")
+    return output
+
+def _compact_json(data: Dict[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+def _parse_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return DEFAULT_PATIENT_FIELDS
+    requested = [field.strip().lower() for field in fields.split(",")]
+    return [field for field in requested if field in PATIENT_FIELDS] or DEFAULT_PATIENT_FIELDS
+
+def _compact_patient(result: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    patient = result.get('metadata', {})
+    demographics = patient.get('demographics') or {}
+    values = {
+        "id": patient.get('id'),
+        "score": round(result.get('score', 0), 3),
+        "description": patient.get('description'),
+        "age": demographics.get('age'),
+        "gender": demographics.get('gender'),
+        "blood_type": demographics.get('blood_type')
+    }
+    return {field: values[field] for field in fields if values[field] is not None}
+
+def _limit(value: int) -> int:
+    return max(1, min(value, settings.TOOL_MAX_RESULTS))
 
 @tool
-def search_patients(query: str, top_k: int = 5, similarity_threshold: float = 0.7) -> str:
+@traced("tool.search_patients", "tool")
+async def search_patients(query: str, top_k: int = 5, similarity_threshold: float = 0.7, fields: Optional[str] = None) -> str:
     """
     Search for patients using natural language queries.
     
@@ -17,6 +66,8 @@ def search_patients(query: str, top_k: int = 5, similarity_threshold: float = 0.
         query: Natural language query to search for patients
         top_k: Maximum number of results to return (default: 5)
         similarity_threshold: Minimum similarity threshold (default: 0.7)
+        fields: Comma-separated fields to return per patient, only those the user asked for
+            (id, score, description, age, gender, blood_type; default: id,description)
     
     Examples:
     - "patients with diabetes"
@@ -25,15 +76,27 @@ def search_patients(query: str, top_k: int = 5, similarity_threshold: float = 0.
     - "young female patients"
     """
     try:
-        # Use the vectorization service to search
-        results = vectorization_service.search_similar_patients(
+        # Process-wide service shared with the API routes, created at startup warm-up
+        vectorization_service = get_shared_vectorization_service()
+        
+        # Use the vectorization service to search (shards are read concurrently off the event loop)
+        results = await vectorization_service.search_similar_patients(
             query=query,
-            top_k=top_k,
-            similarity_threshold=similarity_threshold
+            top_k=_limit(top_k) if settings.TOOL_OUTPUT_MODE == "compact" else top_k,
+            similarity_threshold=similarity_threshold,
+            clinic=current_clinic.get()
         )
         
         if not results:
-            return f"No patients found matching the query: '{query}'"
+            return _report_output("search_patients", f"No patients found matching the query: '{query}'")
+        
+        if settings.TOOL_OUTPUT_MODE == "compact":
+            selected_fields = _parse_fields(fields)
+            return _report_output("search_patients", _compact_json({
+                "query": query,
+                "count": len(results),
+                "patients": [_compact_patient(result, selected_fields) for result in results]
+            }))
         
         response = f"🔍 Found {len(results)} patients matching '{query}':\n\n"
         
@@ -53,14 +116,15 @@ def search_patients(query: str, top_k: int = 5, similarity_threshold: float = 0.
             
             response += "\n"
         
-        return response
+        return _report_output("search_patients", response)
         
     except Exception as e:
         logger.error(f"Error searching patients: {str(e)}")
         return f"Error searching patients: {str(e)}"
 
 @tool
-def get_patient_summary(include_demographics: bool = True) -> str:
+@traced("tool.get_patient_summary", "tool")
+async def get_patient_summary(include_demographics: bool = True) -> str:
     """
     Get a summary of all patients in the database.
     
@@ -71,7 +135,23 @@ def get_patient_summary(include_demographics: bool = True) -> str:
         A summary including total number of patients, demographic statistics, and recent additions.
     """
     try:
-        summary = vectorization_service.get_patient_data_summary()
+        vectorization_service = get_shared_vectorization_service()
+        summary = await asyncio.to_thread(vectorization_service.get_patient_data_summary, clinic=current_clinic.get())
+        
+        if settings.TOOL_OUTPUT_MODE == "compact":
+            compact = {
+                "total": summary.get('total_patients'),
+                "with_email": summary.get('patients_with_email'),
+                "with_phone": summary.get('patients_with_phone')
+            }
+            if include_demographics:
+                if summary.get('age_buckets'):
+                    compact["ages"] = {bucket: count for bucket, count in summary['age_buckets'].items() if count}
+                if summary.get('gender'):
+                    compact["gender"] = summary['gender']
+                if summary.get('sample_descriptions'):
+                    compact["samples"] = summary['sample_descriptions'][:3]
+            return _report_output("get_patient_summary", _compact_json(compact))
         
         response = "📊 Patient Database Summary:\n\n"
         response += f"Total Patients: {summary.get('total_patients', 'Unknown')}\n"
@@ -81,19 +161,36 @@ def get_patient_summary(include_demographics: bool = True) -> str:
         if summary.get('patients_with_phone'):
             response += f"Patients with Phone: {summary['patients_with_phone']}\n"
         
+        if include_demographics and summary.get('age_buckets'):
+            response += "\n👥 Patients by Age:\n"
+            for bucket, count in summary['age_buckets'].items():
+                if count:
+                    response += f"- {bucket}: {count}\n"
+        if include_demographics and summary.get('gender'):
+            response += "\n👥 Patients by Gender:\n"
+            for gender, count in summary['gender'].items():
+                response += f"- {gender}: {count}\n"
+        
         if include_demographics and summary.get('sample_descriptions'):
             response += "\n📝 Sample Patient Descriptions:\n"
             for i, desc in enumerate(summary['sample_descriptions'][:3], 1):
                 response += f"{i}. {desc}\n"
         
-        return response
+        return _report_output("get_patient_summary", response)
         
     except Exception as e:
         logger.error(f"Error getting patient summary: {str(e)}")
         return f"Error getting patient summary: {str(e)}"
 
 @tool
-def filter_demographics(age_range: str = None, gender: str = None, blood_type: str = None) -> str:
+@traced("tool.filter_demographics", "tool")
+async def filter_demographics(
+    age_range: str = None,
+    gender: str = None,
+    blood_type: str = None,
+    limit: int = 10,
+    fields: Optional[str] = None
+) -> str:
     """
     Filter patients by specific demographic criteria.
     
@@ -101,6 +198,9 @@ def filter_demographics(age_range: str = None, gender: str = None, blood_type: s
         age_range: Age range like '20-30' or 'young' or 'elderly'
         gender: Gender filter: 'male', 'female', 'masculine', 'feminine'
         blood_type: Blood type like 'O+', 'A-', 'AB+', etc.
+        limit: Maximum number of patients to return (default: 10)
+        fields: Comma-separated fields to return per patient, only those the user asked for
+            (id, score, description, age, gender, blood_type; default: id,description)
     
     Returns:
         Filtered list of patients matching the demographic criteria.
@@ -135,10 +235,12 @@ def filter_demographics(age_range: str = None, gender: str = None, blood_type: s
         query = " ".join(query_parts)
         
         # Search using the combined query
-        results = vectorization_service.search_similar_patients(
+        vectorization_service = get_shared_vectorization_service()
+        results = await vectorization_service.search_similar_patients(
             query=query,
-            top_k=10,
-            similarity_threshold=0.5
+            top_k=_limit(limit),
+            similarity_threshold=0.5,
+            clinic=current_clinic.get()
         )
         
         if not results:
@@ -150,7 +252,19 @@ def filter_demographics(age_range: str = None, gender: str = None, blood_type: s
             if blood_type:
                 filters_str.append(f"Blood Type: {blood_type}")
             
-            return f"No patients found matching the filters: {', '.join(filters_str)}"
+            return _report_output(
+                "filter_demographics",
+                f"No patients found matching the filters: {', '.join(filters_str)}"
+            )
+        
+        if settings.TOOL_OUTPUT_MODE == "compact":
+            selected_fields = _parse_fields(fields)
+            filters = {"age_range": age_range, "gender": gender, "blood_type": blood_type}
+            return _report_output("filter_demographics", _compact_json({
+                "filters": {name: value for name, value in filters.items() if value},
+                "count": len(results),
+                "patients": [_compact_patient(result, selected_fields) for result in results]
+            }))
         
         response = f"🎯 Filtered Results for Demographics:\n"
         if age_range:
@@ -178,7 +292,7 @@ def filter_demographics(age_range: str = None, gender: str = None, blood_type: s
             
             response += "\n"
         
-        return response
+        return _report_output("filter_demographics", response)
         
     except Exception as e:
         logger.error(f"Error filtering by demographics: {str(e)}")
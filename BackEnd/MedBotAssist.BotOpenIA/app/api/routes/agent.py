@@ -1,30 +1,93 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Header, status
+from fastapi.responses import StreamingResponse
 from app.models.schemas import (
     AgentQueryRequest,
     AgentQueryResponse,
     ConversationHistoryResponse,
     ErrorResponse
 )
-from app.agents.medical_agent import MedicalQueryAgent
+from app.core.config import settings
+from app.core.health import health_monitor
+from app.core.responses import ClosingStreamingResponse
+from app.core.admission import AdmissionRejected, admission_controller, background_admission_controller
+from app.core.identity import CallerIdentity, ClinicScopeRequired, clinic_scope, verify_identity
+from app.services.index_versions import BuildInProgress
+import asyncio
 import time
-from typing import Dict, Any, Optional
+import threading
+from typing import TYPE_CHECKING, Dict, Any, Optional
 import uuid
+import json
 import logging
 from datetime import datetime
 
+if TYPE_CHECKING:
+    # LangChain is imported when the agent is built (startup warm-up), not when the routes load
+    from app.agents.medical_agent import MedicalQueryAgent
+
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Global agent instance (in production, use proper dependency injection)
+# Global agent instance, built by the startup warm-up (in production, use proper dependency injection)
 medical_agent = None
+_medical_agent_lock = threading.Lock()
 
-def get_medical_agent() -> MedicalQueryAgent:
-    """Dependency to get or create medical agent instance."""
+def get_medical_agent() -> "MedicalQueryAgent":
+    """
+    Dependency to get or create medical agent instance.
+    Construction is single-flight: requests arriving while the agent is being
+    built wait for that instance instead of building their own.
+    """
     global medical_agent
     if medical_agent is None:
-        medical_agent = MedicalQueryAgent()
+        with _medical_agent_lock:
+            if medical_agent is None:
+                from app.agents.medical_agent import MedicalQueryAgent
+                medical_agent = MedicalQueryAgent()
     return medical_agent
 
+def is_medical_agent_ready() -> bool:
+    """Readiness check: the agent has been built. Performs no I/O."""
+    return medical_agent is not None and medical_agent.agent_executor is not None
+
+def _too_many_requests(error: AdmissionRejected) -> HTTPException:
+    """429 telling the client when to retry."""
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=f"Server busy: {error.reason}",
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+def _forbidden(error: ClinicScopeRequired) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(error))
+
+def _verified_caller(
+    x_tenant_id: Optional[str],
+    x_user_role: Optional[str],
+    x_identity_signature: Optional[str]
+) -> Optional[CallerIdentity]:
+    """Verified identity of the caller (scopes clinic data and conversations); 403 when sharded data needs one."""
+    identity = verify_identity(x_tenant_id, x_user_role, x_identity_signature)
+    try:
+        clinic_scope(identity)
+    except ClinicScopeRequired as e:
+        raise _forbidden(e)
+    return identity
+
+def _require_index_writer():
+    """Index writes go through the writer node so a shared Chroma server is rebuilt only once."""
+    if not settings.CHROMA_INDEX_WRITER:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="This node only reads the vector index (CHROMA_INDEX_WRITER=false); run the update on the writer node"
+        )
+
+def check_agent_deep_health() -> Dict[str, Any]:
+    """Deep check run by the background health monitor; never sends a query to the LLM."""
+    if medical_agent is None:
+        return {"status": "pending", "agent_initialized": False}
+    return medical_agent.health_check()
+
 @router.post(
     "/chat",
     response_model=AgentQueryResponse,
@@ -34,12 +97,17 @@ def get_medical_agent() -> MedicalQueryAgent:
     responses={
         200: {"description": "Successful agent response"},
         400: {"model": ErrorResponse, "description": "Bad request"},
+        403: {"model": ErrorResponse, "description": "Patient data is sharded by clinic and the caller identity is not signed"},
+        429: {"model": ErrorResponse, "description": "Too many concurrent queries, retry after Retry-After seconds"},
         500: {"model": ErrorResponse, "description": "Internal server error"}
     }
 )
 async def chat_with_agent(
     request: AgentQueryRequest,
-    agent: MedicalQueryAgent = Depends(get_medical_agent)
+    agent: "MedicalQueryAgent" = Depends(get_medical_agent),
+    x_tenant_id: Optional[str] = Header(default=None, description="Tenant (clinic) of the caller; only used when signed"),
+    x_user_role: Optional[str] = Header(default=None, description="Permission role of the caller"),
+    x_identity_signature: Optional[str] = Header(default=None, description="Gateway signature of X-Tenant-ID and X-User-Role")
 ) -> AgentQueryResponse:
     """
     Chat with the medical query agent using natural language.
@@ -62,10 +130,11 @@ async def chat_with_agent(
         # Generate conversation ID if not provided
         conversation_id = request.conversation_id or f"conv_{uuid.uuid4().hex[:8]}"
         
-        # Process query with agent
+        # Process query with agent, scoped to the verified clinic of the caller
         result = await agent.query(
             message=request.message,
-            conversation_id=conversation_id
+            conversation_id=conversation_id,
+            identity=verify_identity(x_tenant_id, x_user_role, x_identity_signature)
         )
         
         # Get available tools
@@ -84,6 +153,10 @@ async def chat_with_agent(
         
         return response
         
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
+    except ClinicScopeRequired as e:
+        raise _forbidden(e)
     except Exception as e:
         logger.error(f"Error in agent chat: {e}")
         raise HTTPException(
@@ -91,23 +164,95 @@ async def chat_with_agent(
             detail=f"Error processing agent query: {str(e)}"
         )
 
+def _format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Encode one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@router.post(
+    "/chat/stream",
+    status_code=status.HTTP_200_OK,
+    summary="Chat with the medical query agent (streaming)",
+    description="Stream agent progress and the final answer as Server-Sent Events",
+    responses={
+        200: {"description": "text/event-stream of agent events", "content": {"text/event-stream": {}}},
+        403: {"model": ErrorResponse, "description": "Patient data is sharded by clinic and the caller identity is not signed"},
+        429: {"model": ErrorResponse, "description": "Too many concurrent queries, retry after Retry-After seconds"}
+    }
+)
+async def stream_chat_with_agent(
+    request: AgentQueryRequest,
+    agent: "MedicalQueryAgent" = Depends(get_medical_agent),
+    x_tenant_id: Optional[str] = Header(default=None, description="Tenant (clinic) of the caller; only used when signed"),
+    x_user_role: Optional[str] = Header(default=None, description="Permission role of the caller"),
+    x_identity_signature: Optional[str] = Header(default=None, description="Gateway signature of X-Tenant-ID and X-User-Role")
+) -> StreamingResponse:
+    """
+    Chat with the medical query agent, receiving events as they happen.
+    
+    Events (SSE `event:` field, JSON `data:`):
+    - start: conversation ID, sent immediately
+    - tool_start / tool_end: the agent called a tool
+    - token: a chunk of the final answer
+    - done: the full answer and the processing time
+    - error: the query failed
+    """
+    # Reject before the stream starts, while a 403 or 429 can still be returned
+    identity = _verified_caller(x_tenant_id, x_user_role, x_identity_signature)
+    if admission_controller.is_saturated():
+        raise _too_many_requests(AdmissionRejected("queue full", admission_controller.retry_after_seconds))
+    
+    conversation_id = request.conversation_id or f"conv_{uuid.uuid4().hex[:8]}"
+    
+    async def event_stream():
+        start_time = time.time()
+        events = agent.stream_query(
+            message=request.message,
+            conversation_id=conversation_id,
+            identity=identity
+        )
+        try:
+            yield _format_sse("start", {"conversation_id": conversation_id})
+            
+            async for event in events:
+                if event["event"] == "done":
+                    processing_time = (time.time() - start_time) * 1000
+                    event["data"]["processing_time_ms"] = processing_time
+                    logger.info(f"Streaming agent query processed in {processing_time:.2f}ms")
+                yield _format_sse(event["event"], event["data"])
+        finally:
+            # Also reached when the client disconnects: closing the agent stream releases its admission slot now
+            await events.aclose()
+    
+    return ClosingStreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Disable proxy buffering so events flush immediately
+        }
+    )
+
 @router.get(
     "/tools",
     summary="Get available agent tools",
     description="List all tools available to the medical query agent"
 )
 async def get_agent_tools(
-    agent: MedicalQueryAgent = Depends(get_medical_agent)
+    agent: "MedicalQueryAgent" = Depends(get_medical_agent)
 ) -> Dict[str, Any]:
     """
     Get a list of all tools available to the medical agent.
     """
     try:
+        from app.agents.tools import tool_output_stats
+        
         tools = agent.get_available_tools()
         
         return {
             "tools": tools,
             "total_tools": len(tools),
+            "output_mode": settings.TOOL_OUTPUT_MODE,
+            "output_tokens": tool_output_stats,
             "agent_type": "medical_query_agent",
             "capabilities": [
                 "Patient search and retrieval",
@@ -124,6 +269,24 @@ async def get_agent_tools(
             detail=f"Error getting agent tools: {str(e)}"
         )
 
+@router.get(
+    "/cache/stats",
+    summary="Get agent cache statistics",
+    description="Size and hit rate of the semantic response cache and the patient record cache"
+)
+async def get_cache_stats(
+    agent: "MedicalQueryAgent" = Depends(get_medical_agent)
+) -> Dict[str, Any]:
+    """
+    Get hit/miss statistics of the agent caches.
+    """
+    from app.services.database_service import patient_record_cache
+    
+    return {
+        "semantic_response_cache": agent.response_cache.stats() if agent.response_cache else None,
+        "patient_record_cache": patient_record_cache.stats()
+    }
+
 @router.get(
     "/conversation/{conversation_id}",
     response_model=ConversationHistoryResponse,
@@ -132,13 +295,18 @@ async def get_agent_tools(
 )
 async def get_conversation_history(
     conversation_id: str,
-    agent: MedicalQueryAgent = Depends(get_medical_agent)
+    agent: "MedicalQueryAgent" = Depends(get_medical_agent),
+    x_tenant_id: Optional[str] = Header(default=None, description="Tenant (clinic) of the caller; only used when signed"),
+    x_user_role: Optional[str] = Header(default=None, description="Permission role of the caller"),
+    x_identity_signature: Optional[str] = Header(default=None, description="Gateway signature of X-Tenant-ID and X-User-Role")
 ) -> ConversationHistoryResponse:
     """
     Get conversation history for a specific conversation.
+    Only conversations of the caller's verified tenant are visible.
     """
+    identity = _verified_caller(x_tenant_id, x_user_role, x_identity_signature)
     try:
-        history = agent.get_conversation_history(conversation_id)
+        history = agent.get_conversation_history(conversation_id, identity)
         
         return ConversationHistoryResponse(
             conversation_id=conversation_id,
@@ -160,13 +328,18 @@ async def get_conversation_history(
 )
 async def clear_conversation_history(
     conversation_id: str,
-    agent: MedicalQueryAgent = Depends(get_medical_agent)
+    agent: "MedicalQueryAgent" = Depends(get_medical_agent),
+    x_tenant_id: Optional[str] = Header(default=None, description="Tenant (clinic) of the caller; only used when signed"),
+    x_user_role: Optional[str] = Header(default=None, description="Permission role of the caller"),
+    x_identity_signature: Optional[str] = Header(default=None, description="Gateway signature of X-Tenant-ID and X-User-Role")
 ) -> Dict[str, Any]:
     """
     Clear conversation history for a specific conversation.
+    Only conversations of the caller's verified tenant can be cleared.
     """
+    identity = _verified_caller(x_tenant_id, x_user_role, x_identity_signature)
     try:
-        agent.clear_conversation_history(conversation_id)
+        agent.clear_conversation_history(conversation_id, identity)
         
         return {
             "message": f"Conversation history cleared for conversation {conversation_id}",
@@ -184,39 +357,24 @@ async def clear_conversation_history(
 @router.post(
     "/health",
     summary="Check agent health",
-    description="Check if the medical query agent is working properly"
+    description="Return the cached agent health status; does not run an LLM query"
 )
-async def check_agent_health(
-    agent: MedicalQueryAgent = Depends(get_medical_agent)
-) -> Dict[str, Any]:
+async def check_agent_health() -> Dict[str, Any]:
     """
     Check the health status of the medical query agent.
+    Reads the result of the background deep check so probes cost nothing.
     """
-    try:
-        # Test basic agent functionality
-        test_query = "How many patients are in the database?"
-        result = await agent.query(test_query, "health_check")
-        
-        return {
-            "status": "healthy" if result["status"] == "success" else "unhealthy",
-            "agent_initialized": agent.agent_executor is not None,
-            "llm_configured": agent.llm is not None,
-            "tools_available": len(agent.get_available_tools()),
-            "test_query_successful": result["status"] == "success",
-            "message": "Medical query agent is operational"
-        }
-        
-    except Exception as e:
-        logger.error(f"Agent health check failed: {e}")
-        return {
-            "status": "unhealthy",
-            "agent_initialized": False,
-            "llm_configured": False,
-            "tools_available": 0,
-            "test_query_successful": False,
-            "error": str(e),
-            "message": "Medical query agent has issues"
-        }
+    deep_status = health_monitor.deep_status()
+    agent_status = deep_status["checks"].get("agent", {})
+    
+    return {
+        "status": agent_status.get("status", deep_status["status"]),
+        "agent_initialized": agent_status.get("agent_initialized", False),
+        "llm_configured": agent_status.get("llm_initialized", False),
+        "tools_available": agent_status.get("tools_count", 0),
+        "checked_at": deep_status["checked_at"],
+        "message": "Medical query agent status from the last background health check"
+    }
 
 @router.post(
     "/load-sample-data",
@@ -228,10 +386,11 @@ async def load_sample_data() -> Dict[str, Any]:
     """
     Load sample patient data into the vector database for testing.
     """
+    _require_index_writer()
     try:
-        from app.services.vectorization_service import VectorizationService
+        from app.services.vectorization_service import get_shared_vectorization_service
         
-        vectorization_service = VectorizationService()
+        vectorization_service = get_shared_vectorization_service()
         
         # Try to get real patient data from database first
         try:
@@ -261,8 +420,9 @@ async def load_sample_data() -> Dict[str, Any]:
             ]
             data_source = "Sample Data (Database connection failed)"
         
-        # Load data into vector database
-        await vectorization_service._vectorize_all_patients(patient_descriptions)
+        # Load data into vector database (embedding calls run on the background budget, outside the chat slots)
+        async with background_admission_controller.slot():
+            await vectorization_service._rebuild_vector_database(patient_descriptions)
         
         return {
             "status": "success",
@@ -272,6 +432,10 @@ async def load_sample_data() -> Dict[str, Any]:
             "collection_used": "demographic_patients_namespace"
         }
         
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
+    except BuildInProgress as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except Exception as e:
         logger.error(f"Error loading sample data: {e}")
         raise HTTPException(
@@ -281,63 +445,56 @@ async def load_sample_data() -> Dict[str, Any]:
 
 @router.post(
     "/refresh-patient-data",
-    status_code=status.HTTP_200_OK,
+    status_code=status.HTTP_202_ACCEPTED,
     summary="Refresh patient data from database",
-    description="Manually refresh vectorized patient data from SQL Server database before starting a conversation"
+    description="Start a background job that refreshes vectorized patient data from SQL Server; poll /refresh-jobs/{job_id} for progress"
 )
 async def refresh_patient_data() -> Dict[str, Any]:
     """
-    Manually refresh patient data from database.
-    Use this endpoint before starting a conversation to ensure you have the latest patient data.
+    Refresh patient data from the database in a background job.
+    Returns at once with the job; if a refresh is already running, that job is returned instead.
+    Each batch of embeddings is stored and checkpointed, so an interrupted job resumes where it stopped.
     """
+    _require_index_writer()
     try:
-        from app.services.vectorization_service import VectorizationService
-        
-        vectorization_service = VectorizationService()
+        from app.services.refresh_jobs import refresh_job_manager
         
         logger.info("Manual refresh of patient data requested...")
-        
-        # Get real patient data from database
-        try:
-            real_patients = vectorization_service.db_service.get_patients_as_natural_language()
-            
-            if real_patients and len(real_patients) > 0:
-                # Use real patient data from database
-                logger.info(f"Found {len(real_patients)} patients in database")
-                patient_descriptions = real_patients
-                data_source = "SQL Server Database"
-            else:
-                return {
-                    "status": "warning",
-                    "message": "No patient data found in database",
-                    "patients_loaded": 0,
-                    "data_source": "Empty Database"
-                }
-                
-        except Exception as db_error:
-            logger.error(f"Could not load patient data: {db_error}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Database connection failed: {str(db_error)}"
-            )
-        
-        # Refresh data in vector database (this will detect changes automatically)
-        await vectorization_service._ensure_patient_data_in_vector_db(patient_descriptions)
-        
+        job = refresh_job_manager.start()
         return {
-            "status": "success",
-            "message": f"Successfully refreshed {len(patient_descriptions)} patients from database",
-            "patients_loaded": len(patient_descriptions),
-            "data_source": data_source,
-            "collection_used": "demographic_patients_namespace",
-            "refresh_timestamp": datetime.now().isoformat()
+            **job,
+            "status_url": f"/api/v1/agent/refresh-jobs/{job['job_id']}"
         }
         
-    except HTTPException:
-        raise
     except Exception as e:
-        logger.error(f"Error refreshing patient data: {e}")
+        logger.error(f"Error starting patient data refresh: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error refreshing patient data: {str(e)}"
         )
+
+@router.get(
+    "/refresh-jobs/{job_id}",
+    summary="Get refresh job status",
+    description="Status and progress (patients stored, batches, percent) of a patient data refresh job"
+)
+async def get_refresh_job(job_id: str) -> Dict[str, Any]:
+    from app.services.refresh_jobs import refresh_job_manager
+    
+    job = await asyncio.to_thread(refresh_job_manager.get, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Refresh job {job_id} not found"
+        )
+    return job
+
+@router.get(
+    "/refresh-jobs",
+    summary="List refresh jobs",
+    description="Most recent patient data refresh jobs, newest first"
+)
+async def list_refresh_jobs(limit: int = 20) -> Dict[str, Any]:
+    from app.services.refresh_jobs import refresh_job_manager
+    
+    return {"jobs": await asyncio.to_thread(refresh_job_manager.list_recent, min(limit, 100))}
@@ -1,21 +1,47 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, status
 from app.models.schemas import (
     VectorizationRequest,
     VectorizationResponse,
     VectorDocument,
     ErrorResponse,
-    HealthResponse
+    HealthResponse,
+    PatientSummaryResponse,
+    PatientDescriptionsPage
 )
-from app.services.vectorization_service import VectorizationService
+from app.services.vectorization_service import VectorizationService, get_shared_vectorization_service
+from app.services.index_shards import IndexShard
+from app.services.index_snapshot import SnapshotError, list_snapshots
+from app.services.index_versions import BuildInProgress
 from app.core.config import settings
+from app.core.health import health_monitor
+from app.core.identity import ClinicScopeRequired, clinic_scope, verify_identity
+import asyncio
+import os
 import time
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 router = APIRouter()
 
-# Dependency to get vectorization service
+# Dependency to get the shared vectorization service
 def get_vectorization_service() -> VectorizationService:
-    return VectorizationService()
+    return get_shared_vectorization_service()
+
+def _find_shard(vectorization_service: VectorizationService, clinic: Optional[str]) -> IndexShard:
+    shard = vectorization_service.find_shard(clinic)
+    if shard is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No index shard for clinic '{clinic}'")
+    return shard
+
+CLINIC_QUERY_DESCRIPTION = "Clinic/tenant whose index shard to use (INDEX_SHARD_COLUMN value); omit for the unsharded index"
+
+def check_vectorization_deep_health() -> Dict[str, Any]:
+    """Deep check run by the background health monitor (queries ChromaDB and SQL Server)."""
+    health_status = get_shared_vectorization_service().check_health()
+    healthy = (
+        health_status.get("chromadb_connection") == "healthy"
+        and health_status.get("database_connection") == "healthy"
+    )
+    return {"status": "healthy" if healthy else "unhealthy", **health_status}
 
 @router.post(
     "/search",
@@ -26,24 +52,34 @@ def get_vectorization_service() -> VectorizationService:
     responses={
         200: {"description": "Successful vectorization and search"},
         400: {"model": ErrorResponse, "description": "Bad request"},
+        403: {"model": ErrorResponse, "description": "Patient data is sharded by clinic and the caller identity is not signed"},
         500: {"model": ErrorResponse, "description": "Internal server error"}
     }
 )
 async def vectorize_and_search(
     request: VectorizationRequest,
+    x_tenant_id: Optional[str] = Header(default=None, description="Tenant (clinic) of the caller; limits the search to its shard when signed"),
+    x_user_role: Optional[str] = Header(default=None, description="Permission role of the caller"),
+    x_identity_signature: Optional[str] = Header(default=None, description="Gateway signature of X-Tenant-ID and X-User-Role"),
     vectorization_service: VectorizationService = Depends(get_vectorization_service)
 ) -> VectorizationResponse:
     """
     Vectorize a query and search for similar patient data.
     
     This endpoint:
-    1. Queries the SQL Server database for patient information
+    1. Reads patient information from the local replica of the SQL Server database
     2. Converts patient data to natural language descriptions
     3. Stores the descriptions in ChromaDB as vectors
     4. Takes a text query and converts it to vector embeddings using OpenAI
-    5. Searches for similar patient descriptions in ChromaDB
+    5. Searches for similar patient descriptions in ChromaDB: only the shard of the
+       caller's verified clinic when the index is sharded
     6. Returns the most relevant patient information with similarity scores
     """
+    try:
+        clinic = clinic_scope(verify_identity(x_tenant_id, x_user_role, x_identity_signature))
+    except ClinicScopeRequired as e:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
+    
     try:
         start_time = time.time()
         
@@ -52,7 +88,8 @@ async def vectorize_and_search(
             query=request.query,
             top_k=request.top_k or 5,
             similarity_threshold=request.similarity_threshold or 0.7,
-            collection_name=request.collection_name
+            collection_name=request.collection_name,
+            clinic=clinic
         )
         
         # Format response
@@ -87,20 +124,18 @@ async def vectorize_and_search(
     summary="Check vectorization service health",
     description="Check the health status of vectorization components including database connectivity"
 )
-async def check_vectorization_health(
-    vectorization_service: VectorizationService = Depends(get_vectorization_service)
-) -> HealthResponse:
+async def check_vectorization_health() -> HealthResponse:
     """
     Check the health of vectorization components.
     
-    Validates:
+    Returns the cached result of the background deep check, which validates:
     - Vector database connection
     - OpenAI API connectivity
     - SQL Server database connection
     - Service status
     """
     try:
-        health_status = vectorization_service.check_health()
+        health_status = health_monitor.deep_status()["checks"].get("vectorization", {})
         
         return HealthResponse(
             status=health_status.get("vectorization_service", "unknown"),
@@ -139,10 +174,149 @@ async def list_collections(
             detail=f"Error listing collections: {str(e)}"
         )
 
+@router.get(
+    "/index/shards",
+    summary="List demographic index shards",
+    description="One demographic index per clinic/tenant when INDEX_SHARD_COLUMN is set"
+)
+async def list_index_shards(
+    vectorization_service: VectorizationService = Depends(get_vectorization_service)
+) -> Dict[str, Any]:
+    def describe_shards():
+        return [
+            {"shard": shard.key, "collection": shard.collection.name, "documents": shard.collection.count()}
+            for shard in vectorization_service.get_search_shards()
+        ]
+    
+    try:
+        shards = await asyncio.to_thread(describe_shards)
+        return {"shard_column": settings.INDEX_SHARD_COLUMN, "shards": shards, "total_shards": len(shards)}
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error listing index shards: {str(e)}"
+        )
+
+@router.get(
+    "/index/versions",
+    summary="List demographic index versions",
+    description="Versions of the demographic collection kept for rollback, and which one searches use"
+)
+async def list_index_versions(
+    clinic: Optional[str] = Query(default=None, description=CLINIC_QUERY_DESCRIPTION),
+    vectorization_service: VectorizationService = Depends(get_vectorization_service)
+) -> Dict[str, Any]:
+    shard = _find_shard(vectorization_service, clinic)
+    try:
+        versions = await asyncio.to_thread(shard.versions.list_versions)
+        return {"versions": versions, "total_versions": len(versions)}
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error listing index versions: {str(e)}"
+        )
+
+@router.post(
+    "/index/rollback",
+    summary="Roll back the demographic index",
+    description="Make the previous version of the demographic collection active again"
+)
+async def rollback_index(
+    clinic: Optional[str] = Query(default=None, description=CLINIC_QUERY_DESCRIPTION),
+    vectorization_service: VectorizationService = Depends(get_vectorization_service)
+) -> Dict[str, Any]:
+    if not settings.CHROMA_INDEX_WRITER:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="This node only reads the vector index (CHROMA_INDEX_WRITER=false); run the rollback on the writer node"
+        )
+    shard = _find_shard(vectorization_service, clinic)
+    try:
+        active = await asyncio.to_thread(vectorization_service.rollback_index, shard.key)
+        return {"status": "success", "active_version": active}
+        
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error rolling back index: {str(e)}"
+        )
+
+@router.get(
+    "/index/snapshots",
+    summary="List index snapshots",
+    description="Exported snapshots of the demographic index, newest first"
+)
+async def list_index_snapshots() -> Dict[str, Any]:
+    try:
+        snapshots = await asyncio.to_thread(list_snapshots, settings.INDEX_SNAPSHOT_DIR)
+        return {"snapshots": snapshots, "total_snapshots": len(snapshots)}
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error listing index snapshots: {str(e)}"
+        )
+
+@router.post(
+    "/index/snapshots",
+    summary="Export an index snapshot",
+    description="Write the active demographic index as .npy vectors, Parquet records and a manifest"
+)
+async def export_index_snapshot(
+    float16: Optional[bool] = Query(default=None, description="Store vectors as float16; defaults to INDEX_SNAPSHOT_FLOAT16"),
+    clinic: Optional[str] = Query(default=None, description=CLINIC_QUERY_DESCRIPTION),
+    vectorization_service: VectorizationService = Depends(get_vectorization_service)
+) -> Dict[str, Any]:
+    shard = _find_shard(vectorization_service, clinic)
+    try:
+        return await asyncio.to_thread(vectorization_service.export_index_snapshot, float16, shard.key)
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error exporting index snapshot: {str(e)}"
+        )
+
+@router.post(
+    "/index/snapshots/{snapshot_id}/import",
+    summary="Import an index snapshot",
+    description="Replace the demographic index with a snapshot from INDEX_SNAPSHOT_DIR, without embedding calls"
+)
+async def import_index_snapshot(
+    snapshot_id: str,
+    vectorization_service: VectorizationService = Depends(get_vectorization_service)
+) -> Dict[str, Any]:
+    if not settings.CHROMA_INDEX_WRITER:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="This node only reads the vector index (CHROMA_INDEX_WRITER=false); run the import on the writer node"
+        )
+    # Only snapshots inside the snapshot directory can be imported
+    if os.path.basename(snapshot_id) != snapshot_id or snapshot_id in ("", ".", ".."):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid snapshot id")
+    snapshot_dir = os.path.join(settings.INDEX_SNAPSHOT_DIR, snapshot_id)
+    if not os.path.isdir(snapshot_dir):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Snapshot {snapshot_id} not found")
+    try:
+        return await asyncio.to_thread(vectorization_service.import_index_snapshot, snapshot_dir)
+        
+    except (SnapshotError, BuildInProgress) as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error importing index snapshot: {str(e)}"
+        )
+
 @router.get(
     "/patients/summary",
+    response_model=PatientSummaryResponse,
     summary="Get patient data summary",
-    description="Get summary of patient data from the SQL Server database"
+    description="Aggregate statistics of the patient data; constant size whatever the number of patients"
 )
 async def get_patient_summary(
     vectorization_service: VectorizationService = Depends(get_vectorization_service)
@@ -153,14 +327,52 @@ async def get_patient_summary(
     Returns:
     - Total number of patients
     - Statistics about contact information
-    - Sample patient descriptions in natural language
+    - Age-bucket and gender histograms
+    
+    Patient descriptions are served page by page by /patients/descriptions.
     """
     try:
-        summary = await vectorization_service.get_patient_data_summary()
-        return summary
+        return await asyncio.to_thread(vectorization_service.db_service.get_patient_aggregates)
         
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error getting patient summary: {str(e)}"
         )
+
+@router.get(
+    "/patients/descriptions",
+    response_model=PatientDescriptionsPage,
+    summary="List patient descriptions",
+    description="Patients described in natural language, one page at a time"
+)
+async def list_patient_descriptions(
+    cursor: int = Query(default=0, ge=0, description="`next_cursor` of the previous page; 0 for the first page"),
+    limit: int = Query(default=50, ge=1, le=500, description="Patients per page"),
+    vectorization_service: VectorizationService = Depends(get_vectorization_service)
+) -> Dict[str, Any]:
+    """
+    Page through the patients ordered by ID. Each page costs the same however
+    far into the table it is, so clients can walk large patient lists.
+    """
+    try:
+        db_service = vectorization_service.db_service
+        patients = await asyncio.to_thread(db_service.get_patients_page, cursor, limit)
+        # The total comes from the maintained aggregates, never from a COUNT per page
+        aggregates = await asyncio.to_thread(db_service.get_patient_aggregates)
+        descriptions = db_service.convert_patients_to_natural_language(patients)
+        
+        return {
+            "items": [
+                {"patient_id": patient["patient_id"], "description": description}
+                for patient, description in zip(patients, descriptions)
+            ],
+            "total_patients": aggregates["total_patients"],
+            "next_cursor": patients[-1]["patient_id"] if len(patients) == limit else None
+        }
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error listing patient descriptions: {str(e)}"
+        )
@@ -0,0 +1,122 @@
+from typing import Any, Deque, Dict
+from collections import deque
+from contextlib import asynccontextmanager
+from app.core.config import settings
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; the caller should retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Limits concurrent LLM-bound work.
+    Up to `max_in_flight` requests run at once; up to `max_queue` more wait in
+    arrival order. Beyond that, or after waiting `queue_timeout_seconds`, requests
+    are rejected immediately so the caller can answer 429 instead of piling more
+    work on OpenAI. Endpoints that do not call the LLM never go through the controller.
+    Background work has its own controller instead of a lower priority in this one.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        max_queue: int = 32,
+        queue_timeout_seconds: float = 30,
+        retry_after_seconds: int = 5
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.retry_after_seconds = retry_after_seconds
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.rejected = 0
+
+    def _queued(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    def is_saturated(self) -> bool:
+        """True when a new request would be rejected right away."""
+        return self._in_flight >= self.max_in_flight and self._queued() >= self.max_queue
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        logger.warning(f"Request rejected by admission control: {reason}")
+        raise AdmissionRejected(reason, self.retry_after_seconds)
+
+    async def acquire(self):
+        """Wait for a slot; raises AdmissionRejected when the queue is full or the wait times out."""
+        if self._in_flight < self.max_in_flight and not self._queued():
+            self._in_flight += 1
+            self.admitted += 1
+            return
+
+        if self._queued() >= self.max_queue:
+            self._reject(f"queue full ({self.max_queue} waiting)")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout_seconds)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self.release()
+            else:
+                waiter.cancel()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject(f"waited more than {self.queue_timeout_seconds}s for a slot")
+        self.admitted += 1
+
+    def release(self):
+        """Free a slot, handing it directly to the next waiter if there is one."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self._in_flight,
+            "queued": self._queued(),
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected
+        }
+
+# Process-wide controller shared by every chat
+admission_controller = AdmissionController(
+    max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    queue_timeout_seconds=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    retry_after_seconds=settings.ADMISSION_RETRY_AFTER_SECONDS
+)
+
+# Separate budget for background work (refresh embeddings, history summaries), so it neither holds a chat slot nor is rejected by chat load
+background_admission_controller = AdmissionController(
+    max_in_flight=settings.ADMISSION_BACKGROUND_MAX_IN_FLIGHT,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    queue_timeout_seconds=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    retry_after_seconds=settings.ADMISSION_RETRY_AFTER_SECONDS
+)
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 import os
 from dotenv import load_dotenv
 
@@ -19,6 +19,7 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL: str = "gpt-4"
     OPENAI_EMBEDDING_MODEL: str = "text-embedding-3-small"
+    OPENAI_BASE_URL: Optional[str] = None  # OpenAI-compatible endpoint (e.g. the load-test fake server)
     
     # SQL Server Database Configuration
     DB_SERVER: str = "medbotserver.database.windows.net"
@@ -27,15 +28,109 @@ class Settings(BaseSettings):
     DB_PASSWORD: str = "Admin123!"
     DB_DRIVER: str = "ODBC Driver 18 for SQL Server"  # Try version 18 first, fallback to 17
     
+    # Local Patients Read Replica (SQLite)
+    PATIENT_REPLICA_ENABLED: bool = True
+    PATIENT_REPLICA_PATH: str = "./patient_replica.db"
+    PATIENT_REPLICA_STANDALONE: bool = False  # Skip SQL Server and serve only from the replica (tests/benchmarks)
+    
+    # Patient Record Cache (read-through, invalidated by the sync job)
+    PATIENT_CACHE_MAX_SIZE: int = 5000
+    PATIENT_CACHE_TTL_SECONDS: int = 300
+    
     # ChromaDB Configuration
+    CHROMA_MODE: str = "persistent"  # "persistent" (embedded, CHROMA_DB_PATH) or "http" (shared Chroma server)
     CHROMA_DB_PATH: str = "./chroma_db"
+    CHROMA_HOST: str = "localhost"
+    CHROMA_PORT: int = 8001
+    CHROMA_SSL: bool = False
+    CHROMA_AUTH_TOKEN: Optional[str] = None  # Sent as a bearer token to the Chroma server
+    CHROMA_HTTP_MAX_CONNECTIONS: int = 20  # Pooled connections per process
+    CHROMA_HTTP_KEEPALIVE_SECONDS: float = 40
+    CHROMA_INDEX_WRITER: bool = True  # False on stateless nodes; only writers (re)build the index
     CHROMA_COLLECTION_NAME: str = "medbot_documents"
     CHROMA_DEMOGRAPHIC_COLLECTION: str = "demographic_patients_namespace"
     
+    # Index Versions (rebuilds fill a new collection; the active pointer is swapped when complete)
+    CHROMA_INDEX_REGISTRY_COLLECTION: str = "medbot_index_registry"
+    INDEX_KEEP_VERSIONS: int = 2  # Including the active one, so one version is available for rollback
+    INDEX_POINTER_REFRESH_SECONDS: float = 5  # How often other processes notice a swap or a new shard
+    INDEX_BUILD_LEASE_SECONDS: float = 300  # Renewed after every batch; a second build is rejected until it expires
+    
+    # Index Shards (one demographic index per clinic/tenant)
+    INDEX_SHARD_COLUMN: Optional[str] = None  # Patients column holding the clinic/tenant, e.g. "ClinicId"; unset keeps a single index
+    INDEX_FANOUT_MAX_CONCURRENCY: int = 8  # Shards searched at once by cross-clinic queries
+    
+    # Index Snapshots (portable copy of the demographic index for starting new nodes)
+    INDEX_SNAPSHOT_DIR: str = "./index_snapshots"
+    INDEX_SNAPSHOT_FLOAT16: bool = False  # Half-size vectors; distances change by about 1e-3
+    INDEX_SNAPSHOT_KEEP: int = 3  # Per shard
+    INDEX_SNAPSHOT_IMPORT_PATH: Optional[str] = None  # Snapshot directory imported at startup when the index is empty
+    INDEX_SNAPSHOT_IMPORT_BATCH_SIZE: int = 1000
+    
     # Vector Search Configuration
     VECTOR_SEARCH_TOP_K: int = 5
     SIMILARITY_THRESHOLD: float = 0.7
     
+    # Intent Router (answers simple queries without the LLM)
+    INTENT_ROUTER_ENABLED: bool = True  # Not used for clinic-scoped queries when INDEX_SHARD_COLUMN is set
+    
+    # Semantic Response Cache (scoped by verified tenant, role and patient data version)
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 1000
+    SEMANTIC_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+    SEMANTIC_CACHE_TTL_SECONDS: int = 3600
+    
+    # Caller Identity (X-Tenant-ID/X-User-Role signed by the authenticating gateway)
+    IDENTITY_SIGNING_SECRET: Optional[str] = None  # Without it, or with a bad signature, answers are not cached and sharded data is refused
+    
+    # Conversation Sessions
+    SESSION_MAX_CONVERSATIONS: int = 1000  # LRU eviction beyond this many sessions
+    SESSION_MAX_MESSAGES: int = 50  # Per-session message cap (oldest dropped first)
+    SESSION_MAX_TOKENS: int = 16000  # Per-session token cap
+    SESSION_IDLE_TTL_SECONDS: int = 3600
+    SESSION_PERSISTENCE: str = "memory"  # "memory" or "sqlite"
+    SESSION_DB_PATH: str = "./sessions.db"
+    
+    # Prompt History (token budget; older turns are summarized in the background)
+    HISTORY_TOKEN_BUDGET: int = 1500
+    HISTORY_SUMMARY_MAX_TOKENS: int = 300
+
+    # Agent Tool Output
+    TOOL_OUTPUT_MODE: str = "compact"  # "compact" (dense JSON) or "verbose" (formatted text)
+    TOOL_MAX_RESULTS: int = 10  # Upper bound on patients returned by a single tool call
+    
+    # Admission Control (concurrent LLM-bound requests)
+    ADMISSION_MAX_IN_FLIGHT: int = 8
+    ADMISSION_MAX_QUEUE: int = 32  # Requests waiting beyond this are rejected with 429
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 30
+    ADMISSION_RETRY_AFTER_SECONDS: int = 5
+    ADMISSION_BACKGROUND_MAX_IN_FLIGHT: int = 1  # Refreshes and sample loads have their own slots and never take a chat's
+
+    # Startup
+    STARTUP_WARMUP_ENABLED: bool = True  # Build the agent and preload the index at startup; readiness waits for it
+    STARTUP_WARMUP_RETRY_SECONDS: int = 30  # Wait before retrying a failed warm-up; not ready meanwhile
+
+    # Patient Data Refresh Jobs
+    VECTORIZATION_BATCH_SIZE: int = 100  # Descriptions per embeddings call; each batch is stored and checkpointed
+    REFRESH_JOB_DB_PATH: str = "./refresh_jobs.db"
+    REFRESH_JOB_LEASE_SECONDS: float = 120  # Renewed every third of this; a job whose owner stops renewing is resumed elsewhere
+
+    # Shared Index (memory-mapped copy of the demographic collection read by every worker process)
+    SHARED_INDEX_ENABLED: bool = True
+    SHARED_INDEX_PATH: str = "./shared_index"
+
+    # Tracing (Chrome trace events; open the file in chrome://tracing or Perfetto)
+    TRACING_ENABLED: bool = False
+    TRACE_FILE_PATH: str = "./traces.json"  # Empty to keep spans only in memory
+    TRACE_BUFFER_REQUESTS: int = 200  # Recent requests kept for /debug/traces/{request_id}
+
+    # Response Compression
+    GZIP_MINIMUM_SIZE: int = 1024  # Bytes; smaller responses are sent uncompressed
+    GZIP_COMPRESS_LEVEL: int = 5
+
+    # Health Checks
+    HEALTH_DEEP_CHECK_INTERVAL_SECONDS: int = 60  # Background interval of the deep (connectivity) check
+    
     # Logging Configuration
     LOG_LEVEL: str = "INFO"
     
@@ -0,0 +1,119 @@
+from typing import Any, Callable, Dict, Optional
+from datetime import datetime
+from app.core.config import settings
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Component statuses that make the deep check report the service as unhealthy
+FAILED_STATUSES = {"unhealthy", "error"}
+
+class HealthMonitor:
+    """
+    Health probes split by cost:
+    - liveness: the process is serving requests (constant response)
+    - readiness: shared clients are initialized (attribute checks only)
+    - deep: real connectivity checks run on a background timer; probes read the cached result
+    """
+
+    def __init__(self, interval_seconds: float = 60.0):
+        self.interval_seconds = interval_seconds
+        self.started_at = time.time()
+        self._readiness_checks: Dict[str, Callable[[], bool]] = {}
+        self._readiness_errors: Dict[str, str] = {}
+        self._deep_checks: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._deep_result: Dict[str, Any] = {
+            "status": "pending",
+            "checks": {},
+            "checked_at": None,
+            "duration_ms": None
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    def register_readiness_check(self, name: str, check: Callable[[], bool]):
+        """Register a cheap, non-blocking check that returns True once the component is usable."""
+        self._readiness_checks[name] = check
+
+    def set_readiness_error(self, name: str, error: Optional[str]):
+        """Report why a readiness component is failing (None clears it); shown in the readiness payload."""
+        if error is None:
+            self._readiness_errors.pop(name, None)
+        else:
+            self._readiness_errors[name] = error
+
+    def register_deep_check(self, name: str, check: Callable[[], Dict[str, Any]]):
+        """Register a blocking connectivity check; it only ever runs in the background loop."""
+        self._deep_checks[name] = check
+
+    def liveness(self) -> Dict[str, Any]:
+        return {
+            "status": "alive",
+            "uptime_seconds": round(time.time() - self.started_at, 3)
+        }
+
+    def readiness(self) -> Dict[str, Any]:
+        components = {}
+        for name, check in self._readiness_checks.items():
+            try:
+                components[name] = bool(check())
+            except Exception:
+                components[name] = False
+
+        readiness = {
+            "status": "ready" if all(components.values()) else "not_ready",
+            "components": components
+        }
+        if self._readiness_errors:
+            readiness["errors"] = dict(self._readiness_errors)
+        return readiness
+
+    def deep_status(self) -> Dict[str, Any]:
+        """Result of the last background deep check (never triggers a new one)."""
+        return self._deep_result
+
+    async def run_deep_checks(self) -> Dict[str, Any]:
+        start_time = time.time()
+        checks = {}
+
+        for name, check in self._deep_checks.items():
+            try:
+                checks[name] = await asyncio.to_thread(check)
+            except Exception as e:
+                logger.error(f"Deep health check '{name}' failed: {e}")
+                checks[name] = {"status": "error", "error": str(e)}
+
+        failed = [name for name, result in checks.items() if result.get("status") in FAILED_STATUSES]
+        self._deep_result = {
+            "status": "unhealthy" if failed else "healthy",
+            "checks": checks,
+            "checked_at": datetime.now().isoformat(),
+            "duration_ms": (time.time() - start_time) * 1000
+        }
+        return self._deep_result
+
+    async def _run_forever(self):
+        while True:
+            try:
+                await self.run_deep_checks()
+            except Exception as e:
+                logger.error(f"Error running deep health checks: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+            logger.info(f"Deep health checks scheduled every {self.interval_seconds}s")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+# Process-wide monitor used by the probe endpoints
+health_monitor = HealthMonitor(interval_seconds=settings.HEALTH_DEEP_CHECK_INTERVAL_SECONDS)
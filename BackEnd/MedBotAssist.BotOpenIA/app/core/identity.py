@@ -0,0 +1,43 @@
+from typing import NamedTuple, Optional
+from app.core.config import settings
+import hashlib
+import hmac
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CallerIdentity(NamedTuple):
+    tenant_id: str
+    role: str
+
+class ClinicScopeRequired(PermissionError):
+    """The index is sharded by clinic and the caller has no verified tenant to scope the query to."""
+
+def sign_identity(tenant_id: str, role: str, secret: str) -> str:
+    """Signature the authenticating gateway sends in X-Identity-Signature."""
+    return hmac.new(secret.encode("utf-8"), f"{tenant_id}\n{role}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+def verify_identity(tenant_id: Optional[str], role: Optional[str], signature: Optional[str]) -> Optional[CallerIdentity]:
+    """
+    Tenant and role of the caller when the gateway that authenticated the user signed
+    them with IDENTITY_SIGNING_SECRET; None when they are missing or not signed, since
+    plain headers can be set by anyone.
+    """
+    if not settings.IDENTITY_SIGNING_SECRET or not tenant_id or not role or not signature:
+        return None
+    expected = sign_identity(tenant_id, role, settings.IDENTITY_SIGNING_SECRET)
+    if not hmac.compare_digest(expected, signature):
+        logger.warning(f"Rejected identity signature for tenant {tenant_id}")
+        return None
+    return CallerIdentity(tenant_id, role)
+
+def clinic_scope(identity: Optional[CallerIdentity]) -> Optional[str]:
+    """
+    Clinic a query may read: the verified tenant of the caller. On an index sharded by
+    clinic a caller without one is rejected instead of searching every clinic.
+    """
+    if identity is None:
+        if settings.INDEX_SHARD_COLUMN:
+            raise ClinicScopeRequired("A signed X-Tenant-ID is required when patient data is sharded by clinic")
+        return None
+    return identity.tenant_id
@@ -0,0 +1,116 @@
+from typing import Any, Callable, Dict, Iterator, Tuple
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Request and dependency latencies (seconds)
+REQUEST_LATENCY = Histogram(
+    "medbot_http_request_duration_seconds",
+    "HTTP request latency until the response starts",
+    ["method", "route", "status"]
+)
+EMBEDDING_LATENCY = Histogram(
+    "medbot_embedding_duration_seconds",
+    "OpenAI embeddings call latency"
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "medbot_embedding_batch_size",
+    "Texts sent per embeddings call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+)
+CHROMA_QUERY_LATENCY = Histogram(
+    "medbot_chroma_query_duration_seconds",
+    "ChromaDB operation latency",
+    ["operation"]
+)
+SQL_QUERY_LATENCY = Histogram(
+    "medbot_sql_query_duration_seconds",
+    "Patient database statement latency",
+    ["backend"]
+)
+LLM_CALL_LATENCY = Histogram(
+    "medbot_llm_call_duration_seconds",
+    "Chat model call latency",
+    ["model"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+)
+LLM_TOKENS = Counter(
+    "medbot_llm_tokens",
+    "Chat model tokens by direction (input = prompt, output = completion)",
+    ["model", "direction"]
+)
+TOOL_LATENCY = Histogram(
+    "medbot_tool_duration_seconds",
+    "Agent tool call latency",
+    ["tool", "status"]
+)
+
+class CacheStatsCollector:
+    """Exports hits, misses and hit rate of registered caches from their stats() at scrape time."""
+
+    def __init__(self):
+        self._caches: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, stats: Callable[[], Dict[str, Any]]):
+        with self._lock:
+            self._caches[name] = stats
+
+    def collect(self) -> Iterator[Any]:
+        hits = CounterMetricFamily("medbot_cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("medbot_cache_misses", "Cache misses", labels=["cache"])
+        hit_rate = GaugeMetricFamily("medbot_cache_hit_rate", "Cache hit rate since start", labels=["cache"])
+        with self._lock:
+            caches = list(self._caches.items())
+        for name, stats_fn in caches:
+            try:
+                stats = stats_fn()
+            except Exception as e:
+                logger.warning(f"Could not read stats of cache {name}: {e}")
+                continue
+            hits.add_metric([name], stats.get("hits", 0))
+            misses.add_metric([name], stats.get("misses", 0))
+            hit_rate.add_metric([name], stats.get("hit_rate", 0.0))
+        yield hits
+        yield misses
+        yield hit_rate
+
+cache_stats_collector = CacheStatsCollector()
+REGISTRY.register(cache_stats_collector)
+
+def instrument_sqlalchemy(engine, backend: str = "sqlserver"):
+    """Time every statement executed through `engine`."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("medbot_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["medbot_query_start"].pop()
+        SQL_QUERY_LATENCY.labels(backend).observe(time.perf_counter() - start)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        # Failed statements never reach after_cursor_execute; drop their start time so the stack stays aligned
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("medbot_query_start"):
+            conn.info["medbot_query_start"].pop()
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Current metrics in the Prometheus text format, with its content type."""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+    # Under gunicorn each worker writes its samples to the shared directory; aggregate all of them.
+    # Cache stats live in process memory, so they describe the worker that answered the scrape.
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(cache_stats_collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,23 @@
+from typing import Any
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.types import Receive, Scope, Send
+import orjson
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson; several times faster than the standard library encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    Streaming response that closes its async generator as soon as the response ends,
+    including when the client disconnects, so the generator's finally blocks run then
+    instead of whenever it is garbage collected.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
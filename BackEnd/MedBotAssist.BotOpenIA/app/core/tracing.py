@@ -0,0 +1,161 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from app.core.config import settings
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Request being handled and innermost open span; copied into asyncio tasks and to_thread calls
+current_request_id: ContextVar[Optional[str]] = ContextVar("current_request_id", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+class Span:
+    __slots__ = ("name", "category", "span_id", "parent_id", "request_id", "start", "attributes")
+
+    def __init__(self, name: str, category: str, span_id: int, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.category = category
+        self.span_id = span_id
+        self.parent_id = parent.span_id if parent else None
+        self.request_id = current_request_id.get()
+        self.start = time.perf_counter()
+        self.attributes = attributes
+
+class Tracer:
+    """
+    Records spans as Chrome trace events ("X" complete events).
+    Finished spans are appended to a JSON trace file that chrome://tracing and
+    Perfetto open directly, and the spans of the most recent requests are kept in
+    memory so a single request can be fetched as its own flame view. Each request
+    gets its own track (tid), so nested spans stack under the HTTP span.
+    """
+
+    def __init__(self, enabled: bool = False, path: Optional[str] = None, buffer_requests: int = 200):
+        self.enabled = enabled
+        self.path = path
+        self.buffer_requests = buffer_requests
+        self._requests: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._tracks: Dict[str, int] = {}
+        self._span_ids = itertools.count(1)
+        self._track_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._file = None
+        # Trace timestamps are microseconds on the perf_counter clock
+        self._epoch = time.perf_counter()
+
+    def _open_file(self):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, "a", encoding="utf-8")
+        if new_file:
+            # The JSON array format may be left unterminated, so events can be appended as they finish
+            self._file.write("[\n")
+
+    def _track(self, request_id: Optional[str]) -> int:
+        if request_id is None:
+            return 0
+        track = self._tracks.get(request_id)
+        if track is None:
+            track = self._tracks[request_id] = next(self._track_ids)
+        return track
+
+    def start_span(self, name: str, category: str, **attributes: Any) -> Span:
+        return Span(name, category, next(self._span_ids), _current_span.get(), attributes)
+
+    def finish_span(self, span: Span, end: Optional[float] = None, **attributes: Any):
+        self.record(span, span.start, end if end is not None else time.perf_counter(), **attributes)
+
+    def record(self, span: Span, start: float, end: float, **attributes: Any):
+        """Store one finished span."""
+        event = {
+            "name": span.name,
+            "cat": span.category,
+            "ph": "X",
+            "ts": round((start - self._epoch) * 1_000_000, 1),
+            "dur": round((end - start) * 1_000_000, 1),
+            "pid": os.getpid(),
+            "args": {
+                "request_id": span.request_id,
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                **span.attributes,
+                **attributes
+            }
+        }
+        try:
+            with self._lock:
+                event["tid"] = self._track(span.request_id)
+                if span.request_id is not None:
+                    self._requests.setdefault(span.request_id, []).append(event)
+                    self._requests.move_to_end(span.request_id)
+                    while len(self._requests) > self.buffer_requests:
+                        evicted, _ = self._requests.popitem(last=False)
+                        self._tracks.pop(evicted, None)
+                if self.path:
+                    if self._file is None:
+                        self._open_file()
+                    self._file.write(json.dumps(event, default=str) + ",\n")
+                    self._file.flush()
+        except Exception as e:
+            logger.warning(f"Could not record span {span.name}: {e}")
+
+    def get_request_trace(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """Spans of one recent request as a Chrome trace document."""
+        with self._lock:
+            events = self._requests.get(request_id)
+            return {"traceEvents": list(events), "displayTimeUnit": "ms"} if events is not None else None
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+tracer = Tracer(
+    enabled=settings.TRACING_ENABLED,
+    path=settings.TRACE_FILE_PATH or None,
+    buffer_requests=settings.TRACE_BUFFER_REQUESTS
+)
+
+@contextmanager
+def span(name: str, category: str = "app", **attributes: Any) -> Iterator[Optional[Span]]:
+    """Trace the enclosed block as a child of the current span."""
+    if not tracer.enabled:
+        yield None
+        return
+    current = tracer.start_span(name, category, **attributes)
+    token = _current_span.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        tracer.finish_span(current, **({"error": error} if error else {}))
+
+def traced(name: str, category: str = "app") -> Callable:
+    """Decorator form of `span` for sync and async functions."""
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, category):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
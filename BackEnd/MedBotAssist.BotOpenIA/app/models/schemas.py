@@ -94,3 +94,19 @@ class ConversationHistoryResponse(BaseModel):
     messages: List[Dict[str, Any]] = Field(..., description="Conversation messages")
     total_messages: int = Field(..., description="Total number of messages")
     timestamp: datetime = Field(default_factory=datetime.utcnow, description="Response timestamp")
+
+class PatientSummaryResponse(BaseModel):
+    total_patients: int = Field(..., description="Total number of patients")
+    patients_with_email: int = Field(..., description="Patients with an email address")
+    patients_with_phone: int = Field(..., description="Patients with a phone number")
+    age_buckets: Dict[str, int] = Field(..., description="Patients per age bucket (age reached this year)")
+    gender: Dict[str, int] = Field(..., description="Patients per gender")
+
+class PatientDescription(BaseModel):
+    patient_id: int = Field(..., description="Patient ID")
+    description: str = Field(..., description="Patient described in natural language")
+
+class PatientDescriptionsPage(BaseModel):
+    items: List[PatientDescription] = Field(..., description="Patients of this page, ordered by ID")
+    total_patients: int = Field(..., description="Total number of patients")
+    next_cursor: Optional[int] = Field(default=None, description="Pass as `cursor` to get the next page; null on the last page")
@@ -1,19 +1,67 @@
 from typing import List, Dict, Any, Optional
-import pyodbc
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, bindparam
 from sqlalchemy.engine import Engine
 from app.core.config import settings
+from app.core.cache import TTLCache
+from app.core.metrics import cache_stats_collector, instrument_sqlalchemy
+from app.core.tracing import traced
+from app.services.patient_aggregates import summarize_rows
+from app.services.patient_replica import PatientReplica
 import logging
+import re
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Maximum IDs per IN (...) query; SQL Server allows at most 2100 parameters per statement
+ID_BATCH_SIZE = 1000
+
+def _shard_column_sql() -> str:
+    """Extra select list item reading the clinic/tenant column that shards the index, if configured."""
+    column = settings.INDEX_SHARD_COLUMN
+    if not column:
+        return ""
+    # The column name comes from configuration and is inlined in the query
+    if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", column):
+        raise ValueError(f"Invalid INDEX_SHARD_COLUMN '{column}'")
+    return f",\n                    [{column}] AS ShardKey"
+
+# Read-through cache of patient records keyed by PatientId, shared by all service instances
+patient_record_cache = TTLCache(
+    max_size=settings.PATIENT_CACHE_MAX_SIZE,
+    ttl_seconds=settings.PATIENT_CACHE_TTL_SECONDS
+)
+cache_stats_collector.register("patient_record", patient_record_cache.stats)
+
+# SQL Server aggregates when there is no replica; kept until the next sync changes the data
+patient_aggregates_cache = TTLCache(max_size=1, ttl_seconds=settings.PATIENT_CACHE_TTL_SECONDS)
+cache_stats_collector.register("patient_aggregates", patient_aggregates_cache.stats)
+
 class DatabaseService:
     """Service for handling database operations."""
     
     def __init__(self):
         self.engine: Optional[Engine] = None
-        self._initialize_connection()
+        self.replica: Optional[PatientReplica] = None
+        
+        if settings.PATIENT_REPLICA_ENABLED or settings.PATIENT_REPLICA_STANDALONE:
+            self.replica = PatientReplica(settings.PATIENT_REPLICA_PATH)
+        
+        if settings.PATIENT_REPLICA_STANDALONE:
+            logger.info("Database service running in standalone replica mode (SQL Server disabled)")
+        else:
+            self._initialize_connection()
+    
+    def get_active_replica(self) -> Optional[PatientReplica]:
+        """Return the replica when it can serve reads, i.e. it has completed at least one sync."""
+        if self.replica is None:
+            return None
+        try:
+            if settings.PATIENT_REPLICA_STANDALONE or self.replica.is_populated():
+                return self.replica
+        except Exception as e:
+            logger.warning(f"Patient replica unavailable, falling back to SQL Server: {e}")
+        return None
     
     def _initialize_connection(self):
         drivers_to_try = [
@@ -41,6 +89,7 @@ class DatabaseService:
                     pool_pre_ping=True,
                     pool_recycle=3600
                 )
+                instrument_sqlalchemy(self.engine)
                 
                 # Test connection
                 with self.engine.connect() as conn:
@@ -56,15 +105,21 @@ class DatabaseService:
         # If all drivers failed, raise the last exception
         raise Exception("Could not connect to database with any available ODBC driver. Please ensure SQL Server ODBC drivers are installed.")
     
+    @traced("db.get_all_patients", "db")
     def get_all_patients(self) -> List[Dict[str, Any]]:
+        """Read every patient from SQL Server, the source of truth for the replica sync."""
+        if settings.PATIENT_REPLICA_STANDALONE:
+            return self.replica.get_all_patients()
+        
         try:
-            query = text("""
+            query = text(f"""
                 SELECT 
+                    PatientId,
                     FullName,
                     IdentificationNumber,
                     BirthDate,
                     Phone,
-                    Email
+                    Email{_shard_column_sql()}
                 FROM Patients
                 ORDER BY FullName
             """)
@@ -75,11 +130,13 @@ class DatabaseService:
                 
                 for row in result:
                     patient = {
+                        "patient_id": row.PatientId,
                         "full_name": row.FullName,
                         "identification_number": row.IdentificationNumber,
                         "birth_date": row.BirthDate,
                         "phone": row.Phone,
-                        "email": row.Email
+                        "email": row.Email,
+                        "shard": getattr(row, "ShardKey", None)
                     }
                     patients.append(patient)
                 
@@ -90,42 +147,135 @@ class DatabaseService:
             logger.error(f"Error retrieving patients: {e}")
             raise
     
+    def get_replica_patients(self) -> List[Dict[str, Any]]:
+        """
+        Every patient for interactive paths: from the replica once it has synced, from
+        SQL Server only before that. Never syncs; refresh jobs keep the replica current.
+        """
+        replica = self.get_active_replica()
+        if replica is not None:
+            return replica.get_all_patients()
+        return self.get_all_patients()
+    
     def get_patient_by_id(self, patient_id: int) -> Optional[Dict[str, Any]]:
+        patients = self.get_patients_by_ids([patient_id])
+        
+        if patients:
+            logger.info(f"Retrieved patient with ID {patient_id}")
+            return patients[0]
+        
+        logger.warning(f"No patient found with ID {patient_id}")
+        return None
+    
+    @traced("db.get_patients_by_ids", "db")
+    def get_patients_by_ids(self, patient_ids: List[int]) -> List[Dict[str, Any]]:
+        """
+        Resolve a batch of patient IDs to records, in the order requested.
+        Cached records are served directly; the rest are loaded with a single IN query.
+        Unknown IDs are cached as absent and skipped in the result.
+        """
+        unique_ids = list(dict.fromkeys(patient_ids))
+        found, missing = patient_record_cache.get_many(unique_ids)
+        
+        if missing:
+            loaded = self._load_patients_by_ids(missing)
+            for patient_id in missing:
+                record = loaded.get(patient_id)
+                patient_record_cache.set(patient_id, record)
+                found[patient_id] = record
+        
+        # Return copies so callers cannot mutate cached records
+        return [dict(found[patient_id]) for patient_id in unique_ids if found.get(patient_id)]
+    
+    def _load_patients_by_ids(self, patient_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        replica = self.get_active_replica()
+        if replica:
+            return {patient["patient_id"]: patient for patient in replica.get_patients_by_ids(patient_ids)}
+        
         try:
             query = text("""
                 SELECT 
+                    PatientId,
+                    FullName,
+                    IdentificationNumber,
+                    BirthDate,
+                    Phone,
+                    Email
+                FROM Patients
+                WHERE PatientId IN :patient_ids
+            """).bindparams(bindparam("patient_ids", expanding=True))
+            
+            patients = {}
+            with self.engine.connect() as conn:
+                for start in range(0, len(patient_ids), ID_BATCH_SIZE):
+                    batch = patient_ids[start:start + ID_BATCH_SIZE]
+                    for row in conn.execute(query, {"patient_ids": batch}):
+                        patients[row.PatientId] = {
+                            "patient_id": row.PatientId,
+                            "full_name": row.FullName,
+                            "identification_number": row.IdentificationNumber,
+                            "birth_date": row.BirthDate,
+                            "phone": row.Phone,
+                            "email": row.Email
+                        }
+            
+            logger.info(f"Loaded {len(patients)} of {len(patient_ids)} requested patients from database")
+            return patients
+            
+        except Exception as e:
+            logger.error(f"Error retrieving patients by IDs: {e}")
+            raise
+    
+    def invalidate_patient_cache(self, patient_ids: Optional[List[int]] = None):
+        """Drop cached patient records, all of them when no IDs are given, and the cached aggregates."""
+        patient_record_cache.invalidate(patient_ids)
+        patient_aggregates_cache.invalidate()
+    
+    @traced("db.get_patients_page", "db")
+    def get_patients_page(self, after_id: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """One page of patients ordered by ID (keyset pagination: pass the last ID of the previous page)."""
+        replica = self.get_active_replica()
+        if replica:
+            return replica.get_patients_page(after_id, limit)
+        
+        try:
+            query = text("""
+                SELECT TOP (:limit)
+                    PatientId,
                     FullName,
                     IdentificationNumber,
                     BirthDate,
                     Phone,
                     Email
                 FROM Patients
-                WHERE PatientId = :patient_id
+                WHERE PatientId > :after_id
+                ORDER BY PatientId
             """)
             
             with self.engine.connect() as conn:
-                result = conn.execute(query, {"patient_id": patient_id})
-                row = result.first()
-                
-                if row:
-                    patient = {
+                result = conn.execute(query, {"limit": limit, "after_id": after_id})
+                return [
+                    {
+                        "patient_id": row.PatientId,
                         "full_name": row.FullName,
                         "identification_number": row.IdentificationNumber,
                         "birth_date": row.BirthDate,
                         "phone": row.Phone,
                         "email": row.Email
                     }
-                    logger.info(f"Retrieved patient with ID {patient_id}")
-                    return patient
-                else:
-                    logger.warning(f"No patient found with ID {patient_id}")
-                    return None
-                    
+                    for row in result
+                ]
+                
         except Exception as e:
-            logger.error(f"Error retrieving patient {patient_id}: {e}")
+            logger.error(f"Error retrieving patients after ID {after_id}: {e}")
             raise
     
+    @traced("db.search_patients_by_name", "db")
     def search_patients_by_name(self, name: str) -> List[Dict[str, Any]]:
+        replica = self.get_active_replica()
+        if replica:
+            return replica.search_patients_by_name(name)
+        
         try:
             query = text("""
                 SELECT 
@@ -160,6 +310,102 @@ class DatabaseService:
             logger.error(f"Error searching patients by name '{name}': {e}")
             raise
     
+    @traced("db.get_patient_counts", "db")
+    def get_patient_counts(self) -> Dict[str, int]:
+        """Total patients and contact-field counts, served from the replica when available."""
+        replica = self.get_active_replica()
+        if replica:
+            return replica.get_patient_counts()
+        
+        try:
+            query = text("""
+                SELECT 
+                    COUNT(*) AS total_patients,
+                    COUNT(NULLIF(Email, '')) AS patients_with_email,
+                    COUNT(NULLIF(Phone, '')) AS patients_with_phone
+                FROM Patients
+            """)
+            
+            with self.engine.connect() as conn:
+                row = conn.execute(query).first()
+                return {
+                    "total_patients": row.total_patients,
+                    "patients_with_email": row.patients_with_email,
+                    "patients_with_phone": row.patients_with_phone
+                }
+                
+        except Exception as e:
+            logger.error(f"Error counting patients: {e}")
+            raise
+    
+    @traced("db.get_patient_aggregates", "db")
+    def get_patient_aggregates(self) -> Dict[str, Any]:
+        """
+        Counts plus age-bucket and gender histograms. The replica keeps them up to
+        date at sync time; without it SQL Server aggregates by birth year once, and
+        the result is reused until the next sync (or PATIENT_CACHE_TTL_SECONDS).
+        """
+        replica = self.get_active_replica()
+        if replica:
+            return replica.get_aggregates()
+        
+        cached = patient_aggregates_cache.get("aggregates")
+        if cached is not None:
+            return cached
+        
+        try:
+            counts = self.get_patient_counts()
+            query = text("""
+                SELECT YEAR(BirthDate) AS birth_year, COUNT(*) AS patients
+                FROM Patients
+                GROUP BY YEAR(BirthDate)
+            """)
+            
+            with self.engine.connect() as conn:
+                birth_years = [(row.birth_year, row.patients) for row in conn.execute(query)]
+            aggregates = summarize_rows(birth_years, counts)
+            patient_aggregates_cache.set("aggregates", aggregates)
+            return aggregates
+                
+        except Exception as e:
+            logger.error(f"Error aggregating patients: {e}")
+            raise
+    
+    @traced("db.get_data_version", "db")
+    def get_data_version(self) -> Optional[str]:
+        """Fingerprint of the patient data last synced into the replica, if any."""
+        replica = self.get_active_replica()
+        return replica.get_version() if replica else None
+    
+    @traced("db.sync_replica", "db")
+    def sync_replica(self, patients: Optional[List[Dict[str, Any]]] = None) -> bool:
+        """
+        Refresh the local replica from SQL Server and invalidate cached records when data changed.
+        Pass the rows already read by the caller to avoid a second full table read.
+        Returns True when the replica content changed.
+        """
+        if settings.PATIENT_REPLICA_STANDALONE:
+            return False
+        
+        if self.replica is None:
+            # Nothing to compare against, so every sync invalidates cached records
+            self.invalidate_patient_cache()
+            return True
+        
+        try:
+            if patients is None:
+                patients = self.get_all_patients()
+            
+            changed = self.replica.replace_all(patients)
+            if changed:
+                self.invalidate_patient_cache()
+            return changed
+            
+        except Exception as e:
+            # The replica is a cache of SQL Server; a failed sync must not break the caller
+            logger.error(f"Error syncing patient replica: {e}")
+            return False
+    
     def convert_patients_to_natural_language(self, patients: List[Dict[str, Any]]) -> List[str]:
         descriptions = []
         
@@ -223,6 +469,13 @@ class DatabaseService:
             raise
     
     def check_database_health(self) -> Dict[str, str]:
+        if settings.PATIENT_REPLICA_STANDALONE:
+            return {
+                "status": "healthy",
+                "connection": "replica",
+                "total_patients": str(self.replica.get_patient_counts()["total_patients"])
+            }
+        
         try:
             with self.engine.connect() as conn:
                 result = conn.execute(text("SELECT COUNT(*) as patient_count FROM Patients"))
@@ -0,0 +1,65 @@
+from typing import Any, List, Optional
+from app.core.config import settings
+from app.services.index_versions import IndexVersionRegistry
+from app.services.shared_index import SharedVectorIndex
+import hashlib
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Shard ids become part of collection names: letters, digits and inner hyphens only,
+# so "<base>__<shard>" never looks like "<base>_v<timestamp>" of another index
+SAFE_SHARD_ID = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9-]{0,62}[A-Za-z0-9])?$")
+SHARD_SEPARATOR = "__"
+
+def shard_id(value: Any) -> Optional[str]:
+    """
+    Shard of a clinic/tenant value, or None for the unsharded index. Values that are
+    not valid in collection names are slugged and suffixed with a hash of the original,
+    so two clinics never share a shard.
+    """
+    if value is None or not str(value).strip():
+        return None
+    value = str(value).strip()
+    if SAFE_SHARD_ID.match(value):
+        return value
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", value).strip("-")[:40]
+    digest = hashlib.sha1(value.encode("utf-8")).hexdigest()[:10]
+    return f"{slug}-{digest}" if slug else digest
+
+class IndexShard:
+    """
+    One demographic index: the versions of its collection and, with the embedded
+    backend, its memory-mapped copy. Shard None is the unsharded index and keeps
+    the collection names used before sharding.
+    """
+
+    def __init__(self, chroma_client, key: Optional[str], use_shared_index: bool):
+        self.key = key
+        suffix = f"{SHARD_SEPARATOR}{key}" if key else ""
+        self.versions = IndexVersionRegistry(
+            chroma_client,
+            base_name=f"{settings.CHROMA_DEMOGRAPHIC_COLLECTION}{suffix}",
+            registry_name=f"{settings.CHROMA_INDEX_REGISTRY_COLLECTION}{suffix}",
+            keep_versions=settings.INDEX_KEEP_VERSIONS,
+            refresh_seconds=settings.INDEX_POINTER_REFRESH_SECONDS,
+            build_lease_seconds=settings.INDEX_BUILD_LEASE_SECONDS
+        )
+        # Shard copies live next to the unsharded one, whose directory only holds its own versions
+        shared_index_path = f"{settings.SHARED_INDEX_PATH}_shards/{key}" if key else settings.SHARED_INDEX_PATH
+        self.shared_index = SharedVectorIndex(shared_index_path) if use_shared_index else None
+
+    @property
+    def collection(self):
+        return self.versions.get_active()
+
+def discover_shard_keys(chroma_client) -> List[str]:
+    """Shards that have been built, found through their registry collections."""
+    prefix = f"{settings.CHROMA_INDEX_REGISTRY_COLLECTION}{SHARD_SEPARATOR}"
+    keys = []
+    for collection in chroma_client.list_collections():
+        name = collection if isinstance(collection, str) else collection.name
+        if name.startswith(prefix):
+            keys.append(name[len(prefix):])
+    return sorted(keys)
@@ -0,0 +1,147 @@
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+RECORDS_FILE = "records.parquet"
+
+class SnapshotError(ValueError):
+    """The snapshot is incomplete, corrupted or was built for another embedding model."""
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as snapshot_file:
+        for block in iter(lambda: snapshot_file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def export_snapshot(
+    directory: str,
+    ids: List[str],
+    embeddings: Any,
+    documents: List[str],
+    metadatas: List[Dict[str, Any]],
+    embedding_model: str,
+    data_version: Optional[str] = None,
+    shard: Optional[str] = None,
+    float16: bool = False
+) -> Dict[str, Any]:
+    """
+    Write the demographic index to `<directory>/<snapshot_id>/`: vectors as one .npy
+    matrix (float32, or float16 at half the size), IDs, documents and metadata as
+    Parquet, and a manifest with the embedding model and file checksums. The
+    manifest is written last, so a directory without one is an unfinished export.
+    Returns the manifest.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    snapshot_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    snapshot_dir = os.path.join(directory, snapshot_id)
+    os.makedirs(snapshot_dir)
+
+    matrix = np.asarray(embeddings, dtype=np.float16 if float16 else np.float32).reshape(len(ids), -1)
+    np.save(os.path.join(snapshot_dir, EMBEDDINGS_FILE), matrix)
+    # Metadata values differ between records, so each dict is stored as a JSON string
+    records = pa.table({
+        "id": pa.array(ids, pa.string()),
+        "document": pa.array(documents, pa.string()),
+        "metadata": pa.array([json.dumps(metadata or {}, ensure_ascii=False) for metadata in metadatas], pa.string())
+    })
+    pq.write_table(records, os.path.join(snapshot_dir, RECORDS_FILE), compression="zstd")
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "snapshot_id": snapshot_id,
+        "created_at": datetime.now().isoformat(),
+        "embedding_model": embedding_model,
+        "data_version": data_version,
+        "shard": shard,
+        "count": len(ids),
+        "dimensions": int(matrix.shape[1]) if len(ids) else 0,
+        "dtype": str(matrix.dtype),
+        "files": {
+            name: {"sha256": _sha256(os.path.join(snapshot_dir, name)), "bytes": os.path.getsize(os.path.join(snapshot_dir, name))}
+            for name in (EMBEDDINGS_FILE, RECORDS_FILE)
+        }
+    }
+    manifest_tmp = os.path.join(snapshot_dir, f"{MANIFEST_FILE}.tmp")
+    with open(manifest_tmp, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(manifest_tmp, os.path.join(snapshot_dir, MANIFEST_FILE))
+
+    logger.info(f"Exported index snapshot {snapshot_id} with {len(ids)} vectors ({manifest['dtype']})")
+    return manifest
+
+def read_manifest(snapshot_dir: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(snapshot_dir, MANIFEST_FILE), encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+    except FileNotFoundError:
+        raise SnapshotError(f"No snapshot manifest in {snapshot_dir}")
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {manifest.get('format_version')}")
+    return manifest
+
+def load_snapshot(snapshot_dir: str, embedding_model: str, verify: bool = True) -> Dict[str, Any]:
+    """
+    Open a snapshot for import. The vectors are memory-mapped, not read, so loading
+    takes the time of the checksums only. Vectors built with another embedding
+    model would not be comparable with query embeddings and are rejected.
+    """
+    import pyarrow.parquet as pq
+
+    manifest = read_manifest(snapshot_dir)
+    if manifest["embedding_model"] != embedding_model:
+        raise SnapshotError(
+            f"Snapshot was built with {manifest['embedding_model']}, this node embeds queries with {embedding_model}"
+        )
+    if verify:
+        for name, expected in manifest["files"].items():
+            if _sha256(os.path.join(snapshot_dir, name)) != expected["sha256"]:
+                raise SnapshotError(f"Checksum mismatch for {name} in snapshot {manifest['snapshot_id']}")
+
+    matrix = np.load(os.path.join(snapshot_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    records = pq.read_table(os.path.join(snapshot_dir, RECORDS_FILE)).to_pydict()
+    if len(records["id"]) != len(matrix) or len(matrix) != manifest["count"]:
+        raise SnapshotError(f"Snapshot {manifest['snapshot_id']} has {len(matrix)} vectors for {len(records['id'])} records")
+
+    return {
+        "manifest": manifest,
+        "embeddings": matrix,
+        "ids": records["id"],
+        "documents": records["document"],
+        "metadatas": [json.loads(metadata) for metadata in records["metadata"]]
+    }
+
+def list_snapshots(directory: str) -> List[Dict[str, Any]]:
+    """Manifests of the complete snapshots in `directory`, newest first."""
+    if not os.path.isdir(directory):
+        return []
+    manifests = []
+    for entry in os.scandir(directory):
+        if entry.is_dir() and os.path.exists(os.path.join(entry.path, MANIFEST_FILE)):
+            try:
+                manifests.append(read_manifest(entry.path))
+            except (SnapshotError, ValueError) as e:
+                logger.warning(f"Skipping index snapshot {entry.name}: {e}")
+    return sorted(manifests, key=lambda manifest: manifest["created_at"], reverse=True)
+
+def prune_snapshots(directory: str, keep: int):
+    """Delete all but the `keep` newest snapshots of each shard."""
+    kept: Dict[Optional[str], int] = {}
+    for manifest in list_snapshots(directory):
+        shard = manifest.get("shard")
+        kept[shard] = kept.get(shard, 0) + 1
+        if kept[shard] > keep:
+            shutil.rmtree(os.path.join(directory, manifest["snapshot_id"]), ignore_errors=True)
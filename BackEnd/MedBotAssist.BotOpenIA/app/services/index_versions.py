@@ -0,0 +1,218 @@
+from typing import Any, Dict, List, Tuple
+from datetime import datetime
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DEMOGRAPHIC_COLLECTION_METADATA = {
+    "description": "Patient demographic information namespace",
+    "namespace": "demographic_patients_namespace",
+    "data_type": "patient_demographics",
+    "source": "SQL_Server_Patients_Table"
+}
+
+class BuildInProgress(RuntimeError):
+    """Another process or task holds the build lease of this index."""
+
+class IndexVersionRegistry:
+    """
+    Blue/green versions of the demographic collection.
+
+    Rebuilds fill a new collection named `<base>_v<timestamp>` while searches keep
+    using the active one. When the build is complete the active pointer, kept in
+    the metadata of a registry collection, is replaced with a single write, so
+    every process and node switches from one complete version to the next.
+    The previous versions are kept (up to `keep_versions` in total) for rollback.
+    Only one build runs at a time: the builder holds a lease in the pointer and
+    renews it after every batch, and a second build is rejected while it is valid.
+    """
+
+    def __init__(
+        self,
+        chroma_client,
+        base_name: str,
+        registry_name: str,
+        keep_versions: int = 2,
+        refresh_seconds: float = 5.0,
+        build_lease_seconds: float = 300.0
+    ):
+        self.chroma_client = chroma_client
+        self.base_name = base_name
+        self.keep_versions = max(keep_versions, 1)
+        self.refresh_seconds = refresh_seconds
+        self.build_lease_seconds = build_lease_seconds
+        self._lock = threading.Lock()
+        self._build_owner = None
+        self._registry = chroma_client.get_or_create_collection(
+            name=registry_name,
+            metadata={"description": "Active version pointers of the MedBot collections"}
+        )
+        self._active = None
+        self._checked_at = 0.0
+
+    def _pointer(self) -> Dict[str, Any]:
+        # Collection objects hold a snapshot of their metadata; fetch it again to see other writers
+        return dict(self.chroma_client.get_collection(self._registry.name).metadata or {})
+
+    def _write_pointer(self, pointer: Dict[str, Any]):
+        pointer["updated_at"] = datetime.now().isoformat()
+        # Chroma replaces the whole metadata, so readers see either the old or the new pointer
+        self._registry.modify(metadata={name: value for name, value in pointer.items() if value is not None})
+
+    def _open(self, name: str):
+        return self.chroma_client.get_or_create_collection(
+            name=name,
+            metadata={**DEMOGRAPHIC_COLLECTION_METADATA, "version": name}
+        )
+
+    def get_active(self):
+        """Collection that searches use; re-reads the pointer at most every `refresh_seconds`."""
+        now = time.monotonic()
+        if self._active is not None and now - self._checked_at < self.refresh_seconds:
+            return self._active
+        with self._lock:
+            if self._active is None or now - self._checked_at >= self.refresh_seconds:
+                try:
+                    # Installations without a pointer keep using the unversioned base collection
+                    name = self._pointer().get("active") or self.base_name
+                    if self._active is None or self._active.name != name:
+                        self._active = self._open(name)
+                        logger.info(f"Active demographic collection: {name}")
+                except Exception as e:
+                    if self._active is None:
+                        raise
+                    logger.warning(f"Could not read the active collection pointer, keeping {self._active.name}: {e}")
+                self._checked_at = now
+            return self._active
+
+    def start_build(self, fingerprint: str) -> Tuple[Any, int]:
+        """
+        Take the build lease and return the collection to build the next version in,
+        and how many patients it already holds. A build of the same data interrupted
+        earlier is continued instead of started over. Raises BuildInProgress while
+        another build holds the lease.
+        """
+        with self._lock:
+            pointer = self._pointer()
+            building = pointer.get("building")
+            if building and pointer.get("building_lease_until", 0) > time.time():
+                raise BuildInProgress(f"Version {building} is being built by {pointer.get('building_owner')}")
+
+            collection = None
+            if building and pointer.get("building_fingerprint") == fingerprint:
+                try:
+                    collection = self.chroma_client.get_collection(building)
+                except Exception:
+                    logger.info(f"Interrupted build {building} is gone; starting a new version")
+            elif building:
+                # Its lease expired, so nothing writes to it any more
+                self._delete(building)
+
+            if collection is not None:
+                done = collection.count()
+                logger.info(f"Continuing build of {building} from {done} patients")
+            else:
+                name = f"{self.base_name}_v{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+                collection, done = self._open(name), 0
+                pointer.update({"building": name, "building_fingerprint": fingerprint})
+                logger.info(f"Building demographic collection version {name}")
+
+            owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            self._write_pointer({**pointer, "building_owner": owner, "building_lease_until": time.time() + self.build_lease_seconds})
+            # Chroma has no compare-and-set; read the pointer back to catch a build started elsewhere at the same moment
+            if self._pointer().get("building_owner") != owner:
+                raise BuildInProgress(f"Another process started building {self.base_name} at the same time")
+            self._build_owner = owner
+            return collection, done
+
+    def renew_build(self):
+        """Extend the build lease; raises BuildInProgress when the build was taken over."""
+        with self._lock:
+            pointer = self._pointer()
+            if self._build_owner is None or pointer.get("building_owner") != self._build_owner:
+                raise BuildInProgress(f"The build of {self.base_name} was taken over by {pointer.get('building_owner')}")
+            self._write_pointer({**pointer, "building_lease_until": time.time() + self.build_lease_seconds})
+
+    def release_build(self):
+        """Give up the build lease after a failure; the next build continues the collection."""
+        with self._lock:
+            pointer = self._pointer()
+            if self._build_owner is not None and pointer.get("building_owner") == self._build_owner:
+                pointer.pop("building_owner", None)
+                pointer.pop("building_lease_until", None)
+                self._write_pointer(pointer)
+            self._build_owner = None
+
+    def activate(self, name: str):
+        """Point searches at a completely built version and drop the oldest ones."""
+        with self._lock:
+            pointer = self._pointer()
+            previous = pointer.get("active") or self.base_name
+            # Dropping the building fields also ends the build lease
+            self._write_pointer({"active": name, "previous": previous})
+            self._active = self._open(name)
+            self._checked_at = time.monotonic()
+            self._build_owner = None
+        logger.info(f"Activated demographic collection {name} (previous: {previous})")
+        self._prune(name)
+
+    def rollback(self) -> str:
+        """Switch back to the previous version; returns the collection now active."""
+        pointer = self._pointer()
+        previous = pointer.get("previous")
+        if not previous or previous not in self._version_names():
+            raise ValueError("No previous index version to roll back to")
+        self.activate(previous)
+        return previous
+
+    def list_versions(self) -> List[Dict[str, Any]]:
+        pointer = self._pointer()
+        active = pointer.get("active") or self.base_name
+        versions = []
+        for name in self._version_names():
+            try:
+                count = self.chroma_client.get_collection(name).count()
+            except Exception:
+                count = None
+            versions.append({
+                "name": name,
+                "documents": count,
+                "active": name == active,
+                "previous": name == pointer.get("previous"),
+                "building": name == pointer.get("building")
+            })
+        return versions
+
+    def _version_names(self) -> List[str]:
+        names = []
+        for collection in self.chroma_client.list_collections():
+            name = collection if isinstance(collection, str) else collection.name
+            if name == self.base_name or name.startswith(f"{self.base_name}_v"):
+                names.append(name)
+        # Timestamped names sort by age; the unversioned base collection is the oldest
+        return sorted(names, key=lambda name: "" if name == self.base_name else name)
+
+    def _prune(self, active: str):
+        pointer = self._pointer()
+        names = self._version_names()
+        protected = {active, pointer.get("previous"), pointer.get("building")}
+        kept = len(protected & set(names))
+        for name in reversed(names):
+            if name in protected:
+                continue
+            if kept < self.keep_versions:
+                kept += 1
+                continue
+            self._delete(name)
+
+    def _delete(self, name: str):
+        try:
+            self.chroma_client.delete_collection(name)
+            logger.info(f"Deleted demographic collection version {name}")
+        except Exception as e:
+            logger.warning(f"Could not delete collection {name}: {e}")
@@ -0,0 +1,84 @@
+from typing import Any, Dict, Iterable, Optional
+from datetime import date
+
+# Age buckets reported by summaries: (label, min age, max age or None)
+AGE_BUCKETS = [
+    ("0-17", 0, 17),
+    ("18-29", 18, 29),
+    ("30-44", 30, 44),
+    ("45-59", 45, 59),
+    ("60-74", 60, 74),
+    ("75+", 75, None)
+]
+
+GENDER_ALIASES = {
+    "m": "male", "male": "male", "masculino": "male", "masculine": "male",
+    "f": "female", "female": "female", "femenino": "female", "feminine": "female"
+}
+
+def normalize_gender(value: Optional[str]) -> str:
+    if not value or not str(value).strip():
+        return "unknown"
+    value = str(value).strip().lower()
+    return GENDER_ALIASES.get(value, value)
+
+def patient_counters(birth_date: Optional[str], phone: Optional[str], email: Optional[str], gender: Optional[str]) -> Dict[str, int]:
+    """
+    Counters one patient adds to the aggregates. Ages change every day, so the
+    birth year is counted instead and age buckets are derived when read.
+    """
+    return {
+        "total_patients": 1,
+        "patients_with_email": 1 if email else 0,
+        "patients_with_phone": 1 if phone else 0,
+        f"birth_year:{birth_date[:4] if birth_date else 'unknown'}": 1,
+        f"gender:{normalize_gender(gender)}": 1
+    }
+
+def apply_counters(aggregates: Dict[str, int], counters: Dict[str, int], sign: int = 1):
+    for name, value in counters.items():
+        aggregates[name] = aggregates.get(name, 0) + sign * value
+
+def summarize(aggregates: Dict[str, int], today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Summary statistics from the stored counters; cost depends only on the number
+    of distinct birth years and genders, not on the number of patients.
+    Age buckets use the age reached this calendar year.
+    """
+    current_year = (today or date.today()).year
+    age_buckets = {label: 0 for label, _, _ in AGE_BUCKETS}
+    age_buckets["unknown"] = 0
+    gender: Dict[str, int] = {}
+
+    for name, value in aggregates.items():
+        if not value:
+            continue
+        if name.startswith("birth_year:"):
+            year = name[len("birth_year:"):]
+            age_buckets[_age_bucket(current_year - int(year)) if year.isdigit() else "unknown"] += value
+        elif name.startswith("gender:"):
+            gender[name[len("gender:"):]] = value
+
+    return {
+        "total_patients": aggregates.get("total_patients", 0),
+        "patients_with_email": aggregates.get("patients_with_email", 0),
+        "patients_with_phone": aggregates.get("patients_with_phone", 0),
+        "age_buckets": age_buckets,
+        "gender": gender
+    }
+
+def summarize_rows(birth_years: Iterable[tuple], counts: Dict[str, int], today: Optional[date] = None) -> Dict[str, Any]:
+    """Same summary from (birth year, patients) rows and contact counts computed by the database."""
+    aggregates = dict(counts)
+    for birth_year, patients in birth_years:
+        apply_counters(aggregates, {f"birth_year:{birth_year if birth_year is not None else 'unknown'}": patients})
+    # The SQL Server Patients table has no gender column
+    aggregates["gender:unknown"] = counts.get("total_patients", 0)
+    return summarize(aggregates, today)
+
+def _age_bucket(age: int) -> str:
+    for label, min_age, max_age in AGE_BUCKETS:
+        if age >= min_age and (max_age is None or age <= max_age):
+            return label
+    # Birth dates in the future are data errors
+    return "unknown"
@@ -0,0 +1,269 @@
+from typing import List, Dict, Any, Optional, Iterator
+from contextlib import contextmanager
+from datetime import date, datetime
+from app.core.metrics import SQL_QUERY_LATENCY
+from app.services.patient_aggregates import apply_counters, patient_counters, summarize
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+PATIENT_COLUMNS = "patient_id, full_name, identification_number, birth_date, phone, email, gender, shard"
+ROW_COLUMNS = "patient_id, full_name, full_name_lower, identification_number, birth_date, phone, email, gender, shard"
+
+class PatientReplica:
+    """
+    Local SQLite read replica of the SQL Server Patients table.
+    SQL Server stays the source of truth; the sync job applies the rows that changed
+    and updates the summary aggregates in the same transaction.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._initialize_schema()
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        start = time.perf_counter()
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+            conn.commit()
+            SQL_QUERY_LATENCY.labels("replica").observe(time.perf_counter() - start)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _initialize_schema(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS patients (
+                    patient_id INTEGER PRIMARY KEY,
+                    full_name TEXT NOT NULL,
+                    full_name_lower TEXT NOT NULL,
+                    identification_number TEXT,
+                    birth_date TEXT,
+                    phone TEXT,
+                    email TEXT,
+                    gender TEXT,
+                    shard TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_patients_full_name ON patients(full_name);
+                CREATE INDEX IF NOT EXISTS idx_patients_full_name_lower ON patients(full_name_lower);
+                CREATE INDEX IF NOT EXISTS idx_patients_identification ON patients(identification_number);
+                CREATE TABLE IF NOT EXISTS replica_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS patient_aggregates (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+            """)
+            
+            # Replicas created before aggregates were kept incrementally
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(patients)")}
+            if "gender" not in columns:
+                conn.execute("ALTER TABLE patients ADD COLUMN gender TEXT")
+            # Replicas created before the index was sharded by clinic
+            if "shard" not in columns:
+                conn.execute("ALTER TABLE patients ADD COLUMN shard TEXT")
+            if conn.execute("SELECT COUNT(*) FROM patient_aggregates").fetchone()[0] == 0:
+                self._rebuild_aggregates(conn)
+
+        logger.info(f"Patient replica ready at {self.path}")
+
+    @staticmethod
+    def _normalize_birth_date(value: Any) -> Optional[str]:
+        if value is None or value == "":
+            return None
+        if isinstance(value, datetime):
+            return value.date().isoformat()
+        if isinstance(value, date):
+            return value.isoformat()
+        return str(value)[:10]
+
+    @staticmethod
+    def _row_to_patient(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "patient_id": row["patient_id"],
+            "full_name": row["full_name"],
+            "identification_number": row["identification_number"],
+            "birth_date": date.fromisoformat(row["birth_date"]) if row["birth_date"] else None,
+            "phone": row["phone"],
+            "email": row["email"],
+            "gender": row["gender"],
+            "shard": row["shard"]
+        }
+
+    def _to_rows(self, patients: List[Dict[str, Any]]) -> List[tuple]:
+        rows = []
+        for patient in patients:
+            full_name = patient.get("full_name") or ""
+            rows.append((
+                patient["patient_id"],
+                full_name,
+                full_name.lower(),
+                patient.get("identification_number"),
+                self._normalize_birth_date(patient.get("birth_date")),
+                patient.get("phone"),
+                patient.get("email"),
+                patient.get("gender"),
+                # Compared as text, so numeric clinic IDs from SQL Server match the stored values
+                str(patient["shard"]) if patient.get("shard") is not None else None
+            ))
+        rows.sort(key=lambda row: row[0])
+        return rows
+
+    def get_state(self) -> Dict[str, str]:
+        with self._connection() as conn:
+            return {row["key"]: row["value"] for row in conn.execute("SELECT key, value FROM replica_state")}
+
+    def is_populated(self) -> bool:
+        return "synced_at" in self.get_state()
+
+    def get_version(self) -> Optional[str]:
+        """Content fingerprint of the last sync; changes only when patient data changes."""
+        return self.get_state().get("version")
+
+    @staticmethod
+    def _row_counters(row: tuple) -> Dict[str, int]:
+        # Rows are (patient_id, full_name, full_name_lower, identification_number, birth_date, phone, email, gender, shard)
+        return patient_counters(row[4], row[5], row[6], row[7])
+
+    def _rebuild_aggregates(self, conn: sqlite3.Connection):
+        aggregates: Dict[str, int] = {}
+        for row in conn.execute(f"SELECT {ROW_COLUMNS} FROM patients"):
+            apply_counters(aggregates, self._row_counters(tuple(row)))
+        conn.execute("DELETE FROM patient_aggregates")
+        conn.executemany(
+            "INSERT INTO patient_aggregates (name, value) VALUES (?, ?)",
+            [(name, value) for name, value in aggregates.items() if value]
+        )
+
+    def replace_all(self, patients: List[Dict[str, Any]]) -> bool:
+        """
+        Make the replica match a full snapshot from the source of truth.
+        Only added, changed and removed rows are written, and the aggregates are
+        adjusted by the difference. Returns False without writing when the
+        snapshot matches the stored fingerprint.
+        """
+        rows = self._to_rows(patients)
+        fingerprint = hashlib.sha256(json.dumps(rows, default=str).encode("utf-8")).hexdigest()
+
+        with self._connection() as conn:
+            # Write lock before reading, so syncs in other workers cannot apply the same deltas twice
+            conn.execute("BEGIN IMMEDIATE")
+            stored = conn.execute("SELECT value FROM replica_state WHERE key = 'fingerprint'").fetchone()
+            if stored is not None and stored["value"] == fingerprint:
+                logger.info("Patient replica already up to date")
+                return False
+
+            existing = {row[0]: tuple(row) for row in conn.execute(f"SELECT {ROW_COLUMNS} FROM patients")}
+            incoming = {row[0]: row for row in rows}
+
+            upserts = [row for patient_id, row in incoming.items() if existing.get(patient_id) != row]
+            removed = [existing[patient_id] for patient_id in existing.keys() - incoming.keys()]
+
+            deltas: Dict[str, int] = {}
+            for row in upserts:
+                if row[0] in existing:
+                    apply_counters(deltas, self._row_counters(existing[row[0]]), -1)
+                apply_counters(deltas, self._row_counters(row))
+            for row in removed:
+                apply_counters(deltas, self._row_counters(row), -1)
+
+            conn.executemany("DELETE FROM patients WHERE patient_id = ?", [(row[0],) for row in removed])
+            conn.executemany(
+                f"INSERT OR REPLACE INTO patients ({ROW_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                upserts
+            )
+            conn.executemany(
+                "INSERT INTO patient_aggregates (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                [(name, value) for name, value in deltas.items() if value]
+            )
+            conn.execute("DELETE FROM patient_aggregates WHERE value = 0")
+            conn.executemany(
+                "INSERT OR REPLACE INTO replica_state (key, value) VALUES (?, ?)",
+                [
+                    ("fingerprint", fingerprint),
+                    ("version", fingerprint[:16]),
+                    ("synced_at", datetime.now().isoformat())
+                ]
+            )
+
+        logger.info(f"Patient replica synced with {len(rows)} patients ({len(upserts)} upserted, {len(removed)} removed)")
+        return True
+
+    def get_all_patients(self) -> List[Dict[str, Any]]:
+        with self._connection() as conn:
+            rows = conn.execute(f"SELECT {PATIENT_COLUMNS} FROM patients ORDER BY full_name").fetchall()
+        return [self._row_to_patient(row) for row in rows]
+
+    def get_patient_by_id(self, patient_id: int) -> Optional[Dict[str, Any]]:
+        with self._connection() as conn:
+            row = conn.execute(
+                f"SELECT {PATIENT_COLUMNS} FROM patients WHERE patient_id = ?",
+                (patient_id,)
+            ).fetchone()
+        return self._row_to_patient(row) if row else None
+
+    def get_patients_by_ids(self, patient_ids: List[int]) -> List[Dict[str, Any]]:
+        patients = []
+        with self._connection() as conn:
+            # Stay below SQLite's default limit on bound variables per statement
+            for start in range(0, len(patient_ids), 500):
+                batch = patient_ids[start:start + 500]
+                placeholders = ", ".join("?" for _ in batch)
+                rows = conn.execute(
+                    f"SELECT {PATIENT_COLUMNS} FROM patients WHERE patient_id IN ({placeholders})",
+                    batch
+                ).fetchall()
+                patients.extend(self._row_to_patient(row) for row in rows)
+        return patients
+
+    def get_patients_page(self, after_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Up to `limit` patients with an ID greater than `after_id`, by ID; the primary key makes every page equally cheap."""
+        with self._connection() as conn:
+            rows = conn.execute(
+                f"SELECT {PATIENT_COLUMNS} FROM patients WHERE patient_id > ? ORDER BY patient_id LIMIT ?",
+                (after_id, limit)
+            ).fetchall()
+        return [self._row_to_patient(row) for row in rows]
+
+    def search_patients_by_name(self, name: str) -> List[Dict[str, Any]]:
+        with self._connection() as conn:
+            rows = conn.execute(
+                f"SELECT {PATIENT_COLUMNS} FROM patients WHERE full_name_lower LIKE ? ORDER BY full_name",
+                (f"%{name.lower()}%",)
+            ).fetchall()
+        return [self._row_to_patient(row) for row in rows]
+
+    def get_aggregates(self) -> Dict[str, Any]:
+        """Totals, contact counts, age buckets and gender histogram maintained at sync time."""
+        with self._connection() as conn:
+            aggregates = {row["name"]: row["value"] for row in conn.execute("SELECT name, value FROM patient_aggregates")}
+        return summarize(aggregates)
+
+    def get_patient_counts(self) -> Dict[str, int]:
+        """Summary counts maintained at sync time."""
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT name, value FROM patient_aggregates "
+                "WHERE name IN ('total_patients', 'patients_with_email', 'patients_with_phone')"
+            ).fetchall()
+        counts = {"total_patients": 0, "patients_with_email": 0, "patients_with_phone": 0}
+        counts.update({row["name"]: row["value"] for row in rows})
+        return counts
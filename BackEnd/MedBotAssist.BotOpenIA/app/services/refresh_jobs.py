@@ -0,0 +1,285 @@
+from typing import Any, Dict, List, Optional, Tuple
+from contextlib import contextmanager
+from datetime import datetime
+from app.core.config import settings
+from app.core.admission import background_admission_controller
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Jobs in these states still have work to do
+ACTIVE_STATUSES = ("queued", "running")
+
+class LeaseLost(Exception):
+    """Another process took over the job; this one must stop writing to it."""
+
+class RefreshJobStore:
+    """
+    Persists refresh jobs and their checkpoints in SQLite so progress survives
+    restarts and is visible to every worker process. A job is owned by one
+    process at a time through a lease that its owner renews on a heartbeat.
+    Every write is fenced on the owner, so a process that lost its lease cannot
+    overwrite the progress of the one that took the job over.
+    """
+
+    def __init__(self, path: str, lease_seconds: float):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS refresh_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    completed INTEGER NOT NULL DEFAULT 0,
+                    total INTEGER,
+                    batches INTEGER NOT NULL DEFAULT 0,
+                    resumed INTEGER NOT NULL DEFAULT 0,
+                    owner TEXT,
+                    lease_until REAL,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    finished_at TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_refresh_jobs_status ON refresh_jobs(status)")
+
+    @contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        total = job["total"]
+        job["progress"] = round(job["completed"] / total * 100, 1) if total else (100.0 if job["status"] == "completed" else 0.0)
+        del job["lease_until"]
+        return job
+
+    def create_unless_active(self, owner: str) -> Tuple[Dict[str, Any], bool]:
+        """Create a queued job unless one is unfinished; returns the job and whether it was created."""
+        now = datetime.now().isoformat()
+        with self._connection() as conn:
+            # Write lock first, so concurrent requests in other workers cannot both create a job
+            conn.execute("BEGIN IMMEDIATE")
+            active = conn.execute(
+                "SELECT job_id FROM refresh_jobs WHERE status IN ('queued', 'running') ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if active is not None:
+                job_id, created = active["job_id"], False
+            else:
+                job_id, created = uuid.uuid4().hex, True
+                conn.execute(
+                    "INSERT INTO refresh_jobs (job_id, status, owner, lease_until, created_at, updated_at) "
+                    "VALUES (?, 'queued', ?, ?, ?, ?)",
+                    (job_id, owner, time.time() + self.lease_seconds, now, now)
+                )
+        return self.get(job_id), created
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connection() as conn:
+            row = conn.execute("SELECT * FROM refresh_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list_recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._connection() as conn:
+            rows = conn.execute("SELECT * FROM refresh_jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def claim_abandoned(self, owner: str) -> Optional[Dict[str, Any]]:
+        """Take over the oldest unfinished job whose owner stopped renewing its lease."""
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT job_id, owner, lease_until FROM refresh_jobs WHERE status IN ('queued', 'running') "
+                "ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None or not self._is_abandoned(row["owner"], row["lease_until"]):
+                return None
+            conn.execute(
+                "UPDATE refresh_jobs SET owner = ?, lease_until = ?, resumed = resumed + 1, updated_at = ? WHERE job_id = ?",
+                (owner, time.time() + self.lease_seconds, datetime.now().isoformat(), row["job_id"])
+            )
+            job_id = row["job_id"]
+        return self.get(job_id)
+
+    @staticmethod
+    def _is_abandoned(owner: Optional[str], lease_until: Optional[float]) -> bool:
+        if not owner or not lease_until or lease_until < time.time():
+            return True
+        # A process restarted on the same host need not wait for the lease to expire
+        host, _, pid = owner.rpartition(":")
+        if host == socket.gethostname() and pid.isdigit():
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                return False
+        return False
+
+    def _fenced_update(self, job_id: str, owner: str, sql: str, params: tuple):
+        with self._connection() as conn:
+            cursor = conn.execute(f"{sql} WHERE job_id = ? AND owner = ?", (*params, job_id, owner))
+        if cursor.rowcount == 0:
+            raise LeaseLost(f"Refresh job {job_id} is no longer owned by {owner}")
+
+    def renew(self, job_id: str, owner: str):
+        """Extend the lease; raises LeaseLost when another process owns the job."""
+        self._fenced_update(job_id, owner, "UPDATE refresh_jobs SET lease_until = ?", (time.time() + self.lease_seconds,))
+
+    def checkpoint(self, job_id: str, owner: str, completed: int, total: int):
+        """Record a stored batch and renew the lease."""
+        self._fenced_update(
+            job_id, owner,
+            "UPDATE refresh_jobs SET status = 'running', completed = ?, total = ?, batches = batches + 1, "
+            "lease_until = ?, updated_at = ?",
+            (completed, total, time.time() + self.lease_seconds, datetime.now().isoformat())
+        )
+
+    def update(self, job_id: str, owner: str, status: str, **fields: Any):
+        now = datetime.now().isoformat()
+        fields.update({"status": status, "updated_at": now, "lease_until": time.time() + self.lease_seconds})
+        if status not in ACTIVE_STATUSES:
+            fields["finished_at"] = now
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._fenced_update(job_id, owner, f"UPDATE refresh_jobs SET {assignments}", tuple(fields.values()))
+
+class RefreshJobManager:
+    """
+    Runs patient data refreshes as background jobs, one at a time. Every embedded
+    batch is written to Chroma and checkpointed before the next one starts, so a
+    job interrupted by a crash or restart is resumed from its last batch by the
+    next process that starts (or by the next refresh request).
+    """
+
+    def __init__(self, store: RefreshJobStore):
+        self.store = store
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._lost_leases = set()
+
+    @property
+    def owner(self) -> str:
+        # Read on use: gunicorn workers are forked after this object is created
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self) -> Dict[str, Any]:
+        """Start a refresh, or return the job already refreshing the data."""
+        job = self.resume_abandoned()
+        if job is not None:
+            return job
+        job, created = self.store.create_unless_active(self.owner)
+        if created:
+            self._launch(job["job_id"])
+            logger.info(f"Started patient data refresh job {job['job_id']}")
+        return job
+
+    def resume_abandoned(self) -> Optional[Dict[str, Any]]:
+        """Resume an unfinished job left behind by a stopped process, if any."""
+        job = self.store.claim_abandoned(self.owner)
+        if job is None:
+            return None
+        logger.info(f"Resuming patient data refresh job {job['job_id']} after {job['completed']}/{job['total']} patients")
+        self._launch(job["job_id"])
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def list_recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return self.store.list_recent(limit)
+
+    def _launch(self, job_id: str):
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _heartbeat(self, job_id: str, owner: str, run_task: asyncio.Task):
+        """
+        Renew the lease while the job runs, including during the SQL read, the replica
+        sync and the admission wait, none of which checkpoint. Stops the job when
+        another process has taken it over.
+        """
+        while True:
+            await asyncio.sleep(self.store.lease_seconds / 3)
+            try:
+                await asyncio.to_thread(self.store.renew, job_id, owner)
+            except LeaseLost:
+                self._lost_leases.add(job_id)
+                run_task.cancel()
+                return
+            except Exception as e:
+                # A missed renewal is retried; the lease outlasts several intervals
+                logger.warning(f"Could not renew the lease of refresh job {job_id}: {e}")
+
+    async def _run(self, job_id: str):
+        from app.services.vectorization_service import get_shared_vectorization_service
+
+        owner = self.owner
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, owner, asyncio.current_task()))
+        try:
+            vectorization_service = await asyncio.to_thread(get_shared_vectorization_service)
+            db_service = vectorization_service.db_service
+            self.store.update(job_id, owner, "running")
+
+            patients = await asyncio.to_thread(db_service.get_all_patients)
+            await asyncio.to_thread(db_service.sync_replica, patients)
+
+            # Embedding calls run on the background budget, outside the chat slots
+            async with background_admission_controller.slot():
+                total = await vectorization_service.ensure_patient_index(
+                    patients,
+                    progress=lambda completed, total: self.store.checkpoint(job_id, owner, completed, total)
+                )
+
+            self.store.update(job_id, owner, "completed", completed=total, total=total)
+            logger.info(f"Patient data refresh job {job_id} completed with {total} patients")
+
+        except LeaseLost:
+            logger.warning(f"Patient data refresh job {job_id} was taken over by another process; stopping")
+        except asyncio.CancelledError:
+            if job_id in self._lost_leases:
+                self._lost_leases.discard(job_id)
+                logger.warning(f"Patient data refresh job {job_id} was taken over by another process; stopping")
+                return
+            # Shutdown: leave the job running so the next process resumes it
+            logger.info(f"Patient data refresh job {job_id} interrupted; it will resume from its last checkpoint")
+            try:
+                self.store.update(job_id, owner, "running", owner=None)
+            except LeaseLost:
+                pass
+            raise
+        except Exception as e:
+            logger.error(f"Patient data refresh job {job_id} failed: {e}")
+            try:
+                self.store.update(job_id, owner, "failed", error=str(e))
+            except LeaseLost:
+                logger.warning(f"Patient data refresh job {job_id} was taken over by another process; not marking it failed")
+        finally:
+            heartbeat.cancel()
+
+    async def shutdown(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+refresh_job_manager = RefreshJobManager(
+    RefreshJobStore(settings.REFRESH_JOB_DB_PATH, settings.REFRESH_JOB_LEASE_SECONDS)
+)
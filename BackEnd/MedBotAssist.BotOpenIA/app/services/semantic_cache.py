@@ -0,0 +1,106 @@
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import itertools
+import logging
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# (tenant_id, role, data_version): entries are only ever matched within the same scope
+CacheScope = Tuple[str, ...]
+
+class SemanticResponseCache:
+    """
+    Agent answers cached by message embedding.
+    A lookup hits when a cached message in the same scope has cosine similarity at
+    or above `similarity_threshold`. The scope includes the tenant, the caller's
+    role and the patient data version, so answers never cross tenants or
+    permissions and stop matching as soon as the data changes.
+    """
+
+    def __init__(self, max_entries: int = 1000, similarity_threshold: float = 0.95, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        # Per-scope matrix of normalized embeddings, rebuilt lazily after changes
+        self._scope_index: Dict[CacheScope, Dict[str, Any]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        self._scope_index.pop(entry["scope"], None)
+
+    def _get_scope_index(self, scope: CacheScope) -> Optional[Dict[str, Any]]:
+        index = self._scope_index.get(scope)
+        if index is None:
+            ids = [entry_id for entry_id, entry in self._entries.items() if entry["scope"] == scope]
+            if not ids:
+                return None
+            index = {
+                "ids": ids,
+                "matrix": np.stack([self._entries[entry_id]["embedding"] for entry_id in ids])
+            }
+            self._scope_index[scope] = index
+        return index
+
+    def lookup(self, embedding: List[float], scope: CacheScope) -> Optional[Dict[str, Any]]:
+        """Return {"response", "similarity"} for the closest cached message in scope, if close enough."""
+        query = self._normalize(embedding)
+        with self._lock:
+            index = self._get_scope_index(scope)
+            if index is not None:
+                similarities = index["matrix"] @ query
+                best = int(np.argmax(similarities))
+                entry_id = index["ids"][best]
+                entry = self._entries[entry_id]
+
+                if time.time() - entry["created_at"] > self.ttl_seconds:
+                    self._remove(entry_id)
+                elif similarities[best] >= self.similarity_threshold:
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return {"response": entry["response"], "similarity": float(similarities[best])}
+
+            self.misses += 1
+            return None
+
+    def store(self, embedding: List[float], scope: CacheScope, response: str):
+        with self._lock:
+            self._entries[next(self._ids)] = {
+                "scope": scope,
+                "embedding": self._normalize(embedding),
+                "response": response,
+                "created_at": time.time()
+            }
+            self._scope_index.pop(scope, None)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._scope_index.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "similarity_threshold": self.similarity_threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,257 @@
+from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from app.core.config import settings
+from app.core.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+class ConversationSession:
+    """Messages of a single conversation plus the bookkeeping used for its caps."""
+
+    def __init__(
+        self,
+        conversation_id: str,
+        messages: Optional[List[Dict[str, Any]]] = None,
+        last_access: Optional[float] = None,
+        summary: Optional[str] = None
+    ):
+        self.conversation_id = conversation_id
+        self.messages: List[Dict[str, Any]] = messages or []
+        self.last_access = last_access or time.time()
+        # Rolling summary of older messages that were compacted out of `messages`
+        self.summary = summary
+
+    @property
+    def next_seq(self) -> int:
+        if not self.messages:
+            return 0
+        return self.messages[-1].get("seq", len(self.messages) - 1) + 1
+
+    @property
+    def token_count(self) -> int:
+        return sum(message.get("tokens", 0) for message in self.messages)
+
+class SqliteSessionBackend:
+    """Persists sessions as one JSON row per conversation so they survive restarts."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    conversation_id TEXT PRIMARY KEY,
+                    messages TEXT NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions(last_access)")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+            if "summary" not in columns:
+                conn.execute("ALTER TABLE sessions ADD COLUMN summary TEXT")
+
+    @contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def load(self, conversation_id: str) -> Optional[ConversationSession]:
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT messages, last_access, summary FROM sessions WHERE conversation_id = ?",
+                (conversation_id,)
+            ).fetchone()
+        if not row:
+            return None
+        return ConversationSession(conversation_id, json.loads(row[0]), row[1], row[2])
+
+    def save(self, session: ConversationSession):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (conversation_id, messages, last_access, summary) VALUES (?, ?, ?, ?)",
+                (session.conversation_id, json.dumps(session.messages), session.last_access, session.summary)
+            )
+
+    def touch(self, conversation_id: str, last_access: float):
+        with self._connection() as conn:
+            conn.execute("UPDATE sessions SET last_access = ? WHERE conversation_id = ?", (last_access, conversation_id))
+
+    def delete(self, conversation_id: str):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM sessions WHERE conversation_id = ?", (conversation_id,))
+
+    def purge_idle(self, older_than: float) -> int:
+        with self._connection() as conn:
+            return conn.execute("DELETE FROM sessions WHERE last_access < ?", (older_than,)).rowcount
+
+    def purge_beyond(self, max_sessions: int) -> int:
+        """Delete the least recently used sessions beyond `max_sessions`."""
+        with self._connection() as conn:
+            return conn.execute(
+                "DELETE FROM sessions WHERE conversation_id IN "
+                "(SELECT conversation_id FROM sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (max_sessions,)
+            ).rowcount
+
+class ConversationSessionStore:
+    """
+    Conversation histories keyed by conversation_id.
+    Memory stays bounded: sessions are evicted LRU beyond `max_sessions` or after
+    `idle_ttl_seconds` without activity (reads count as activity), in memory and in
+    the SQLite backend alike, and each session keeps at most
+    `max_messages` messages and `max_tokens` tokens (oldest messages are dropped first).
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        max_messages: int = 10,
+        max_tokens: int = 4000,
+        idle_ttl_seconds: float = 3600,
+        backend: Optional[SqliteSessionBackend] = None
+    ):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.backend = backend
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "ConversationSessionStore":
+        backend = None
+        if settings.SESSION_PERSISTENCE == "sqlite":
+            backend = SqliteSessionBackend(settings.SESSION_DB_PATH)
+        return cls(
+            max_sessions=settings.SESSION_MAX_CONVERSATIONS,
+            max_messages=settings.SESSION_MAX_MESSAGES,
+            max_tokens=settings.SESSION_MAX_TOKENS,
+            idle_ttl_seconds=settings.SESSION_IDLE_TTL_SECONDS,
+            backend=backend
+        )
+
+    def _evict_idle(self, now: float):
+        # The OrderedDict is kept in access order, so idle sessions sit at the front
+        while self._sessions:
+            conversation_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access < self.idle_ttl_seconds:
+                break
+            del self._sessions[conversation_id]
+
+    def _evict_beyond_max(self):
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def _get_session(self, conversation_id: str, now: float) -> Optional[ConversationSession]:
+        if self.backend is not None:
+            # The database is authoritative so every worker process sees the same history
+            session = self.backend.load(conversation_id)
+        else:
+            session = self._sessions.get(conversation_id)
+        if session is None:
+            return None
+        if now - session.last_access >= self.idle_ttl_seconds:
+            self._sessions.pop(conversation_id, None)
+            if self.backend is not None:
+                self.backend.delete(conversation_id)
+            return None
+        self._sessions[conversation_id] = session
+        self._sessions.move_to_end(conversation_id)
+        # Sessions loaded from the database count towards the cap too
+        self._evict_beyond_max()
+        return session
+
+    def _enforce_caps(self, session: ConversationSession):
+        while len(session.messages) > self.max_messages:
+            session.messages.pop(0)
+        while len(session.messages) > 1 and session.token_count > self.max_tokens:
+            session.messages.pop(0)
+
+    def get_messages(self, conversation_id: str) -> List[Dict[str, Any]]:
+        return self.get_context(conversation_id)["messages"]
+
+    def get_context(self, conversation_id: str) -> Dict[str, Any]:
+        """Messages and rolling summary of a conversation."""
+        with self._lock:
+            now = time.time()
+            self._evict_idle(now)
+            session = self._get_session(conversation_id, now)
+            if session is None:
+                return {"messages": [], "summary": None}
+            session.last_access = now
+            if self.backend is not None:
+                # Reading keeps a conversation alive in every process, not just this one
+                self.backend.touch(conversation_id, now)
+            return {
+                "messages": [dict(message) for message in session.messages],
+                "summary": session.summary
+            }
+
+    def append_messages(self, conversation_id: str, messages: List[Dict[str, Any]]):
+        with self._lock:
+            now = time.time()
+            self._evict_idle(now)
+            session = self._get_session(conversation_id, now)
+            if session is None:
+                session = ConversationSession(conversation_id)
+                self._sessions[conversation_id] = session
+
+            for message in messages:
+                session.messages.append({
+                    **message,
+                    "seq": session.next_seq,
+                    "tokens": count_tokens(message.get("content", ""))
+                })
+            session.last_access = now
+            self._enforce_caps(session)
+
+            self._evict_beyond_max()
+
+            if self.backend is not None:
+                self.backend.save(session)
+                self.backend.purge_idle(now - self.idle_ttl_seconds)
+                self.backend.purge_beyond(self.max_sessions)
+
+    def compact(self, conversation_id: str, summary: str, through_seq: int):
+        """
+        Replace messages up to `through_seq` with a rolling summary.
+        Ignored if those messages are gone (conversation cleared or evicted meanwhile).
+        """
+        with self._lock:
+            session = self._get_session(conversation_id, time.time())
+            if session is None or not any(message.get("seq") == through_seq for message in session.messages):
+                return
+            session.messages = [message for message in session.messages if message.get("seq", -1) > through_seq]
+            session.summary = summary
+            if self.backend is not None:
+                self.backend.save(session)
+
+    def clear(self, conversation_id: str):
+        with self._lock:
+            self._sessions.pop(conversation_id, None)
+            if self.backend is not None:
+                self.backend.delete(conversation_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "max_messages": self.max_messages,
+                "max_tokens": self.max_tokens,
+                "idle_ttl_seconds": self.idle_ttl_seconds,
+                "persistence": "sqlite" if self.backend is not None else "memory"
+            }
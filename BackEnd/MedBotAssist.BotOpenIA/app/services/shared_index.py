@@ -0,0 +1,132 @@
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = "CURRENT"
+
+class SharedVectorIndex:
+    """
+    Read-only snapshot of the demographic collection shared by all worker processes.
+    One process publishes embeddings (.npy) and records (.json) into a new version
+    directory and atomically repoints CURRENT at it; every worker memory-maps the
+    matrix, so the OS page cache holds a single copy however many workers run.
+    Readers notice a new version by stat-ing CURRENT, once per lookup.
+    """
+
+    def __init__(self, path: str, keep_versions: int = 2):
+        self.path = path
+        self.keep_versions = keep_versions
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._loaded_key: Optional[Tuple[int, int]] = None
+        # Swapped as a whole so readers never mix two versions
+        self._snapshot: Optional[Dict[str, Any]] = None
+
+    def publish(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict[str, Any]]) -> str:
+        """Write a new snapshot and make it current; returns its version."""
+        version = uuid.uuid4().hex[:12]
+        version_dir = os.path.join(self.path, version)
+        os.makedirs(version_dir)
+
+        # An emptied index is published too, so workers stop serving the previous vectors
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1) if len(ids) else np.zeros((0, 0), dtype=np.float32)
+        np.save(os.path.join(version_dir, "embeddings.npy"), matrix)
+        with open(os.path.join(version_dir, "records.json"), "w", encoding="utf-8") as records_file:
+            json.dump({"ids": list(ids), "documents": list(documents), "metadatas": list(metadatas)}, records_file, ensure_ascii=False)
+
+        current_tmp = os.path.join(self.path, f"{CURRENT_FILE}.{version}.tmp")
+        with open(current_tmp, "w") as current_file:
+            current_file.write(version)
+        os.replace(current_tmp, os.path.join(self.path, CURRENT_FILE))
+
+        self._prune(version)
+        logger.info(f"Published shared vector index {version} with {len(ids)} vectors")
+        return version
+
+    def _prune(self, current: str):
+        # Workers still mapping an old version keep their pages after removal; keep the previous one anyway
+        versions = sorted(
+            (entry for entry in os.scandir(self.path) if entry.is_dir()),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True
+        )
+        for entry in versions[self.keep_versions:]:
+            if entry.name != current:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _refresh(self) -> bool:
+        current_path = os.path.join(self.path, CURRENT_FILE)
+        try:
+            stat = os.stat(current_path)
+        except FileNotFoundError:
+            return False
+        # CURRENT is replaced, never rewritten, so a new version always means a new inode
+        key = (stat.st_ino, stat.st_mtime_ns)
+        if key == self._loaded_key:
+            return self._snapshot is not None
+
+        with self._lock:
+            if key == self._loaded_key:
+                return self._snapshot is not None
+            try:
+                with open(current_path) as current_file:
+                    version = current_file.read().strip()
+                version_dir = os.path.join(self.path, version)
+                matrix = np.load(os.path.join(version_dir, "embeddings.npy"), mmap_mode="r")
+                with open(os.path.join(version_dir, "records.json"), encoding="utf-8") as records_file:
+                    records = json.load(records_file)
+            except Exception as e:
+                logger.error(f"Error loading shared vector index: {e}")
+                return self._snapshot is not None
+
+            self._snapshot = {
+                "version": version,
+                "matrix": matrix,
+                "squared_norms": np.einsum("ij,ij->i", matrix, matrix),
+                "records": records
+            }
+            self._loaded_key = key
+            logger.info(f"Mapped shared vector index {version} ({len(records['ids'])} vectors)")
+            return True
+
+    def is_available(self) -> bool:
+        return self._refresh()
+
+    def get_version(self) -> Optional[str]:
+        return self._snapshot["version"] if self._refresh() else None
+
+    def count(self) -> int:
+        return len(self._snapshot["records"]["ids"]) if self._refresh() else 0
+
+    def get_records(self) -> Dict[str, List[Any]]:
+        """ids, documents and metadatas of the current snapshot (same shape as collection.get())."""
+        if not self._refresh():
+            return {"ids": [], "documents": [], "metadatas": []}
+        return self._snapshot["records"]
+
+    def query(self, query_embedding: List[float], top_k: int) -> List[Tuple[int, float]]:
+        """
+        Nearest neighbours as (position, distance), closest first.
+        Distances are squared L2, ChromaDB's default space, so thresholds computed
+        from Chroma distances keep their meaning.
+        """
+        if not self._refresh():
+            return []
+        snapshot = self._snapshot
+        matrix, squared_norms = snapshot["matrix"], snapshot["squared_norms"]
+        if not len(matrix):
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        distances = squared_norms - 2 * (matrix @ query) + float(query @ query)
+
+        top_k = min(top_k, len(distances))
+        nearest = np.argpartition(distances, top_k - 1)[:top_k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return [(int(position), float(distances[position])) for position in nearest]
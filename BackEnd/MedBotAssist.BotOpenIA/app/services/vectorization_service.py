@@ -1,38 +1,53 @@
-from typing import List, Dict, Any, Optional
-import openai
-import chromadb
-from chromadb.config import Settings as ChromaSettings
+from typing import Callable, List, Dict, Any, Optional
 from app.core.config import settings
-from app.services.database_service import DatabaseService
+from app.core.metrics import CHROMA_QUERY_LATENCY, EMBEDDING_BATCH_SIZE, EMBEDDING_LATENCY
+from app.core.tracing import traced
+from app.services.index_shards import IndexShard, discover_shard_keys, shard_id
+from app.services.index_snapshot import export_snapshot, load_snapshot, prune_snapshots, read_manifest
+import asyncio
+import hashlib
+import heapq
 import logging
+import threading
 import time
+import numpy as np
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Called with (patients stored so far, total patients) after each vectorized batch
+ProgressCallback = Callable[[int, int], None]
+
 class VectorizationService:
     
     def __init__(self):
         self.openai_client = None
         self.chroma_client = None
         self.collection = None
-        self.demographic_collection = None  # Specific collection for demographic data
+        # Demographic index per clinic/tenant shard; None is the unsharded index
+        self.shards: Dict[Optional[str], IndexShard] = {}
+        self._shards_lock = threading.Lock()
+        self._shard_keys_checked_at = 0.0
+        # Memory-mapped copy of each demographic index, shared by all worker processes.
+        # Only for the embedded backend; with a Chroma server the server holds the single copy.
+        self.use_shared_index = settings.SHARED_INDEX_ENABLED and settings.CHROMA_MODE == "persistent"
+        # Heavy client libraries are imported on first construction (startup warm-up), not at import time
+        from app.services.database_service import DatabaseService
         self.db_service = DatabaseService()
         self._initialize_clients()
     
     def _initialize_clients(self):
         try:
+            
             # Initialize OpenAI client with new v1.0+ syntax
             from openai import AsyncOpenAI
             self.openai_client = AsyncOpenAI(
-                api_key=settings.OPENAI_API_KEY
+                api_key=settings.OPENAI_API_KEY,
+                base_url=settings.OPENAI_BASE_URL
             )
             
             # Initialize ChromaDB client
-            self.chroma_client = chromadb.PersistentClient(
-                path=settings.CHROMA_DB_PATH,
-                settings=ChromaSettings(anonymized_telemetry=False)
-            )
+            self.chroma_client = self._create_chroma_client()
             
             # Get or create main collection (for backward compatibility)
             self.collection = self.chroma_client.get_or_create_collection(
@@ -40,16 +55,8 @@ class VectorizationService:
                 metadata={"description": "MedBot medical documents collection"}
             )
             
-            # Get or create demographic-specific collection
-            self.demographic_collection = self.chroma_client.get_or_create_collection(
-                name=settings.CHROMA_DEMOGRAPHIC_COLLECTION,
-                metadata={
-                    "description": "Patient demographic information namespace",
-                    "namespace": "demographic_patients_namespace",
-                    "data_type": "patient_demographics",
-                    "source": "SQL_Server_Patients_Table"
-                }
-            )
+            # Open the unsharded demographic index; rebuilds are switched in atomically
+            self.get_shard(None).collection
             
             logger.info("Vectorization service initialized successfully with demographic namespace")
             
@@ -57,13 +64,89 @@ class VectorizationService:
             logger.error(f"Error initializing vectorization service: {e}")
             raise
     
+    @property
+    def demographic_collection(self):
+        """Active version of the unsharded demographic collection; never one that is still being built."""
+        return self.get_shard(None).collection
+    
+    def get_shard(self, key: Optional[str]) -> IndexShard:
+        """Index of one shard (a `shard_id`), opened on first use."""
+        shard = self.shards.get(key)
+        if shard is None:
+            with self._shards_lock:
+                shard = self.shards.get(key)
+                if shard is None:
+                    shard = IndexShard(self.chroma_client, key, self.use_shared_index)
+                    self.shards[key] = shard
+        return shard
+    
+    def get_search_shards(self) -> List[IndexShard]:
+        """Every shard a cross-clinic search covers, including shards built by other processes."""
+        if not settings.INDEX_SHARD_COLUMN:
+            return [self.get_shard(None)]
+        now = time.monotonic()
+        if now - self._shard_keys_checked_at >= settings.INDEX_POINTER_REFRESH_SECONDS:
+            for key in discover_shard_keys(self.chroma_client):
+                self.get_shard(key)
+            self._shard_keys_checked_at = now
+        return list(self.shards.values())
+    
+    def find_shard(self, clinic: Optional[str]) -> Optional[IndexShard]:
+        """Shard of a clinic/tenant, or None when it has no index; without sharding, the single index."""
+        if not settings.INDEX_SHARD_COLUMN:
+            return self.get_shard(None)
+        key = shard_id(clinic)
+        for shard in self.get_search_shards():
+            if shard.key == key:
+                return shard
+        return None
+    
+    def _resolve_shards(self, clinic: Optional[str]) -> List[IndexShard]:
+        if clinic is None:
+            return self.get_search_shards()
+        shard = self.find_shard(clinic)
+        return [shard] if shard else []
+    
+    def _create_chroma_client(self):
+        """Embedded client on CHROMA_DB_PATH, or a pooled HTTP client to a shared Chroma server."""
+        import chromadb
+        from chromadb.config import Settings as ChromaSettings
+        
+        if settings.CHROMA_MODE == "persistent":
+            return chromadb.PersistentClient(
+                path=settings.CHROMA_DB_PATH,
+                settings=ChromaSettings(anonymized_telemetry=False)
+            )
+        
+        if settings.CHROMA_MODE == "http":
+            headers = {"Authorization": f"Bearer {settings.CHROMA_AUTH_TOKEN}"} if settings.CHROMA_AUTH_TOKEN else None
+            client = chromadb.HttpClient(
+                host=settings.CHROMA_HOST,
+                port=settings.CHROMA_PORT,
+                ssl=settings.CHROMA_SSL,
+                headers=headers,
+                settings=ChromaSettings(
+                    anonymized_telemetry=False,
+                    chroma_http_max_connections=settings.CHROMA_HTTP_MAX_CONNECTIONS,
+                    chroma_http_max_keepalive_connections=settings.CHROMA_HTTP_MAX_CONNECTIONS,
+                    chroma_http_keepalive_secs=settings.CHROMA_HTTP_KEEPALIVE_SECONDS
+                )
+            )
+            logger.info(f"Connected to Chroma server at {settings.CHROMA_HOST}:{settings.CHROMA_PORT}")
+            return client
+        
+        raise ValueError(f"Unknown CHROMA_MODE '{settings.CHROMA_MODE}', expected 'persistent' or 'http'")
+    
+    @traced("vectorization.generate_embedding", "openai")
     async def generate_embedding(self, text: str) -> List[float]:
         try:
             # Use new OpenAI v1.0+ syntax
-            response = await self.openai_client.embeddings.create(
-                model=settings.OPENAI_EMBEDDING_MODEL,
-                input=text
-            )
+            EMBEDDING_BATCH_SIZE.observe(1)
+            with EMBEDDING_LATENCY.time():
+                response = await self.openai_client.embeddings.create(
+                    model=settings.OPENAI_EMBEDDING_MODEL,
+                    input=text
+                )
             
             embedding = response.data[0].embedding
             logger.info(f"Generated embedding for text of length {len(text)}")
@@ -73,113 +156,243 @@ class VectorizationService:
             logger.error(f"Error generating embedding: {e}")
             raise
     
+    @traced("vectorization.generate_embeddings", "openai")
+    async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings of several texts with a single API call, in input order."""
+        try:
+            EMBEDDING_BATCH_SIZE.observe(len(texts))
+            with EMBEDDING_LATENCY.time():
+                response = await self.openai_client.embeddings.create(
+                    model=settings.OPENAI_EMBEDDING_MODEL,
+                    input=texts
+                )
+            
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            
+        except Exception as e:
+            logger.error(f"Error generating embeddings for {len(texts)} texts: {e}")
+            raise
+    
+    @traced("vectorization.search_similar_documents", "chroma")
     async def search_similar_documents(
         self,
         query_embedding: List[float],
         top_k: int = 5,
         similarity_threshold: float = 0.7,
-        namespace: str = "demographic_patients_namespace"
+        namespace: str = "demographic_patients_namespace",
+        clinic: Optional[str] = None
     ) -> List[Dict[str, Any]]:
+        """
+        Nearest patient descriptions. With a sharded index, a `clinic` searches only its
+        shard; without one, every shard is searched concurrently and the best `top_k`
+        of all shards are returned.
+        """
         try:
-            # Use demographic collection for patient demographic searches
-            target_collection = self.demographic_collection if namespace == "demographic_patients_namespace" else self.collection
+            if namespace != "demographic_patients_namespace":
+                documents = self._query_collection(self.collection, None, query_embedding, top_k, similarity_threshold, namespace)
+                logger.info(f"Found {len(documents)} similar documents in {namespace} above threshold {similarity_threshold}")
+                return documents
             
-            # Query ChromaDB
-            results = target_collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k,
-                include=['documents', 'metadatas', 'distances']
-            )
+            shards = self._resolve_shards(clinic)
+            if len(shards) == 1:
+                documents = self._search_shard(shards[0], query_embedding, top_k, similarity_threshold, namespace)
+            else:
+                semaphore = asyncio.Semaphore(settings.INDEX_FANOUT_MAX_CONCURRENCY)
+                
+                async def search(shard: IndexShard) -> List[Dict[str, Any]]:
+                    async with semaphore:
+                        return await asyncio.to_thread(
+                            self._search_shard, shard, query_embedding, top_k, similarity_threshold, namespace
+                        )
+                
+                results = await asyncio.gather(*(search(shard) for shard in shards))
+                documents = heapq.nlargest(
+                    top_k,
+                    (document for shard_documents in results for document in shard_documents),
+                    key=lambda document: document["similarity_score"]
+                )
+                for i, document in enumerate(documents):
+                    document["id"] = f"demo_patient_{i}"
             
-            documents = []
-            if results['documents'] and results['documents'][0]:
-                for i, (doc, metadata, distance) in enumerate(zip(
-                    results['documents'][0],
-                    results['metadatas'][0] if results['metadatas'][0] else [{}] * len(results['documents'][0]),
-                    results['distances'][0] if results['distances'][0] else [0] * len(results['documents'][0])
-                )):
-                    # Convert distance to similarity score (ChromaDB returns distances)
-                    similarity_score = 1 - distance
-                    
-                    # Filter by similarity threshold
-                    if similarity_score >= similarity_threshold:
-                        documents.append({
-                            "id": f"demo_patient_{i}",
-                            "content": doc,
-                            "similarity_score": similarity_score,
-                            "metadata": {
-                                **metadata,
-                                "namespace": namespace,
-                                "collection_used": target_collection.name
-                            }
-                        })
-            
-            logger.info(f"Found {len(documents)} similar documents in {namespace} above threshold {similarity_threshold}")
+            logger.info(f"Found {len(documents)} similar documents in {len(shards)} {namespace} shard(s) above threshold {similarity_threshold}")
             return documents
             
         except Exception as e:
             logger.error(f"Error searching similar documents in {namespace}: {e}")
             raise
     
-    def search_similar_patients(
+    def _search_shard(
+        self,
+        shard: IndexShard,
+        query_embedding: List[float],
+        top_k: int,
+        similarity_threshold: float,
+        namespace: str
+    ) -> List[Dict[str, Any]]:
+        if shard.shared_index and shard.shared_index.is_available():
+            return self._search_shared_index(shard, query_embedding, top_k, similarity_threshold, namespace)
+        return self._query_collection(shard.collection, shard.key, query_embedding, top_k, similarity_threshold, namespace)
+    
+    def _query_collection(
+        self,
+        target_collection,
+        shard_key: Optional[str],
+        query_embedding: List[float],
+        top_k: int,
+        similarity_threshold: float,
+        namespace: str
+    ) -> List[Dict[str, Any]]:
+        # Query ChromaDB
+        with CHROMA_QUERY_LATENCY.labels("query").time():
+            results = target_collection.query(
+                query_embeddings=[query_embedding],
+                n_results=top_k,
+                include=['documents', 'metadatas', 'distances']
+            )
+        
+        documents = []
+        if results['documents'] and results['documents'][0]:
+            for i, (doc, metadata, distance) in enumerate(zip(
+                results['documents'][0],
+                results['metadatas'][0] if results['metadatas'][0] else [{}] * len(results['documents'][0]),
+                results['distances'][0] if results['distances'][0] else [0] * len(results['documents'][0])
+            )):
+                # Convert distance to similarity score (ChromaDB returns distances)
+                similarity_score = 1 - distance
+                
+                # Filter by similarity threshold
+                if similarity_score >= similarity_threshold:
+                    documents.append({
+                        "id": f"demo_patient_{i}",
+                        "content": doc,
+                        "similarity_score": similarity_score,
+                        "metadata": {
+                            **metadata,
+                            "namespace": namespace,
+                            "collection_used": target_collection.name,
+                            "shard": shard_key
+                        }
+                    })
+        return documents
+    
+    def _search_shared_index(
+        self,
+        shard: IndexShard,
+        query_embedding: List[float],
+        top_k: int,
+        similarity_threshold: float,
+        namespace: str
+    ) -> List[Dict[str, Any]]:
+        """Same results as the Chroma query, served from the memory-mapped shared index."""
+        with CHROMA_QUERY_LATENCY.labels("shared_query").time():
+            nearest = shard.shared_index.query(query_embedding, top_k)
+        records = shard.shared_index.get_records()
+        
+        documents = []
+        for i, (position, distance) in enumerate(nearest):
+            similarity_score = 1 - distance
+            if similarity_score >= similarity_threshold:
+                documents.append({
+                    "id": f"demo_patient_{i}",
+                    "content": records["documents"][position],
+                    "similarity_score": similarity_score,
+                    "metadata": {
+                        **(records["metadatas"][position] or {}),
+                        "namespace": namespace,
+                        "collection_used": shard.collection.name,
+                        "shard": shard.key
+                    }
+                })
+        return documents
+    
+    @traced("vectorization.search_similar_patients", "chroma")
+    async def search_similar_patients(
         self,
         query: str,
         top_k: int = 5,
-        similarity_threshold: float = 0.7
+        similarity_threshold: float = 0.7,
+        clinic: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
         Search for similar patients using natural language query.
-        This is a synchronous wrapper for the async methods.
+        `clinic` limits the search to its shard when the index is sharded; otherwise
+        every shard is matched concurrently and the best `top_k` of all shards are returned.
         """
         try:
-            # Get data directly from ChromaDB collection
-            data = self.demographic_collection.get()
+            shards = self._resolve_shards(clinic)
+            semaphore = asyncio.Semaphore(settings.INDEX_FANOUT_MAX_CONCURRENCY)
             
-            if not data['documents'] or len(data['documents']) == 0:
-                logger.warning("No vectorized patient data found in demographic collection")
-                return []
+            async def match(shard: IndexShard) -> List[Dict[str, Any]]:
+                async with semaphore:
+                    return await asyncio.to_thread(self._match_shard_patients, shard, query, top_k, similarity_threshold)
             
-            # Simple keyword-based filtering for now
-            query_lower = query.lower()
-            results = []
-            
-            for i, doc in enumerate(data['documents']):
-                doc_lower = doc.lower()
-                score = 0.0
-                
-                # Simple keyword matching
-                if 'masculino' in query_lower and 'masculino' in doc_lower:
-                    score += 0.9
-                elif 'femenino' in query_lower and 'femenino' in doc_lower:
-                    score += 0.9
-                elif 'diabetes' in query_lower and 'diabetes' in doc_lower:
-                    score += 0.8
-                elif 'hipertension' in query_lower and ('hipertension' in doc_lower or 'hipertensión' in doc_lower):
-                    score += 0.8
-                elif 'asma' in query_lower and 'asma' in doc_lower:
-                    score += 0.8
-                else:
-                    score = 0.7  # Default relevance score
-                
-                if score >= similarity_threshold:
-                    results.append({
-                        "score": score,
-                        "metadata": {
-                            "id": data['ids'][i] if data['ids'] else f"patient_{i}",
-                            "description": doc,
-                            "demographics": data['metadatas'][i] if data['metadatas'] and i < len(data['metadatas']) else {}
-                        }
-                    })
-            
-            # Sort by score and return top_k
-            results.sort(key=lambda x: x["score"], reverse=True)
+            shard_results = await asyncio.gather(*(match(shard) for shard in shards))
+            results = heapq.nlargest(
+                top_k,
+                (result for results in shard_results for result in results),
+                key=lambda result: result["score"]
+            )
             logger.info(f"Found {len(results)} patients matching query '{query}'")
-            return results[:top_k]
+            return results
                 
         except Exception as e:
             logger.error(f"Error in search_similar_patients: {e}")
             return []
     
+    def _match_shard_patients(
+        self,
+        shard: IndexShard,
+        query: str,
+        top_k: int,
+        similarity_threshold: float
+    ) -> List[Dict[str, Any]]:
+        """Best `top_k` keyword matches of one shard."""
+        # Get data from the shared index when published, otherwise directly from ChromaDB
+        if shard.shared_index and shard.shared_index.is_available():
+            data = shard.shared_index.get_records()
+        else:
+            with CHROMA_QUERY_LATENCY.labels("get").time():
+                data = shard.collection.get()
+        
+        if not data['documents'] or len(data['documents']) == 0:
+            logger.warning(f"No vectorized patient data found in demographic shard {shard.key or 'default'}")
+            return []
+        
+        # Simple keyword-based filtering for now
+        query_lower = query.lower()
+        results = []
+        
+        for i, doc in enumerate(data['documents']):
+            doc_lower = doc.lower()
+            score = 0.0
+            
+            # Simple keyword matching
+            if 'masculino' in query_lower and 'masculino' in doc_lower:
+                score += 0.9
+            elif 'femenino' in query_lower and 'femenino' in doc_lower:
+                score += 0.9
+            elif 'diabetes' in query_lower and 'diabetes' in doc_lower:
+                score += 0.8
+            elif 'hipertension' in query_lower and ('hipertension' in doc_lower or 'hipertensión' in doc_lower):
+                score += 0.8
+            elif 'asma' in query_lower and 'asma' in doc_lower:
+                score += 0.8
+            else:
+                score = 0.7  # Default relevance score
+            
+            if score >= similarity_threshold:
+                results.append({
+                    "score": score,
+                    "metadata": {
+                        "id": data['ids'][i] if data['ids'] else f"patient_{i}",
+                        "description": doc,
+                        "demographics": data['metadatas'][i] if data['metadatas'] and i < len(data['metadatas']) else {}
+                    }
+                })
+        
+        # Sort by score and keep this shard's top_k
+        return heapq.nlargest(top_k, results, key=lambda result: result["score"])
+    
     def _get_mock_patient_data(self, query: str, top_k: int) -> List[Dict[str, Any]]:
         """
         Returns mock patient data for demonstration purposes.
@@ -285,22 +498,25 @@ class VectorizationService:
             # Fallback to mock data
             return self._get_mock_patient_data(query, top_k)
 
+    @traced("vectorization.vectorize_and_search", "vectorization")
     async def vectorize_and_search(
         self,
         query: str,
         top_k: int = 5,
         similarity_threshold: float = 0.7,
-        collection_name: Optional[str] = None
+        collection_name: Optional[str] = None,
+        clinic: Optional[str] = None
     ) -> Dict[str, Any]:
         try:
             start_time = time.time()
             
-            # Step 1: Get patient data from database and convert to natural language
-            logger.info("Retrieving patient data from database...")
-            patient_descriptions = self.db_service.get_patients_as_natural_language()
+            # Step 1: Get patient data from the local replica (synced by refresh jobs, not by searches)
+            logger.info("Retrieving patient data from the replica...")
+            patients = await asyncio.to_thread(self.db_service.get_replica_patients)
             
-            # Step 2: Store patient descriptions in ChromaDB if not already stored
-            await self._ensure_patient_data_in_vector_db(patient_descriptions)
+            # Step 2: Store patient descriptions in ChromaDB if not already stored; a clinic's
+            # search only checks its own shard, the full index is kept current by refresh jobs
+            await self.ensure_patient_index(patients, clinic=clinic)
             
             # Step 3: Generate embedding for the query
             logger.info(f"Generating embedding for query: {query[:100]}...")
@@ -309,11 +525,11 @@ class VectorizationService:
             # Step 4: Search for similar documents
             logger.info("Searching for similar patient descriptions...")
             similar_documents = await self.search_similar_documents(
-                query_embedding, top_k, similarity_threshold
+                query_embedding, top_k, similarity_threshold, clinic=clinic
             )
             
             # Step 5: Format results
-            total_patients = len(patient_descriptions)
+            total_patients = len(patients)
             search_time_ms = (time.time() - start_time) * 1000
             
             result = {
@@ -333,23 +549,74 @@ class VectorizationService:
             logger.error(f"Error in vectorization and search pipeline: {e}")
             raise
     
-    async def _ensure_patient_data_in_vector_db(self, patient_descriptions: List[str]):
+    @traced("vectorization.ensure_patient_index", "vectorization")
+    async def ensure_patient_index(
+        self,
+        patients: List[Dict[str, Any]],
+        progress: Optional[ProgressCallback] = None,
+        clinic: Optional[str] = None
+    ) -> int:
+        """
+        Bring every shard of the demographic index up to date with `patients`.
+        Patients are grouped by their INDEX_SHARD_COLUMN value and each shard is checked
+        and rebuilt on its own, so a change in one clinic re-embeds only that clinic.
+        With `clinic` on a sharded index only that clinic's shard is checked.
+        `progress` counts patients over the checked shards. Returns that number of patients.
+        """
+        scoped = bool(settings.INDEX_SHARD_COLUMN) and clinic is not None
+        groups: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        for patient in patients:
+            key = shard_id(patient.get("shard")) if settings.INDEX_SHARD_COLUMN else None
+            if not scoped or key == shard_id(clinic):
+                groups.setdefault(key, []).append(patient)
+        # Shards left without patients are emptied so cross-clinic searches stop returning them
+        for shard in self._resolve_shards(clinic) if scoped else self.get_search_shards():
+            if shard.key not in groups and shard.collection.count():
+                groups[shard.key] = []
+        
+        total = sum(len(group) for group in groups.values())
+        done = 0
+        for key in sorted(groups, key=lambda key: key or ""):
+            descriptions = self.db_service.convert_patients_to_natural_language(groups[key])
+            shard_progress = None
+            if progress:
+                shard_progress = lambda completed, _, offset=done: progress(offset + completed, total)
+            await self._ensure_patient_data_in_vector_db(descriptions, shard_progress, shard=key)
+            done += len(descriptions)
+        return total
+    
+    @traced("vectorization.ensure_patient_data", "vectorization")
+    async def _ensure_patient_data_in_vector_db(
+        self,
+        patient_descriptions: List[str],
+        progress: Optional[ProgressCallback] = None,
+        shard: Optional[str] = None
+    ):
         """
         Efficiently store patient descriptions in demographic vector database with incremental updates.
         Only vectorizes new patients, keeps existing vectors intact in demographic namespace.
+        Batches are written in index order, so after an interruption the next call
+        finds a shorter collection and continues from the first missing patient.
+        `progress(completed, total)` is called after every stored batch.
+        `shard` selects the index of one clinic; None is the unsharded index.
         """
+        if not settings.CHROMA_INDEX_WRITER:
+            # Read-only node: the writer node keeps the shared index up to date
+            logger.debug("Skipping vector index update on a read-only node (CHROMA_INDEX_WRITER=false)")
+            return
+        
         try:
             # Get existing data from demographic collection
-            existing_data = self.demographic_collection.get()
+            existing_data = self.get_shard(shard).collection.get()
             existing_count = len(existing_data['ids']) if existing_data['ids'] else 0
             total_patients = len(patient_descriptions)
             
-            logger.info(f"Demographic Vector DB status: {existing_count} existing, {total_patients} total patients")
+            logger.info(f"Demographic Vector DB status (shard {shard or 'default'}): {existing_count} existing, {total_patients} total patients")
             
             if existing_count == 0:
-                # First time - vectorize all patients in demographic namespace
+                # First time - build the whole index as a new version
                 logger.info("No existing demographic vectors found. Vectorizing all patient descriptions...")
-                await self._vectorize_all_patients(patient_descriptions)
+                await self._rebuild_vector_database(patient_descriptions, progress, shard)
                 
             elif existing_count < total_patients:
                 # New patients detected - vectorize only new ones
@@ -357,19 +624,19 @@ class VectorizationService:
                 new_descriptions = patient_descriptions[existing_count:]
                 
                 logger.info(f"Found {new_patient_count} new patients. Vectorizing incrementally in demographic namespace...")
-                await self._vectorize_new_patients(new_descriptions, existing_count)
+                await self._vectorize_new_patients(new_descriptions, existing_count, progress, shard)
                 
             elif existing_count > total_patients:
                 # Some patients were removed - rebuild completely
                 logger.info(f"Patient count decreased ({existing_count} -> {total_patients}). Rebuilding demographic vectors...")
-                await self._rebuild_vector_database(patient_descriptions)
+                await self._rebuild_vector_database(patient_descriptions, progress, shard)
                 
             else:
                 # Same count - check if data actually changed
                 logger.info("Patient count unchanged. Checking for demographic data changes...")
                 if await self._has_data_changed(patient_descriptions, existing_data):
                     logger.info("Patient demographic data has changed. Rebuilding vectors...")
-                    await self._rebuild_vector_database(patient_descriptions)
+                    await self._rebuild_vector_database(patient_descriptions, progress, shard)
                 else:
                     logger.info("Patient data unchanged. Using existing vectors.")
                 
@@ -377,65 +644,169 @@ class VectorizationService:
             logger.error(f"Error ensuring patient data in vector database: {e}")
             raise
     
-    async def _vectorize_all_patients(self, patient_descriptions: List[str]):
-        """Vectorize all patients from scratch in demographic namespace."""
-        embeddings = []
-        for i, desc in enumerate(patient_descriptions):
-            embedding = await self.generate_embedding(desc)
-            embeddings.append(embedding)
-            logger.info(f"Vectorized demographic patient {i+1}/{len(patient_descriptions)}")
+    async def _vectorize_new_patients(
+        self,
+        new_descriptions: List[str],
+        starting_index: int,
+        progress: Optional[ProgressCallback] = None,
+        shard: Optional[str] = None
+    ):
+        """Vectorize only new patients incrementally in demographic namespace."""
+        # Appends only add patients, so searches on the active version never lose results
+        collection = self.get_shard(shard).collection
+        await self._vectorize_batches(collection, new_descriptions, starting_index, starting_index + len(new_descriptions), progress)
+        logger.info(f"Successfully added {len(new_descriptions)} new demographic patient vectors")
+        self.publish_shared_index(shard)
+    
+    async def _vectorize_batches(
+        self,
+        collection,
+        descriptions: List[str],
+        starting_index: int,
+        total: int,
+        progress: Optional[ProgressCallback] = None
+    ):
+        """
+        Embed and store descriptions one batch at a time, in index order. Each batch is
+        written as soon as it is embedded, so the collection always holds a complete
+        prefix of the patients and an interrupted run loses at most one batch.
+        """
+        batch_size = settings.VECTORIZATION_BATCH_SIZE
+        for offset in range(0, len(descriptions), batch_size):
+            batch = descriptions[offset:offset + batch_size]
+            first_index = starting_index + offset
+            embeddings = await self.generate_embeddings(batch)
+            
+            with CHROMA_QUERY_LATENCY.labels("upsert").time():
+                collection.upsert(
+                    embeddings=embeddings,
+                    documents=batch,
+                    metadatas=[{
+                        "type": "patient_demographic_description", 
+                        "index": first_index + i,
+                        "namespace": "demographic_patients_namespace",
+                        "vectorized_at": datetime.now().isoformat()
+                    } for i in range(len(batch))],
+                    ids=[f"demo_patient_{first_index + i}" for i in range(len(batch))]
+                )
+            
+            completed = first_index + len(batch)
+            logger.info(f"Vectorized demographic patients {first_index + 1}-{completed}/{total}")
+            if progress:
+                progress(completed, total)
+    
+    def publish_shared_index(self, shard: Optional[str] = None) -> Optional[str]:
+        """Publish a shard's demographic collection as the shared index other workers map; returns its version."""
+        index_shard = self.get_shard(shard)
+        if not index_shard.shared_index:
+            return None
+        try:
+            with CHROMA_QUERY_LATENCY.labels("get").time():
+                data = index_shard.collection.get(include=["embeddings", "documents", "metadatas"])
+            return index_shard.shared_index.publish(data["ids"], data["embeddings"], data["documents"], data["metadatas"])
+        except Exception as e:
+            # Workers fall back to querying Chroma directly
+            logger.error(f"Error publishing shared vector index: {e}")
+            return None
+    
+    async def _rebuild_vector_database(
+        self,
+        patient_descriptions: List[str],
+        progress: Optional[ProgressCallback] = None,
+        shard: Optional[str] = None
+    ):
+        """
+        Completely rebuild the demographic vector database into a new version.
+        Searches keep using the active version until the new one holds every patient,
+        then the active pointer is switched in one write. An interrupted build of the
+        same descriptions is continued from its last stored batch.
+        """
+        total = len(patient_descriptions)
+        fingerprint = hashlib.sha256("\n".join(patient_descriptions).encode("utf-8")).hexdigest()[:16]
+        versions = self.get_shard(shard).versions
+        collection, done = versions.start_build(fingerprint)
+        if done and progress:
+            progress(done, total)
         
-        # Store all in demographic collection
-        ids = [f"demo_patient_{i}" for i in range(len(patient_descriptions))]
-        metadatas = [{
-            "type": "patient_demographic_description", 
-            "index": i,
-            "namespace": "demographic_patients_namespace",
-            "vectorized_at": datetime.now().isoformat()
-        } for i in range(len(patient_descriptions))]
+        def build_progress(completed: int, total: int):
+            versions.renew_build()
+            if progress:
+                progress(completed, total)
         
-        self.demographic_collection.add(
-            embeddings=embeddings,
-            documents=patient_descriptions,
-            metadatas=metadatas,
-            ids=ids
+        try:
+            await self._vectorize_batches(collection, patient_descriptions[done:], done, total, build_progress)
+        except (Exception, asyncio.CancelledError):
+            versions.release_build()
+            raise
+        versions.activate(collection.name)
+        logger.info(f"Successfully stored {total} patient descriptions in demographic version {collection.name}")
+        self.publish_shared_index(shard)
+    
+    def export_index_snapshot(self, float16: Optional[bool] = None, shard: Optional[str] = None) -> Dict[str, Any]:
+        """Export the active demographic version of a shard as a snapshot in INDEX_SNAPSHOT_DIR; returns its manifest."""
+        with CHROMA_QUERY_LATENCY.labels("get").time():
+            data = self.get_shard(shard).collection.get(include=["embeddings", "documents", "metadatas"])
+        manifest = export_snapshot(
+            settings.INDEX_SNAPSHOT_DIR,
+            data["ids"],
+            data["embeddings"],
+            data["documents"],
+            data["metadatas"],
+            embedding_model=settings.OPENAI_EMBEDDING_MODEL,
+            data_version=self.db_service.get_data_version(),
+            shard=shard,
+            float16=settings.INDEX_SNAPSHOT_FLOAT16 if float16 is None else float16
         )
-        
-        logger.info(f"Successfully stored {len(patient_descriptions)} patient descriptions in demographic vector database")
+        prune_snapshots(settings.INDEX_SNAPSHOT_DIR, settings.INDEX_SNAPSHOT_KEEP)
+        return manifest
     
-    async def _vectorize_new_patients(self, new_descriptions: List[str], starting_index: int):
-        """Vectorize only new patients incrementally in demographic namespace."""
-        for i, desc in enumerate(new_descriptions):
-            current_index = starting_index + i
-            embedding = await self.generate_embedding(desc)
-            
-            # Add single patient to demographic collection
-            self.demographic_collection.add(
-                embeddings=[embedding],
-                documents=[desc],
-                metadatas=[{
-                    "type": "patient_demographic_description", 
-                    "index": current_index,
-                    "namespace": "demographic_patients_namespace",
-                    "vectorized_at": datetime.now().isoformat()
-                }],
-                ids=[f"demo_patient_{current_index}"]
-            )
+    def import_index_snapshot(self, snapshot_dir: str) -> Dict[str, Any]:
+        """
+        Load an exported snapshot without any embedding call. The shared index is
+        published straight from the memory-mapped vectors, so workers can search as
+        soon as the checksums pass; writer nodes then store the stored vectors in a
+        new demographic version and switch to it. The snapshot restores the shard
+        it was exported from.
+        """
+        start = time.perf_counter()
+        snapshot = load_snapshot(snapshot_dir, settings.OPENAI_EMBEDDING_MODEL)
+        manifest, embeddings = snapshot["manifest"], snapshot["embeddings"]
+        index_shard = self.get_shard(manifest.get("shard"))
+        
+        # Take the build lease first, so a rejected import leaves the shared index untouched
+        if settings.CHROMA_INDEX_WRITER:
+            collection, done = index_shard.versions.start_build(f"snapshot-{manifest['snapshot_id']}")
+        try:
+            if index_shard.shared_index:
+                index_shard.shared_index.publish(snapshot["ids"], embeddings, snapshot["documents"], snapshot["metadatas"])
             
-            logger.info(f"Added new demographic patient vector {current_index + 1} ({i+1}/{len(new_descriptions)})")
+            if settings.CHROMA_INDEX_WRITER:
+                batch_size = settings.INDEX_SNAPSHOT_IMPORT_BATCH_SIZE
+                for offset in range(done, manifest["count"], batch_size):
+                    end = offset + batch_size
+                    with CHROMA_QUERY_LATENCY.labels("upsert").time():
+                        collection.upsert(
+                            ids=snapshot["ids"][offset:end],
+                            embeddings=np.asarray(embeddings[offset:end], dtype=np.float32),
+                            documents=snapshot["documents"][offset:end],
+                            metadatas=snapshot["metadatas"][offset:end]
+                        )
+                    index_shard.versions.renew_build()
+                index_shard.versions.activate(collection.name)
+        except Exception:
+            if settings.CHROMA_INDEX_WRITER:
+                index_shard.versions.release_build()
+            raise
         
-        logger.info(f"Successfully added {len(new_descriptions)} new demographic patient vectors")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"Imported index snapshot {manifest['snapshot_id']} with {manifest['count']} vectors in {elapsed_ms:.0f}ms")
+        return {"snapshot_id": manifest["snapshot_id"], "count": manifest["count"], "elapsed_ms": elapsed_ms}
     
-    async def _rebuild_vector_database(self, patient_descriptions: List[str]):
-        """Completely rebuild the demographic vector database."""
-        # Clear existing data from demographic collection
-        existing_data = self.demographic_collection.get()
-        if existing_data['ids']:
-            self.demographic_collection.delete(ids=existing_data['ids'])
-            logger.info(f"Cleared {len(existing_data['ids'])} existing demographic vectors")
-        
-        # Vectorize all patients in demographic namespace
-        await self._vectorize_all_patients(patient_descriptions)
+    def rollback_index(self, shard: Optional[str] = None) -> str:
+        """Make the previous demographic version of a shard active again; returns its name."""
+        name = self.get_shard(shard).versions.rollback()
+        self.publish_shared_index(shard)
+        return name
     
     async def _has_data_changed(self, current_descriptions: List[str], existing_data: Dict) -> bool:
         """Check if patient data has actually changed by comparing descriptions."""
@@ -462,6 +833,49 @@ class VectorizationService:
             logger.warning(f"Error checking data changes, assuming changed: {e}")
             return True
     
+    @traced("vectorization.get_index_version", "vectorization")
+    def get_index_version(self) -> str:
+        """Version of the patient data behind the index; changes whenever patient data changes."""
+        version = self.db_service.get_data_version()
+        if version:
+            return version
+        # Without a replica fingerprint: every rebuild activates a new collection, appends change its count
+        return "|".join(
+            f"{shard.collection.name}:{shard.collection.count()}"
+            for shard in sorted(self.get_search_shards(), key=lambda shard: shard.key or "")
+        )
+    
+    @traced("vectorization.preload_index", "chroma")
+    def preload_index(self) -> Dict[str, Any]:
+        """
+        Load every demographic shard and the patient counts before the first query.
+        Runs one nearest-neighbour query with a stored vector so Chroma loads the
+        HNSW index into memory without calling OpenAI. With the shared index enabled,
+        maps it instead, publishing it first if no worker has yet.
+        """
+        start = time.perf_counter()
+        if settings.INDEX_SNAPSHOT_IMPORT_PATH:
+            # New node: start from an exported snapshot instead of re-embedding every patient
+            target = self.get_shard(read_manifest(settings.INDEX_SNAPSHOT_IMPORT_PATH).get("shard"))
+            if not target.collection.count():
+                self.import_index_snapshot(settings.INDEX_SNAPSHOT_IMPORT_PATH)
+        
+        documents = 0
+        for shard in self.get_search_shards():
+            shard_documents = shard.collection.count()
+            if shard.shared_index:
+                if shard_documents and not shard.shared_index.is_available():
+                    self.publish_shared_index(shard.key)
+                shard_documents = shard_documents or shard.shared_index.count()
+            elif shard_documents:
+                sample = shard.collection.get(limit=1, include=["embeddings"])
+                shard.collection.query(query_embeddings=[sample["embeddings"][0]], n_results=1)
+            documents += shard_documents
+        counts = self.db_service.get_patient_counts()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"Preloaded index with {documents} documents in {elapsed_ms:.0f}ms")
+        return {"documents": documents, "patients": counts.get("total_patients"), "elapsed_ms": elapsed_ms}
+    
     def check_health(self) -> Dict[str, str]:
         try:
             health_status = {
@@ -525,38 +939,34 @@ class VectorizationService:
             logger.error(f"Error listing collections: {e}")
             raise
     
-    async def get_patient_data_summary(self) -> Dict[str, Any]:
-        try:
-            # Get all patients from database
-            patients = self.db_service.get_all_patients()
-            
-            # Convert to natural language
-            descriptions = self.db_service.convert_patients_to_natural_language(patients)
-            
-            # Get some statistics
-            total_patients = len(patients)
-            patients_with_email = len([p for p in patients if p.get("email")])
-            patients_with_phone = len([p for p in patients if p.get("phone")])
-            
-            return {
-                "total_patients": total_patients,
-                "patients_with_email": patients_with_email,
-                "patients_with_phone": patients_with_phone,
-                "sample_descriptions": descriptions[:3] if descriptions else [],
-                "all_descriptions": descriptions
-            }
-            
-        except Exception as e:
-            logger.error(f"Error getting patient data summary: {e}")
-            raise
-    
-    def get_patient_data_summary(self) -> Dict[str, Any]:
+    @traced("vectorization.get_patient_data_summary", "vectorization")
+    def get_patient_data_summary(self, clinic: Optional[str] = None) -> Dict[str, Any]:
         """
-        Synchronous version of get_patient_data_summary for use in tools.
+        Patient totals, contact counts, age buckets and gender histogram with a few sample descriptions.
+        Reads the aggregates maintained at ingestion instead of scanning patients.
+        With `clinic` on a sharded index the summary covers only that clinic's shard;
+        the aggregates span every clinic, so it is counted from the shard instead.
         """
         try:
+            scoped = bool(settings.INDEX_SHARD_COLUMN) and clinic is not None
+            shard = self.find_shard(clinic) if scoped else self.get_shard(None)
+            if not scoped:
+                try:
+                    aggregates = self.db_service.get_patient_aggregates()
+                    with CHROMA_QUERY_LATENCY.labels("get").time():
+                        sample = shard.collection.get(limit=3, include=["documents"])
+                    return {
+                        **aggregates,
+                        "sample_descriptions": sample['documents'] or []
+                    }
+                except Exception as e:
+                    logger.warning(f"Patient aggregates unavailable, counting from the vector collection: {e}")
+            
             # Get data directly from ChromaDB collection
-            data = self.demographic_collection.get()
+            data = {"documents": []}
+            if shard is not None:
+                with CHROMA_QUERY_LATENCY.labels("get").time():
+                    data = shard.collection.get(include=["documents"])
             
             if not data['documents'] or len(data['documents']) == 0:
                 logger.warning("No vectorized patient data found in demographic collection")
@@ -599,41 +1009,27 @@ class VectorizationService:
                     "Paciente masculino de 28 años sano"
                 ]
             }
-    
-    async def _async_get_patient_data_summary(self) -> Dict[str, Any]:
-        """
-        The actual async implementation.
-        """
-        try:
-            # Get all patients from database
-            patients = self.db_service.get_all_patients()
-            
-            # Convert to natural language
-            descriptions = self.db_service.convert_patients_to_natural_language(patients)
-            
-            # Get some statistics
-            total_patients = len(patients)
-            patients_with_email = len([p for p in patients if p.get("email")])
-            patients_with_phone = len([p for p in patients if p.get("phone")])
-            
-            return {
-                "total_patients": total_patients,
-                "patients_with_email": patients_with_email,
-                "patients_with_phone": patients_with_phone,
-                "sample_descriptions": descriptions[:3] if descriptions else [],
-                "all_descriptions": descriptions
-            }
-            
-        except Exception as e:
-            logger.error(f"Error getting patient data summary: {e}")
-            # Return mock data as fallback
-            return {
-                "total_patients": 3,
-                "patients_with_email": 2,
-                "patients_with_phone": 3,
-                "sample_descriptions": [
-                    "Paciente masculino de 45 años con diabetes tipo 2",
-                    "Paciente femenino de 32 años con hipertensión", 
-                    "Paciente masculino de 28 años sano"
-                ]
-            }
+
+# Process-wide instance shared by the routes and the agent tools
+_shared_vectorization_service: Optional[VectorizationService] = None
+_shared_vectorization_lock = threading.Lock()
+
+def get_shared_vectorization_service() -> VectorizationService:
+    """Return the shared VectorizationService, creating it once even under concurrent first calls."""
+    global _shared_vectorization_service
+    if _shared_vectorization_service is None:
+        with _shared_vectorization_lock:
+            if _shared_vectorization_service is None:
+                _shared_vectorization_service = VectorizationService()
+    return _shared_vectorization_service
+
+def is_vectorization_service_ready() -> bool:
+    """Cheap readiness check: the shared clients exist. Performs no I/O."""
+    service = _shared_vectorization_service
+    return (
+        service is not None
+        and service.openai_client is not None
+        and service.chroma_client is not None
+        and None in service.shards
+        and (service.db_service.engine is not None or service.db_service.replica is not None)
+    )
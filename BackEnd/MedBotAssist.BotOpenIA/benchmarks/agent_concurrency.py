@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for MedicalQueryAgent against a fake LLM.
+
+Runs N chats at once on a single event loop, first making the two LLM turns
+of each chat with blocking calls inside the coroutine (how `invoke` used to
+run) and then through `MedicalQueryAgent.query` (`ainvoke` + async tools).
+Every fake LLM turn takes --latency seconds, and each chat makes two turns
+(one turn requesting --tool-calls parallel tool calls + final answer).
+
+Usage:
+    python benchmarks/agent_concurrency.py --requests 20 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the benchmark offline: local replica instead of SQL Server, throwaway ChromaDB
+_workdir = tempfile.mkdtemp(prefix="medbot_bench_")
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+os.environ["PATIENT_REPLICA_STANDALONE"] = "true"
+os.environ["PATIENT_REPLICA_PATH"] = os.path.join(_workdir, "patients.db")
+os.environ["CHROMA_DB_PATH"] = os.path.join(_workdir, "chroma_db")
+os.environ["SESSION_PERSISTENCE"] = "memory"
+os.environ["SEMANTIC_CACHE_ENABLED"] = "false"
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from app.agents.medical_agent import MedicalQueryAgent
+
+class FakeToolCallingLLM(BaseChatModel):
+    """Chat model that requests `tool_calls` parallel tool calls in one turn, then answers, after a fixed delay per turn."""
+
+    latency: float = 0.5
+    tool_calls: int = 2
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-tool-calling"
+
+    def bind_tools(self, tools, **kwargs):
+        # Tool calls are scripted, so the schemas are not needed
+        return self
+
+    def _respond(self, messages) -> ChatResult:
+        if any(isinstance(message, ToolMessage) for message in messages):
+            message = AIMessage(content="Hay 0 pacientes en la base de datos.")
+        else:
+            message = AIMessage(
+                content="",
+                tool_calls=[
+                    {"name": "get_patient_summary", "args": {"include_demographics": i % 2 == 0}, "id": f"call_{i}"}
+                    for i in range(self.tool_calls)
+                ]
+            )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return self._respond(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._respond(messages)
+
+async def run_blocking(agent: MedicalQueryAgent, requests: int) -> float:
+    async def chat(i: int):
+        # Two synchronous LLM turns, as the old blocking executor made, holding the event loop
+        messages = [HumanMessage(content=f"¿Cuántos pacientes hay? #{i}")]
+        call = agent.llm.invoke(messages)
+        results = [ToolMessage(content="0", tool_call_id=tool_call["id"]) for tool_call in call.tool_calls]
+        agent.llm.invoke(messages + [call] + results)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[chat(i) for i in range(requests)])
+    return time.perf_counter() - start
+
+async def run_async(agent: MedicalQueryAgent, requests: int) -> float:
+    start = time.perf_counter()
+    results = await asyncio.gather(*[
+        agent.query(f"¿Cuántos pacientes hay? #{i}", conversation_id=f"bench_{i}")
+        for i in range(requests)
+    ])
+    elapsed = time.perf_counter() - start
+
+    failures = [result for result in results if not result["success"]]
+    if failures:
+        raise RuntimeError(f"{len(failures)} queries failed: {failures[0].get('error')}")
+    return elapsed
+
+def report(label: str, requests: int, elapsed: float):
+    print(f"{label:<10} {requests:>4} chats in {elapsed:7.2f}s  ->  {requests / elapsed:7.2f} chats/s")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20, help="Concurrent chats per run")
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per fake LLM turn")
+    parser.add_argument("--tool-calls", type=int, default=2, help="Parallel tool calls requested in the first turn")
+    args = parser.parse_args()
+
+    agent = MedicalQueryAgent(llm=FakeToolCallingLLM(latency=args.latency, tool_calls=args.tool_calls))
+    agent.agent_executor.verbose = False
+
+    print(f"Fake LLM latency {args.latency}s per turn, 2 turns per chat, {args.tool_calls} tool calls per turn")
+    print(f"Ideal fully concurrent time: {2 * args.latency:.2f}s\n")
+
+    report("invoke", args.requests, await run_blocking(agent, args.requests))
+    report("ainvoke", args.requests, await run_async(agent, args.requests))
+
+if __name__ == "__main__":
+    asyncio.run(main())
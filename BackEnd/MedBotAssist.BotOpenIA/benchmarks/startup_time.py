@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the API worker.
+
+Measures, in fresh interpreters:
+- import: `python -X importtime -c "import main"`, with the slowest modules
+- time to health: from launching uvicorn until GET /health answers 200
+
+Each measurement is the median of --runs runs and is compared against the
+budget in benchmarks/startup_budget.json; the script exits with status 1 when
+a budget is exceeded, so it can run in CI.
+
+Usage:
+    python benchmarks/startup_time.py --runs 3 --top 15
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET = os.path.join(PROJECT_ROOT, "benchmarks", "startup_budget.json")
+
+def offline_env() -> dict:
+    """Local replica instead of SQL Server and a throwaway ChromaDB, as in the other benchmarks."""
+    workdir = tempfile.mkdtemp(prefix="medbot_startup_")
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "sk-fake")
+    env["PATIENT_REPLICA_STANDALONE"] = "true"
+    env["PATIENT_REPLICA_PATH"] = os.path.join(workdir, "patients.db")
+    env["CHROMA_DB_PATH"] = os.path.join(workdir, "chroma_db")
+    env["SESSION_PERSISTENCE"] = "memory"
+    return env
+
+def measure_import(env: dict):
+    """Return (total_ms, [(cumulative_ms, module), ...]) for importing main."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    modules = []
+    total_ms = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        cumulative_ms = int(cumulative) / 1000
+        modules.append((cumulative_ms, name.strip()))
+        if name.strip() == "main":
+            total_ms = cumulative_ms
+    return total_ms, sorted(modules, reverse=True)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def measure_time_to_health(env: dict, timeout: float = 60.0) -> float:
+    """Milliseconds from launching uvicorn until /health answers 200."""
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=PROJECT_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError(f"/health did not respond within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="Runs per measurement (median is reported)")
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules to list")
+    parser.add_argument("--budget", default=DEFAULT_BUDGET, help="Budget JSON file")
+    args = parser.parse_args()
+
+    with open(args.budget) as budget_file:
+        budget = json.load(budget_file)
+
+    env = offline_env()
+    import_runs = [measure_import(env) for _ in range(args.runs)]
+    health_runs = [measure_time_to_health(env) for _ in range(args.runs)]
+
+    results = {
+        "import_main_ms": statistics.median(total for total, _ in import_runs),
+        "time_to_health_ms": statistics.median(health_runs)
+    }
+
+    print("Slowest imports (cumulative, last run):")
+    for cumulative_ms, module in import_runs[-1][1][:args.top]:
+        print(f"  {cumulative_ms:9.1f}ms  {module}")
+    print()
+
+    over_budget = False
+    for name, value in results.items():
+        limit = budget.get(name)
+        status = "ok" if limit is None or value <= limit else "OVER BUDGET"
+        over_budget = over_budget or status != "ok"
+        print(f"{name:<20} {value:9.1f}ms  (budget {limit}ms)  {status}")
+
+    sys.exit(1 if over_budget else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# Production server: gunicorn -c gunicorn.conf.py main:app
+#
+# The app is imported once in the master (preload_app) and forked into WORKERS
+# processes, so code and read-only data are shared copy-on-write. The patient
+# index is memory-mapped from SHARED_INDEX_PATH by every worker; mutable state
+# that must be seen by all workers (sessions, metrics) lives outside process memory.
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "app.core.workers.UvloopWorker"
+preload_app = True
+# Agent runs can take a while; the admission queue already bounds how long requests wait
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Conversations must survive being routed to a different worker
+os.environ.setdefault("SESSION_PERSISTENCE", "sqlite")
+
+# Metrics from every worker are written here and aggregated by /metrics. Set before the
+# app is preloaded, and emptied so counters of a previous run are not added in.
+metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "medbot_prometheus"))
+os.makedirs(metrics_dir, exist_ok=True)
+for name in os.listdir(metrics_dir):
+    os.remove(os.path.join(metrics_dir, name))
+
+def on_starting(server):
+    # Import the heavy libraries before forking so their pages are shared by all workers
+    import app.agents.medical_agent  # noqa: F401
+    import app.services.vectorization_service  # noqa: F401
+    import chromadb  # noqa: F401
+    import openai  # noqa: F401
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Fake OpenAI-compatible server for load tests.
+
+Implements the two endpoints the API uses:
+- POST /v1/chat/completions: when the request offers tools and has no tool
+  results yet, asks for --tool-calls parallel calls to `get_patient_summary`
+  (answered from the local replica); otherwise returns a short answer.
+  Supports `stream=true` (SSE chunks, with usage when requested).
+- POST /v1/embeddings: deterministic unit vectors derived from the input text,
+  as floats or base64 like the real API.
+
+Every call waits --chat-latency / --embedding-latency seconds, and a fraction
+--error-rate of calls fail with 429 and Retry-After, to exercise client retries.
+
+Usage:
+    python loadtest/fake_openai.py --port 8900 --chat-latency 0.8 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+import uuid
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake OpenAI")
+config = {
+    "chat_latency": 0.5,
+    "embedding_latency": 0.05,
+    "error_rate": 0.0,
+    "tool_calls": 1,
+    "dimensions": 1536
+}
+
+ANSWER = "Según la base de datos, hay pacientes registrados que coinciden con la consulta."
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def _rate_limited():
+    if random.random() < config["error_rate"]:
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": "1"},
+            content={"error": {"message": "Rate limit reached (injected)", "type": "requests", "code": "rate_limit_exceeded"}}
+        )
+    return None
+
+def _embedding(text: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(config["dimensions"]).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+def _plan(body: dict) -> dict:
+    """Decide the assistant message: tool calls on the first turn, an answer afterwards."""
+    messages = body.get("messages", [])
+    tool_names = [tool["function"]["name"] for tool in body.get("tools", [])]
+    has_results = any(message.get("role") == "tool" for message in messages)
+
+    if "get_patient_summary" in tool_names and not has_results:
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {"name": "get_patient_summary", "arguments": json.dumps({"include_demographics": i == 0})}
+                }
+                for i in range(config["tool_calls"])
+            ]
+        }
+    return {"role": "assistant", "content": ANSWER}
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    await asyncio.sleep(config["embedding_latency"])
+    if (error := _rate_limited()) is not None:
+        return error
+
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    data = []
+    for index, text in enumerate(inputs):
+        vector = _embedding(str(text))
+        if body.get("encoding_format") == "base64":
+            encoded = base64.b64encode(vector.tobytes()).decode("ascii")
+        else:
+            encoded = vector.tolist()
+        data.append({"object": "embedding", "index": index, "embedding": encoded})
+
+    tokens = sum(_estimate_tokens(str(text)) for text in inputs)
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "text-embedding-3-small"),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+    }
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await asyncio.sleep(config["chat_latency"])
+    if (error := _rate_limited()) is not None:
+        return error
+
+    message = _plan(body)
+    model = body.get("model", "gpt-4")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    finish_reason = "tool_calls" if message.get("tool_calls") else "stop"
+    prompt_tokens = sum(_estimate_tokens(json.dumps(m.get("content") or "")) for m in body.get("messages", []))
+    completion_tokens = _estimate_tokens(json.dumps(message))
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+    if not body.get("stream"):
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": usage
+        }
+
+    def chunk(delta: dict, finish: str = None, chunk_usage: dict = None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [] if chunk_usage else [{"index": 0, "delta": delta, "finish_reason": finish}]
+        }
+        if chunk_usage:
+            payload["usage"] = chunk_usage
+        return f"data: {json.dumps(payload)}\n\n"
+
+    async def stream():
+        yield chunk({"role": "assistant", "content": ""})
+        if message.get("tool_calls"):
+            tool_calls = [{"index": i, **tool_call} for i, tool_call in enumerate(message["tool_calls"])]
+            yield chunk({"tool_calls": tool_calls})
+        else:
+            for word in message["content"].split(" "):
+                yield chunk({"content": word + " "})
+        yield chunk({}, finish_reason)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield chunk({}, chunk_usage=usage)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="Seconds per chat completion")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Seconds per embeddings call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with 429")
+    parser.add_argument("--tool-calls", type=int, default=1, help="Parallel tool calls requested per first turn")
+    parser.add_argument("--dimensions", type=int, default=1536, help="Embedding dimensions")
+    args = parser.parse_args()
+
+    config.update(
+        chat_latency=args.chat_latency,
+        embedding_latency=args.embedding_latency,
+        error_rate=args.error_rate,
+        tool_calls=args.tool_calls,
+        dimensions=args.dimensions
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Offline load test for /agent/chat, /agent/chat/stream and /vectorization/search.
+
+By default the harness is self-contained: it seeds a SQLite replica with
+synthetic patients, starts loadtest/fake_openai.py and the API in standalone
+replica mode pointed at it (OPENAI_BASE_URL), waits for /health/ready, and
+then sends --requests requests per endpoint with --concurrency in flight.
+Pass --target to load an API that is already running instead.
+
+Reports throughput and p50/p95/p99 latency per endpoint (plus time to first
+token for the streaming endpoint) and the status codes received.
+
+Usage:
+    python loadtest/run.py --patients 500 --concurrency 20 --requests 200 --chat-latency 0.5
+    python loadtest/run.py --target http://localhost:8000 --endpoints search
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from loadtest.seed_patients import generate_patients
+from app.services.patient_replica import PatientReplica
+
+CHAT_MESSAGES = [
+    "Dame un resumen de la base de datos de pacientes",
+    "¿Qué pacientes tienen teléfono y correo registrados?",
+    "Resume los datos de contacto disponibles de los pacientes",
+    "Give me an overview of the patients in the database"
+]
+SEARCH_QUERIES = [
+    "pacientes mayores de 60 años",
+    "pacientes con correo electrónico registrado",
+    "patients born in the 1980s",
+    "pacientes jóvenes con teléfono"
+]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+async def wait_until_ready(base_url: str, timeout: float = 180.0):
+    start = time.perf_counter()
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() - start < timeout:
+            try:
+                if (await client.get(f"{base_url}/health/ready")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"{base_url} was not ready after {timeout}s")
+
+def start_stack(args, workdir: str) -> Dict[str, Any]:
+    """Seed the replica and start the fake OpenAI server and the API; returns their processes and URL."""
+    replica_path = os.path.join(workdir, "patients.db")
+    PatientReplica(replica_path).replace_all(generate_patients(args.patients))
+
+    openai_port = free_port()
+    fake_openai = subprocess.Popen([
+        sys.executable, os.path.join(PROJECT_ROOT, "loadtest", "fake_openai.py"),
+        "--port", str(openai_port),
+        "--chat-latency", str(args.chat_latency),
+        "--embedding-latency", str(args.embedding_latency),
+        "--error-rate", str(args.error_rate),
+        "--tool-calls", str(args.tool_calls)
+    ])
+
+    api_port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "sk-loadtest",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "PATIENT_REPLICA_STANDALONE": "true",
+        "PATIENT_REPLICA_PATH": replica_path,
+        "CHROMA_DB_PATH": os.path.join(workdir, "chroma_db"),
+        "SESSION_PERSISTENCE": "memory",
+        "LOG_LEVEL": "WARNING"
+    })
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port), "--log-level", "warning"],
+        cwd=PROJECT_ROOT, env=env
+    )
+    return {"processes": [api, fake_openai], "base_url": f"http://127.0.0.1:{api_port}"}
+
+async def call_chat(client: httpx.AsyncClient, i: int) -> Dict[str, Any]:
+    start = time.perf_counter()
+    response = await client.post("/api/v1/agent/chat", json={
+        "message": f"{CHAT_MESSAGES[i % len(CHAT_MESSAGES)]} (#{i})",
+        "conversation_id": f"load_{i}"
+    })
+    return {"status": response.status_code, "latency": time.perf_counter() - start}
+
+async def call_stream(client: httpx.AsyncClient, i: int) -> Dict[str, Any]:
+    start = time.perf_counter()
+    first_token: Optional[float] = None
+    event = None
+    async with client.stream("POST", "/api/v1/agent/chat/stream", json={
+        # Distinct from the chat messages so the semantic cache does not answer them
+        "message": f"{CHAT_MESSAGES[i % len(CHAT_MESSAGES)]} (stream #{i})",
+        "conversation_id": f"load_stream_{i}"
+    }) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                if event == "token" and first_token is None:
+                    first_token = time.perf_counter() - start
+                if event == "error":
+                    return {"status": "stream_error", "latency": time.perf_counter() - start}
+        status = response.status_code
+    return {"status": status, "latency": time.perf_counter() - start, "first_token": first_token}
+
+async def call_search(client: httpx.AsyncClient, i: int) -> Dict[str, Any]:
+    start = time.perf_counter()
+    response = await client.post("/api/v1/vectorization/search", json={
+        "query": f"{SEARCH_QUERIES[i % len(SEARCH_QUERIES)]} #{i}",
+        "top_k": 5,
+        "similarity_threshold": 0.0
+    })
+    return {"status": response.status_code, "latency": time.perf_counter() - start}
+
+ENDPOINTS = {"chat": call_chat, "stream": call_stream, "search": call_search}
+
+async def run_endpoint(base_url: str, name: str, requests: int, concurrency: int) -> Dict[str, Any]:
+    call = ENDPOINTS[name]
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+    results: List[Dict[str, Any]] = []
+
+    async def worker(client: httpx.AsyncClient):
+        while not queue.empty():
+            i = queue.get_nowait()
+            try:
+                results.append(await call(client, i))
+            except httpx.HTTPError as e:
+                results.append({"status": type(e).__name__, "latency": 0.0})
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    ok = sorted(result["latency"] for result in results if result["status"] == 200)
+    first_tokens = sorted(result["first_token"] for result in results if result.get("first_token") is not None)
+    return {
+        "endpoint": name,
+        "requests": len(results),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+        "statuses": dict(Counter(str(result["status"]) for result in results)),
+        "latency_ms": {f"p{p}": percentile(ok, p) * 1000 for p in (50, 95, 99)},
+        "first_token_ms": {f"p{p}": percentile(first_tokens, p) * 1000 for p in (50, 95, 99)} if first_tokens else None
+    }
+
+def print_report(reports: List[Dict[str, Any]]):
+    print(f"\n{'endpoint':<8} {'reqs':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  statuses")
+    for report in reports:
+        latency = report["latency_ms"]
+        print(
+            f"{report['endpoint']:<8} {report['requests']:>6} {report['throughput_rps']:>8.2f} "
+            f"{latency['p50']:>9.1f} {latency['p95']:>9.1f} {latency['p99']:>9.1f}  {report['statuses']}"
+        )
+        if report["first_token_ms"]:
+            first_token = report["first_token_ms"]
+            print(f"{'  ttft':<8} {'':>6} {'':>8} {first_token['p50']:>9.1f} {first_token['p95']:>9.1f} {first_token['p99']:>9.1f}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", help="Base URL of a running API (skips starting the local stack)")
+    parser.add_argument("--endpoints", default="chat,stream,search", help="Comma-separated: chat, stream, search")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=10, help="Requests in flight")
+    parser.add_argument("--patients", type=int, default=500, help="Synthetic patients in the replica")
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="Fake OpenAI seconds per chat completion")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Fake OpenAI seconds per embeddings call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake OpenAI calls answered with 429")
+    parser.add_argument("--tool-calls", type=int, default=1, help="Parallel tool calls per fake agent turn")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    stack = None
+    base_url = args.target
+    try:
+        if base_url is None:
+            stack = start_stack(args, tempfile.mkdtemp(prefix="medbot_loadtest_"))
+            base_url = stack["base_url"]
+        await wait_until_ready(base_url)
+
+        if "search" in args.endpoints:
+            # The first search embeds every patient; keep that out of the measurements
+            async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+                await call_search(client, -1)
+
+        reports = []
+        for name in args.endpoints.split(","):
+            print(f"Running {args.requests} {name} requests with concurrency {args.concurrency}...")
+            reports.append(await run_endpoint(base_url, name.strip(), args.requests, args.concurrency))
+        print_report(reports)
+
+        if args.json:
+            with open(args.json, "w") as report_file:
+                json.dump(reports, report_file, indent=2)
+
+    finally:
+        if stack:
+            for process in stack["processes"]:
+                process.terminate()
+                process.wait()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Fill a SQLite patient replica with synthetic patients.
+
+The API serves it in standalone mode (PATIENT_REPLICA_STANDALONE=true,
+PATIENT_REPLICA_PATH=<path>) instead of SQL Server. Rows are reproducible
+for a given --seed.
+
+Usage:
+    python loadtest/seed_patients.py --path ./loadtest_patients.db --patients 500
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.patient_replica import PatientReplica
+
+FIRST_NAMES = [
+    "Ana", "Carlos", "María", "José", "Laura", "Juan", "Sofía", "Andrés", "Valentina", "Diego",
+    "Camila", "Luis", "Isabella", "Miguel", "Daniela", "Santiago", "Paula", "Jorge", "Lucía", "Felipe"
+]
+LAST_NAMES = [
+    "García", "Rodríguez", "Martínez", "López", "González", "Pérez", "Sánchez", "Ramírez", "Torres", "Flores",
+    "Rivera", "Gómez", "Díaz", "Cruz", "Morales", "Ortiz", "Gutiérrez", "Castro", "Vargas", "Rojas"
+]
+
+def generate_patients(count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    patients = []
+    for patient_id in range(1, count + 1):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        patients.append({
+            "patient_id": patient_id,
+            "full_name": f"{first_name} {last_name}",
+            "identification_number": str(rng.randint(10_000_000, 1_099_999_999)),
+            "birth_date": date(1940, 1, 1) + timedelta(days=rng.randint(0, 30_000)),
+            # Contact details are missing for some patients, as in the real table
+            "phone": f"3{rng.randint(100_000_000, 199_999_999)}" if rng.random() < 0.85 else None,
+            "email": f"{first_name}.{last_name}.{patient_id}@example.com".lower() if rng.random() < 0.7 else None
+        })
+    return patients
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default="./loadtest_patients.db", help="SQLite replica file")
+    parser.add_argument("--patients", type=int, default=500, help="Number of synthetic patients")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    changed = PatientReplica(args.path).replace_all(generate_patients(args.patients, args.seed))
+    print(f"{'Wrote' if changed else 'Unchanged:'} {args.patients} synthetic patients in {args.path}")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,81 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response
 from app.api.routes import vectorization
 from app.api.routes import agent
 from app.core.config import settings
-import uvicorn
+from app.core.health import health_monitor
+from app.core.metrics import REQUEST_LATENCY, render_metrics
+from app.core.responses import ORJSONResponse
+from app.core.tracing import current_request_id, span, tracer
+from app.services.vectorization_service import get_shared_vectorization_service, is_vectorization_service_ready
+import asyncio
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Set when the startup warm-up has finished, including the index preload
+_warmup_complete = False
+
+def is_warmup_complete() -> bool:
+    """Readiness check: the startup warm-up has finished. Performs no I/O."""
+    return _warmup_complete
+
+async def warm_up():
+    """
+    Build the shared services and the agent and preload the index before the first chat.
+    A failed attempt is reported in the readiness payload and retried; the instance
+    stays not ready until one succeeds.
+    """
+    global _warmup_complete
+    while True:
+        start = time.perf_counter()
+        try:
+            # Single-flight: chats arriving meanwhile wait for this instance instead of building their own
+            await asyncio.to_thread(agent.get_medical_agent)
+            await asyncio.to_thread(get_shared_vectorization_service().preload_index)
+            logger.info(f"Startup warm-up completed in {time.perf_counter() - start:.2f}s")
+            health_monitor.set_readiness_error("warmup", None)
+            _warmup_complete = True
+            return
+        except Exception as e:
+            logger.error(f"Startup warm-up failed, retrying in {settings.STARTUP_WARMUP_RETRY_SECONDS}s: {e}")
+            health_monitor.set_readiness_error("warmup", f"{type(e).__name__}: {e}")
+        await asyncio.sleep(settings.STARTUP_WARMUP_RETRY_SECONDS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Readiness checks are attribute lookups; deep checks run on a background timer
+    health_monitor.register_readiness_check("vectorization_service", is_vectorization_service_ready)
+    health_monitor.register_deep_check("vectorization", vectorization.check_vectorization_deep_health)
+    health_monitor.register_deep_check("agent", agent.check_agent_deep_health)
+    
+    warmup_task = None
+    if settings.STARTUP_WARMUP_ENABLED:
+        # Not ready until the agent is built and the index preloaded, so no traffic is routed to a cold instance
+        health_monitor.register_readiness_check("agent", agent.is_medical_agent_ready)
+        health_monitor.register_readiness_check("warmup", is_warmup_complete)
+        warmup_task = asyncio.create_task(warm_up())
+    
+    refresh_job_manager = None
+    if settings.CHROMA_INDEX_WRITER:
+        # Pick up a refresh job that a stopped process left half done
+        from app.services.refresh_jobs import refresh_job_manager
+        refresh_job_manager.resume_abandoned()
+    
+    await health_monitor.start()
+    yield
+    await health_monitor.stop()
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    if refresh_job_manager is not None:
+        # Interrupted jobs stay unfinished and resume from their checkpoint on the next start
+        await refresh_job_manager.shutdown()
+    tracer.close()
 
 # Create FastAPI instance
 app = FastAPI(
@@ -11,7 +83,9 @@ app = FastAPI(
     description="API para asistente médico con capacidades de vectorización y agentes IA",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -23,6 +97,47 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large bodies; streamed chat events (text/event-stream) are left uncompressed
+app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MINIMUM_SIZE, compresslevel=settings.GZIP_COMPRESS_LEVEL)
+
+def _route_label(request: Request) -> str:
+    """Route template of the request ("/api/v1/agent/conversation/{conversation_id}"), keeping label cardinality bounded."""
+    route = request.scope.get("route")
+    if route is None:
+        return "unmatched"
+    # Routers included with a prefix may report their template without it; the prefix is the static part before the match
+    path = request.scope["path"]
+    for index, char in enumerate(path):
+        if char == "/" and route.path_regex.match(path[index:]):
+            return path[:index] + route.path
+    return route.path
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    # Streaming responses are measured until their headers are sent
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        REQUEST_LATENCY.labels(request.method, _route_label(request), str(status_code)).observe(
+            time.perf_counter() - start
+        )
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    # Every span recorded while handling the request carries its ID
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    current_request_id.set(request_id)
+    with span(f"{request.method} {request.url.path}", "http") as root:
+        response = await call_next(request)
+        if root is not None:
+            root.attributes["status"] = response.status_code
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 # Include routers
 app.include_router(
     vectorization.router,
@@ -53,7 +168,37 @@ async def health_check():
         "version": "1.0.0"
     }
 
+@app.get("/health/live")
+async def liveness_probe():
+    return health_monitor.liveness()
+
+@app.get("/health/ready")
+async def readiness_probe():
+    readiness = health_monitor.readiness()
+    status_code = 200 if readiness["status"] == "ready" else 503
+    return ORJSONResponse(content=readiness, status_code=status_code)
+
+@app.get("/health/deep")
+async def deep_health_check():
+    # Cached result of the background check; probing never touches external services
+    return health_monitor.deep_status()
+
+@app.get("/debug/traces/{request_id}")
+async def get_request_trace(request_id: str):
+    # Chrome trace document for one recent request; open it in chrome://tracing or Perfetto
+    trace = tracer.get_request_trace(request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"No trace recorded for request {request_id}")
+    return trace
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 if __name__ == "__main__":
+    import uvicorn
+    
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
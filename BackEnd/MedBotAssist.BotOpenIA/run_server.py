@@ -1,8 +1,18 @@
 #!/usr/bin/env python3
-import uvicorn
+import argparse
+import os
+import sys
 from app.core.config import settings
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--production", action="store_true", help="Serve with gunicorn and uvloop workers (gunicorn.conf.py)")
+    args = parser.parse_args()
+
+    if args.production:
+        os.execvp(sys.executable, [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"])
+
+    import uvicorn
     uvicorn.run(
         "main:app",
         host="0.0.0.0",